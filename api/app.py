@@ -1,5 +1,7 @@
+from typing import Tuple
+
 from flasgger import Swagger
-from flask import Flask
+from flask import Flask, Response, jsonify
 from flask_cors import CORS  # Import Flask-CORS
 
 from api.routes.database import database_bp
@@ -8,6 +10,10 @@ from api.routes.onboarding import onboarding_bp
 from api.routes.stokvel import stokvel_bp
 from api.routes.users import users_bp
 from api.routes.whatsapp_controller import whatsapp_bp
+from database.migrations import run_migrations
+from whatsapp_utils._utils.api_requests import register_local_app
+from whatsapp_utils._utils.http_client import http_client
+from whatsapp_utils._utils.notification_outbox import notification_outbox
 
 app = Flask(__name__)
 
@@ -31,6 +37,12 @@ app.register_blueprint(whatsapp_bp)
 app.register_blueprint(example_template_bp)
 app.register_blueprint(database_bp)
 
+# Let the WhatsApp bot call the routes above in-process instead of over HTTP
+register_local_app(app)
+
+# Send notifications left in the outbox by a previous run
+notification_outbox.start()
+
 
 @app.route("/")
 def index() -> str:
@@ -44,5 +56,39 @@ def index() -> str:
     return "Stokvel API"
 
 
+@app.route("/http_stats", methods=["GET"])
+def http_stats() -> Tuple[Response, int]:
+    """
+    Outbound HTTP Latency
+    Returns the call and error count and the average and maximum latency of outbound requests since startup.
+    ---
+    responses:
+      200:
+        description: Latency statistics keyed by method and host.
+        schema:
+          type: object
+          example: {"POST localhost:3001": {"calls": 4, "errors": 0, "avg_ms": 85.2, "max_ms": 140.7}}
+    """
+    return jsonify(http_client.latency_stats()), 200
+
+
+@app.route("/notification_stats", methods=["GET"])
+def notification_stats() -> Tuple[Response, int]:
+    """
+    Notification Outbox
+    Returns the number of queued, sent and failed WhatsApp notifications.
+    ---
+    responses:
+      200:
+        description: Notification counts keyed by status.
+        schema:
+          type: object
+          example: {"pending": 2, "sent": 140, "failed": 1}
+    """
+    return jsonify(notification_outbox.status_counts()), 200
+
+
 if __name__ == "__main__":
+    # Deployments apply migrations before starting gunicorn, see api/Dockerfile
+    run_migrations()
     app.run(debug=True)
@@ -1,20 +1,36 @@
+import os
+from typing import Tuple
+
 from flask import Blueprint, Response, jsonify, request
 from sqlalchemy.exc import SQLAlchemyError
 
+from database.azure_function_queries.named_queries import query_registry
 from database.azure_function_queries.queries import (
+    dynamic_batch_write_operation,
     dynamic_read_operation,
     dynamic_write_operation,
+    named_read_operation,
+    payout_plan_operation,
 )
 
 database_bp = Blueprint("database", __name__)
 BASE_ROUTE = "/database"
 
+# "raw" also accepts SQL text on query_db, write_db and write_batch, which existing clients
+# and the engines' per_member modes send. "named" only serves queries registered in the
+# query registry, for deployments whose clients all call queries by name.
+DATABASE_API_SQL_MODE = os.getenv("DATABASE_API_SQL_MODE", "raw")
+RAW_SQL_DISABLED_ERROR = (
+    "Raw SQL is disabled. Call a registered query by name, or set "
+    "DATABASE_API_SQL_MODE=raw to allow it."
+)
+
 
 @database_bp.route(f"{BASE_ROUTE}/query_db", methods=["POST"])
-def query_db() -> Response:
+def query_db() -> Tuple[Response, int]:
     """
     Execute a Read Operation
-    Executes a read operation (SELECT query) on the database using a dynamic query and parameters.
+    Executes a read operation (SELECT query) on the database using a dynamic query and parameters. Only served when DATABASE_API_SQL_MODE is "raw".
     ---
     tags:
       - Database
@@ -49,6 +65,14 @@ def query_db() -> Response:
             error:
               type: string
               example: "Query parameter is required."
+      403:
+        description: Raw SQL is disabled, DATABASE_API_SQL_MODE is not "raw".
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Raw SQL is disabled. Call a registered query by name, or set DATABASE_API_SQL_MODE=raw to allow it."
       500:
         description: Database error occurred.
         schema:
@@ -67,6 +91,9 @@ def query_db() -> Response:
         if not query:
             return jsonify({"error": "Query parameter is required."}), 400
 
+        if DATABASE_API_SQL_MODE != "raw":
+            return jsonify({"error": RAW_SQL_DISABLED_ERROR}), 403
+
         # Perform the query
         data = dynamic_read_operation(query=query, params=parameters)
 
@@ -78,10 +105,10 @@ def query_db() -> Response:
 
 
 @database_bp.route(f"{BASE_ROUTE}/write_db", methods=["POST"])
-def write_db() -> Response:
+def write_db() -> Tuple[Response, int]:
     """
     Execute a Write Operation
-    Executes a write operation (INSERT, UPDATE, DELETE) on the database using a dynamic query and parameters.
+    Executes a write operation (INSERT, UPDATE, DELETE) on the database using a dynamic query and parameters. Only served when DATABASE_API_SQL_MODE is "raw".
     ---
     tags:
       - Database
@@ -99,7 +126,7 @@ def write_db() -> Response:
               example: "INSERT INTO users (name, email) VALUES (:name, :email)"
             parameters:
               type: object
-              description: Parameters to be used with the SQL query.
+              description: Parameters to be used with the SQL query. An array of parameter objects runs the statement once per entry in a single commit.
               example: {"name": "John Doe", "email": "john@example.com"}
     responses:
       200:
@@ -118,6 +145,14 @@ def write_db() -> Response:
             error:
               type: string
               example: "Query parameter is required."
+      403:
+        description: Raw SQL is disabled, DATABASE_API_SQL_MODE is not "raw".
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Raw SQL is disabled. Call a registered query by name, or set DATABASE_API_SQL_MODE=raw to allow it."
       500:
         description: Database error occurred.
         schema:
@@ -136,6 +171,9 @@ def write_db() -> Response:
         if not query:
             return jsonify({"error": "Query parameter is required."}), 400
 
+        if DATABASE_API_SQL_MODE != "raw":
+            return jsonify({"error": RAW_SQL_DISABLED_ERROR}), 403
+
         # Perform the query
         dynamic_write_operation(query=query, params=parameters)
 
@@ -144,3 +182,257 @@ def write_db() -> Response:
         return jsonify({"error": f"Database error: {e}"}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+
+@database_bp.route(f"{BASE_ROUTE}/write_batch", methods=["POST"])
+def write_batch() -> Tuple[Response, int]:
+    """
+    Execute a Batch of Write Operations
+    Executes a list of write operations (INSERT, UPDATE, DELETE) in a single transaction with one commit.
+    ---
+    tags:
+      - Database
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          required:
+            - statements
+          properties:
+            statements:
+              type: array
+              description: Write statements to execute in order. If any statement fails, none of them are committed.
+              items:
+                type: object
+                properties:
+                  name:
+                    type: string
+                    description: Name of a registered write query to execute. Required unless a query is given.
+                    example: "insert_transaction"
+                  query:
+                    type: string
+                    description: SQL INSERT/UPDATE/DELETE query to execute instead of a named query. Only accepted when DATABASE_API_SQL_MODE is "raw".
+                    example: "UPDATE users SET name = :name WHERE id = :id"
+                  parameters:
+                    type: array
+                    description: Parameter objects to be used with the SQL query, the statement runs once per entry. A single parameter object is also accepted.
+                    items:
+                      type: object
+                    example: [{"name": "John Doe", "id": 1}, {"name": "Jane Doe", "id": 2}]
+    responses:
+      200:
+        description: Successfully executed every write operation.
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+              example: "success"
+            rowcounts:
+              type: array
+              description: Rows affected by each statement, in request order.
+              items:
+                type: integer
+              example: [2]
+      400:
+        description: Missing or malformed statements, or invalid parameters for a named query.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Statements parameter is required."
+      403:
+        description: Raw SQL is disabled, DATABASE_API_SQL_MODE is not "raw".
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Raw SQL is disabled. Call a registered query by name, or set DATABASE_API_SQL_MODE=raw to allow it."
+      500:
+        description: Database error occurred.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Database error: ..."
+    """
+    try:
+        # Extract the statements from the request
+        statements = request.json.get("statements")
+
+        # Validate input
+        if not statements or not isinstance(statements, list):
+            return jsonify({"error": "Statements parameter is required."}), 400
+        if any(
+            not isinstance(statement, dict)
+            or not (statement.get("query") or statement.get("name"))
+            for statement in statements
+        ):
+            return jsonify({"error": "Every statement requires a query or name."}), 400
+        if DATABASE_API_SQL_MODE != "raw" and any(
+            statement.get("name") is None for statement in statements
+        ):
+            return jsonify({"error": RAW_SQL_DISABLED_ERROR}), 403
+
+        # Perform the queries in one transaction
+        rowcounts = dynamic_batch_write_operation(statements=statements)
+
+        return jsonify({"message": "success", "rowcounts": rowcounts}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except SQLAlchemyError as e:
+        return jsonify({"error": f"Database error: {e}"}), 500
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+
+@database_bp.route(f"{BASE_ROUTE}/named_query", methods=["POST"])
+def named_query() -> Tuple[Response, int]:
+    """
+    Execute a Named Read Operation
+    Executes a registered read query by name, binding the given parameters.
+    ---
+    tags:
+      - Database
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          required:
+            - name
+          properties:
+            name:
+              type: string
+              description: Name of the registered query to execute.
+              example: "due_contributions"
+            parameters:
+              type: object
+              description: Parameters declared by the named query.
+              example: {"input_date": "2024-10-01"}
+    responses:
+      200:
+        description: Successfully retrieved data from the database.
+        schema:
+          type: array
+          items:
+            type: object
+      400:
+        description: Unknown query name or invalid parameters.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Unknown query 'due_contribution'."
+      500:
+        description: Database error occurred.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Database error: ..."
+    """
+    try:
+        # Extract the query name and parameters from the request
+        name = request.json.get("name")
+        parameters = request.json.get("parameters", {})  # Default to empty dict
+
+        # Validate input
+        if not name:
+            return jsonify({"error": "Name parameter is required."}), 400
+
+        # Perform the query
+        data = named_read_operation(name=name, params=parameters)
+
+        return jsonify(data), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except SQLAlchemyError as e:
+        return jsonify({"error": f"Database error: {e}"}), 500
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+
+@database_bp.route(f"{BASE_ROUTE}/payout_plan", methods=["POST"])
+def payout_plan() -> Tuple[Response, int]:
+    """
+    Plan Payouts
+    Computes the payout amount, deposits plus interest share, of every member of every stokvel due for a payout on a date.
+    ---
+    tags:
+      - Database
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          required:
+            - input_date
+          properties:
+            input_date:
+              type: string
+              description: The payout date in YYYY-MM-DD format.
+              example: "2024-10-01"
+    responses:
+      200:
+        description: One ready-to-pay entry per member.
+        schema:
+          type: array
+          items:
+            type: object
+            example: {"stokvel_id": 1, "user_id": 2, "total_deposits": 300, "interest": 4.5, "amount": 304.5}
+      400:
+        description: Missing required input_date parameter.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Input date parameter is required."
+      500:
+        description: Database error occurred.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Database error: ..."
+    """
+    try:
+        input_date = request.json.get("input_date")
+
+        # Validate input
+        if not input_date:
+            return jsonify({"error": "Input date parameter is required."}), 400
+
+        plan = payout_plan_operation(input_date=input_date)
+
+        return jsonify(plan), 200
+    except SQLAlchemyError as e:
+        return jsonify({"error": f"Database error: {e}"}), 500
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+
+@database_bp.route(f"{BASE_ROUTE}/query_stats", methods=["GET"])
+def query_stats() -> Tuple[Response, int]:
+    """
+    Named Query Latency
+    Returns the call count and average and maximum latency of every named query executed since startup.
+    ---
+    tags:
+      - Database
+    responses:
+      200:
+        description: Latency statistics keyed by query name.
+        schema:
+          type: object
+          example: {"due_contributions": {"calls": 3, "avg_ms": 1.42, "max_ms": 2.03}}
+    """
+    return jsonify(query_registry.latency_stats()), 200
@@ -1,13 +1,12 @@
 from flask import Blueprint, Response, redirect, render_template, request, url_for
 from sqlalchemy import text
 
-from database.sqlite_connection import SQLiteConnection
+from database.sqlite_connection import sqlite_conn
 
 example_template_bp = Blueprint("example_template", __name__)
 
 
 BASE_ROUTE = "/example_template"
-db_conn = SQLiteConnection(database="./database/test_db.db")
 
 
 @example_template_bp.route(BASE_ROUTE)
@@ -28,7 +27,7 @@ def submit() -> Response:
     email = request.form["email"]
     message = request.form["message"]
 
-    with db_conn.connect() as conn:
+    with sqlite_conn.connect() as conn:
         # query = f"INSERT INTO comments (name, email, comment) VALUES ('{name}', '{email}', '{message}');"
         query = "INSERT INTO comments (name, email, comment) VALUES (:name, :email, :message);"
         conn.execute(
@@ -1,7 +1,8 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-import requests
 from dotenv import load_dotenv
 from flask import (
     Blueprint,
@@ -22,7 +23,9 @@ from database.contribution_payout_queries import (
     update_stokvel_token_uri,
     update_user_contribution_token_uri,
 )
+from database.interest_allocation import total_interest
 from database.state_manager.queries import pop_previous_state
+from database.state_manager.session import session_cache
 from database.stokvel_queries.queries import (
     calculate_number_periods,
     check_application_pending_approved,
@@ -31,36 +34,42 @@ from database.stokvel_queries.queries import (
     get_admin_by_stokvel,
     get_all_applications,
     get_all_stokvels,
-    get_deposits_per_stokvel,
     get_iso_with_default_time,
-    get_nr_of_active_users_per_stokvel,
-    get_stokvel_constitution,
+    get_pending_applications,
     get_stokvel_details,
     get_stokvel_id_by_name,
     get_stokvel_member_details,
+    get_stokvel_member_summary,
+    get_stokvel_monthly_interest,
     get_user_deposits_and_payouts_per_stokvel,
     insert_admin,
     insert_stokvel,
     insert_stokvel_join_application,
     insert_stokvel_member,
+    insert_stokvel_members,
     insert_transaction,
+    revert_stokvel_member_admissions,
     update_adhoc_contribution_parms,
     update_application_status,
+    update_applications_status,
     update_max_nr_of_contributors,
     update_member_grantaccepted,
     update_stokvel_grantaccepted,
-    update_stokvel_members_count,
+    update_stokvel_member_grants,
     update_stokvel_name,
     update_user_active_status,
 )
+from database.user_queries.linked_stokvels_cache import linked_stokvels_cache
 from database.user_queries.queries import (
     find_number_by_userid,
     find_user_by_number,
     find_wallet_by_userid,
-    get_linked_stokvels,
-    get_stokvel_monthly_interest,
 )
-from whatsapp_utils._utils.twilio_messenger import send_notification_message
+from whatsapp_utils._utils.http_client import http_client
+from whatsapp_utils._utils.twilio_messenger import (
+    send_notification_message,
+    send_notification_messages,
+)
 
 stokvel_bp = Blueprint("stokvel", __name__)
 
@@ -77,6 +86,9 @@ NODE_SERVER_CREATE_INITIAL_PAYMENT = (
 
 NODE_SERVER_ADHOC_PAYMENT = f"{os.getenv('NODE_SERVER')}/payments/adhoc-payment"
 
+# Grant requests sent to the node server at once when approving applications in bulk
+BULK_GRANT_WORKERS = int(os.getenv("BULK_GRANT_WORKERS", "8"))
+
 load_dotenv()
 
 
@@ -156,26 +168,22 @@ def get_user_total_deposit():
     )  # Get the stokvel name from query parameters
 
     try:
-        # Fetch total deposits for the user and stokvel
-        result = get_user_deposits_and_payouts_per_stokvel(
-            phone_number=phone_number, stokvel_name=stokvel_name
-        )
-
-        deposit_details = result["total_deposits"]
-        total_deposit_details = result["total_payouts"]
-        active_users_count = get_nr_of_active_users_per_stokvel(stokvel_name)
+        # Fetch the user's totals and the active members of the stokvel in one read
+        summary = get_stokvel_member_summary(phone_number, stokvel_name)
 
         # Return an error if no data is found
-        if "error" in active_users_count:
-            raise ValueError(active_users_count["error"])
+        if summary is None:
+            raise ValueError(
+                f"No data found for the given stokvel name: {stokvel_name}"
+            )
 
         # Prepare the notification message
         notification_message = (
             f"📊 Stokvel Summary\n\n"
-            f"Stokvel Name: {active_users_count['stokvel_name']}\n"
-            f"Total Deposits in Stokvel: R{deposit_details:.2f}\n"
-            f"Your Total Payouts in Stokvel: R{total_deposit_details:.2f}\n"
-            f"Number of Active Users in Stokvel: {active_users_count['nr_of_active_users']}\n\n"
+            f"Stokvel Name: {summary['stokvel_name']}\n"
+            f"Total Deposits in Stokvel: R{summary['total_deposits']:.2f}\n"
+            f"Your Total Payouts in Stokvel: R{summary['total_payouts']:.2f}\n"
+            f"Number of Active Users in Stokvel: {summary['nr_of_active_users']}\n\n"
             "Thank you for being a part of our community!\n"
         )
 
@@ -184,9 +192,7 @@ def get_user_total_deposit():
 
     except Exception as e:
         msg = "There was an error performing that action, please try the action again."
-        print(f"Error in {get_user_deposits_and_payouts_per_stokvel.__name__}: {e}")
-        print(f"Error in {get_nr_of_active_users_per_stokvel.__name__}: {e}")
-        print(f"Error in {get_deposits_per_stokvel.__name__}: {e}")
+        print(f"Error in {get_stokvel_member_summary.__name__}: {e}")
         return jsonify({"error": msg}), 500  # Return internal server error
 
 
@@ -248,11 +254,13 @@ def get_stokvels_constitution_handler():
     )  # Get the stokvel name from query parameters
 
     try:
-        # Fetch total deposits for the user and stokvel
-        stokvel_constitution = get_stokvel_constitution(phone_number, stokvel_name)
+        # Fetch the constitution from the user's summary of the stokvel
+        stokvel_constitution = get_stokvel_member_summary(phone_number, stokvel_name)
 
-        if "error" in stokvel_constitution:
-            raise ValueError(stokvel_constitution["error"])
+        if stokvel_constitution is None:
+            raise ValueError(
+                f"No data found for the given stokvel name: {stokvel_name} and phone number: {phone_number}."
+            )
 
         # Prepare the notification message
         notification_message = (
@@ -269,7 +277,7 @@ def get_stokvels_constitution_handler():
 
     except Exception as e:
         msg = "There was an error performing that action, please try the action again."
-        print(f"Error in {get_stokvel_constitution.__name__}: {e}")
+        print(f"Error in {get_stokvel_member_summary.__name__}: {e}")
         return msg  # Return internal server error
 
 
@@ -403,50 +411,8 @@ def my_stokvels_dynamic_state():
     """
     user_number = request.json.get("user_number")
 
-    # Retrieve the linked stokvels and admin status
-    linked_accounts = get_linked_stokvels(user_number)
-
-    # Initialize variables for the dynamic state
-    valid_actions = []
-    state_selection = {}
-    current_stokvels = []
-
-    # Loop through linked accounts and dynamically build the state
-    for i, (stokvel_name, admin_ind) in enumerate(linked_accounts, 1):
-        valid_actions.append(str(i))  # Action is the index as a string
-        current_stokvels.append(stokvel_name)
-
-        # Depending on admin status, select the appropriate next state
-        if admin_ind == 1:
-            state_selection[str(i)] = "stokvel_actions_admin"
-        else:
-            state_selection[str(i)] = "stokvel_actions_user"
-
-    # Add the "back_state" as the last action
-    last_action = len(linked_accounts) + 1
-    valid_actions.append(str(last_action))
-    state_selection[str(last_action)] = "back_state"
-
-    # Create the message to display the available stokvels
-    stokvel_names = [
-        f"{i}. {stokvel_name}" for i, (stokvel_name, _) in enumerate(linked_accounts, 1)
-    ]
-    message = (
-        "Please choose one of your stokvels:\n"
-        + "\n".join(stokvel_names)
-        + f"\n{last_action}. Back"
-    )
-
-    # Build the final state
-    my_stokvels = {
-        "tag": "my_stokvels",
-        "message": message,
-        "valid_actions": valid_actions,
-        "state_selection": state_selection,
-        "current_stokvels": current_stokvels,
-    }
-
-    return jsonify(my_stokvels)
+    # The menu is rendered from the linked stokvels and admin status once, then cached
+    return jsonify(linked_stokvels_cache.get_menu(user_number))
 
 
 @stokvel_bp.route(f"{BASE_ROUTE}/join_stokvel", methods=["GET"])
@@ -694,7 +660,6 @@ def onboard_stokvel() -> Response:
           type: object
           required:
             - stokvel_name
-            - total_members
             - min_contributing_amount
             - max_number_of_contributors
             - start_date
@@ -709,7 +674,7 @@ def onboard_stokvel() -> Response:
               example: "Community Savings Club"
             total_members:
               type: integer
-              description: The total number of members in the stokvel.
+              description: Ignored, the stokvel's members are counted by the server.
               example: 10
             min_contributing_amount:
               type: number
@@ -717,7 +682,7 @@ def onboard_stokvel() -> Response:
               example: 100.00
             max_number_of_contributors:
               type: integer
-              description: The maximum number of contributors allowed in the stokvel.
+              description: The maximum number of contributors allowed in the stokvel, at least 1 for its creator.
               example: 20
             start_date:
               type: string
@@ -765,7 +730,6 @@ def onboard_stokvel() -> Response:
             stokvel_name=stokvel_data.stokvel_name,  # unique constraint here
             ILP_wallet="$ilp.interledger-test.dev/stokvelmasteraddress",  # MASTER WALLET
             MOMO_wallet="MOMO_TEST",
-            total_members=stokvel_data.total_members,
             min_contributing_amount=stokvel_data.min_contributing_amount,
             max_number_of_contributors=stokvel_data.max_number_of_contributors,  # stokvel_data.max_number_of_contributors,
             total_contributions=0,
@@ -777,6 +741,8 @@ def onboard_stokvel() -> Response:
             updated_at=None,
         )
 
+        if inserted_stokvel_id is None:
+            raise ValueError("The stokvel could not be inserted.")
         stokvel_data.stokvel_id = inserted_stokvel_id
 
         user_id = find_user_by_number(stokvel_data.requesting_number)
@@ -817,7 +783,9 @@ def onboard_stokvel() -> Response:
         }
 
         print("USER PAYLOAD: \n", payload)
-        response = requests.post(NODE_SERVER_INITIATE_GRANT, json=payload, timeout=10)
+        response = http_client.post(
+            NODE_SERVER_INITIATE_GRANT, json=payload, timeout=10
+        )
         response.raise_for_status()
 
         print("USER RESPONSE: \n", response.json())
@@ -863,7 +831,7 @@ def onboard_stokvel() -> Response:
 
         print("SYSTEM AGENT PAYLOAD: \n", payload_payout)
 
-        response_payout_grant = requests.post(
+        response_payout_grant = http_client.post(
             NODE_SERVER_INITIATE_STOKVELPAYOUT_GRANT, json=payload_payout, timeout=10
         )
         response_payout_grant.raise_for_status()
@@ -906,8 +874,8 @@ def onboard_stokvel() -> Response:
             stokvel_initial_payment_needed=1,
         )
 
-        # update the number of contributors
-        update_stokvel_members_count(stokvel_id=inserted_stokvel_id)
+        # The creator's admission claimed the first seat, so the stokvel has one member
+        stokvel_data.total_members = 1
 
         # add admin - get whatsapp number
         insert_admin(
@@ -917,17 +885,19 @@ def onboard_stokvel() -> Response:
             total_contributions=0,
             total_members=1,
         )
+        # The creator's cached session still holds the non-admin status
+        session_cache.invalidate(from_number=stokvel_data.requesting_number)
 
         # generate contribution dates
         insert_member_contribution_parameters(
-            stokvel_id=stokvel_data.stokvel_id,
+            stokvel_id=inserted_stokvel_id,
             start_date=stokvel_data.start_date,
             payout_period=stokvel_data.contribution_period,
         )
 
         # generate payouts
         insert_stokvel_payouts_parameters(
-            stokvel_id=stokvel_data.stokvel_id,
+            stokvel_id=inserted_stokvel_id,
             start_date=stokvel_data.start_date,
             payout_period=stokvel_data.payout_frequency_duration,
         )
@@ -1119,6 +1089,117 @@ def approve_stokvels() -> Response:
         return redirect(url_for("stokvel.failed_approval_login"))
 
 
+def build_member_grant_payloads(
+    stokvel_dict: Dict, stokvel_id, user_id, user_contribution, wallet
+) -> Tuple[Dict, Dict]:
+    """
+    Builds the payloads of a new member's contribution grant and of the stokvel's payout
+    grant to the member.
+
+    Returns:
+        Tuple[Dict, Dict]: The contribution grant payload and the payout grant payload.
+    """
+    # Calculate number of payout periods and contribution periods between start and end dates
+    number_payout_periods_between_start_end_date = calculate_number_periods(
+        stokvel_dict.get("payout_frequency_duration"),
+        start_date=stokvel_dict.get("start_date"),
+        end_date=stokvel_dict.get("end_date"),
+    )
+    number_contribution_periods_between_start_end_date = calculate_number_periods(
+        stokvel_dict.get("contribution_period"),
+        start_date=stokvel_dict.get("start_date"),
+        end_date=stokvel_dict.get("end_date"),
+    )
+    contribution_period_string = format_contribution_period_string(
+        stokvel_dict["contribution_period"]
+    )
+
+    payload = {
+        "value": str(int(1)),
+        "user_contribution": str((int(user_contribution) + 2) * 100),
+        "stokvel_contributions_start_date": get_iso_with_default_time(
+            stokvel_dict["start_date"]
+        ),
+        "walletAddressURL": "$ilp.interledger-test.dev/stokvelmasteraddress",
+        "sender_walletAddressURL": wallet,
+        "payment_periods": number_contribution_periods_between_start_end_date,  # How many contributions to make
+        "payment_period_length": contribution_period_string,
+        "number_of_periods": "T30" if contribution_period_string == "S" else "1",
+        "user_id": user_id,
+        "stokvel_id": stokvel_id,
+    }
+
+    payment_period_duration_converted, number_periods = (
+        double_number_periods_for_same_daterange(
+            period=stokvel_dict.get("payout_frequency_duration")
+        )
+    )
+
+    payload_payout = {
+        "value": str(int(1)),  # Create an initial payment of 1c
+        "stokvel_contributions_start_date": get_iso_with_default_time(
+            stokvel_dict["start_date"]
+        ),
+        "walletAddressURL": wallet,
+        "sender_walletAddressURL": "$ilp.interledger-test.dev/stokvelmasteraddress",
+        "payment_periods": number_payout_periods_between_start_end_date
+        * 2,  # Double the number of payout periods
+        "payment_period_length": payment_period_duration_converted,
+        "number_of_periods": str(number_periods),
+        "user_id": user_id,
+        "stokvel_id": stokvel_id,
+    }
+
+    return payload, payload_payout
+
+
+def request_member_grants(
+    stokvel_dict: Dict, stokvel_id, user_id, user_contribution, wallet
+) -> Dict:
+    """
+    Requests a new member's contribution grant and the stokvel's payout grant to the
+    member from the node server.
+
+    Returns:
+        Dict: The user_token, user_url and user_quote_id of the contribution grant, the
+            stokvel_token, stokvel_url and stokvel_quote_id of the payout grant, and the
+            user_auth_link and agent_auth_link that authorize them.
+
+    Raises:
+        requests.exceptions.RequestException: If a grant request fails.
+    """
+    payload, payload_payout = build_member_grant_payloads(
+        stokvel_dict, stokvel_id, user_id, user_contribution, wallet
+    )
+
+    print("USER PAYLOAD: \n", payload)
+    response = http_client.post(NODE_SERVER_INITIATE_GRANT, json=payload, timeout=10)
+    response.raise_for_status()
+    grant = response.json()
+    print("USER RESPONSE: \n", grant)
+
+    print("SYSTEM AGENT PAYLOAD: \n", payload_payout)
+    response_payout_grant = http_client.post(
+        NODE_SERVER_INITIATE_STOKVELPAYOUT_GRANT,
+        json=payload_payout,
+        timeout=10,
+    )
+    response_payout_grant.raise_for_status()
+    payout_grant = response_payout_grant.json()
+    print("SYSTEM AGENT RESPONSE: \n", payout_grant)
+
+    return {
+        "user_token": grant["continue_token"]["value"],
+        "user_url": grant["continue_uri"],
+        "user_quote_id": grant["quote_id"],
+        "stokvel_token": payout_grant["continue_token"]["value"],
+        "stokvel_url": payout_grant["continue_uri"],
+        "stokvel_quote_id": payout_grant["quote_id"],
+        "user_auth_link": grant["recurring_grant"]["interact"]["redirect"],
+        "agent_auth_link": payout_grant["recurring_grant"]["interact"]["redirect"],
+    }
+
+
 @stokvel_bp.route(f"{BASE_ROUTE}/approvals/process_applications", methods=["POST"])
 def process_application():
     """
@@ -1204,193 +1285,77 @@ def process_application():
     try:
 
         if action == "approve":
-            update_application_status(application_id, "Approved")  # uncommented this
             stokvel_dict = get_stokvel_details(stokvel_id=application_stokvel_id)
 
-            # Calculate number of payout periods and contribution periods between start and end dates
-            number_payout_periods_between_start_end_date = calculate_number_periods(
-                stokvel_dict.get("payout_frequency_duration"),
-                start_date=stokvel_dict.get("start_date"),
-                end_date=stokvel_dict.get("end_date"),
-            )
-
-            number_contribution_periods_between_start_end_date = (
-                calculate_number_periods(
-                    stokvel_dict.get("contribution_period"),
-                    start_date=stokvel_dict.get("start_date"),
-                    end_date=stokvel_dict.get("end_date"),
-                )
-            )
-
-            # Prepare the payload for user contribution grant
-            payload = {
-                "value": str(int(1)),
-                "user_contribution": str((int(user_contribution) + 2) * 100),
-                "stokvel_contributions_start_date": get_iso_with_default_time(
-                    stokvel_dict.get("start_date")
-                ),
-                "walletAddressURL": "$ilp.interledger-test.dev/stokvelmasteraddress",
-                "sender_walletAddressURL": find_wallet_by_userid(
-                    user_id=application_joiner_id
-                ),
-                "payment_periods": number_contribution_periods_between_start_end_date,  # How many contributions to make
-                "payment_period_length": format_contribution_period_string(
-                    stokvel_dict.get("contribution_period")
-                ),
-                "number_of_periods": (
-                    "T30"
-                    if format_contribution_period_string(
-                        stokvel_dict.get("contribution_period")
-                    )
-                    == "S"
-                    else "1"
-                ),
-                "user_id": application_joiner_id,
-                "stokvel_id": application_stokvel_id,
-            }
-
-            print("USER PAYLOAD: \n", payload)
-
-            # Send POST request for contribution grant
-            response = requests.post(
-                NODE_SERVER_INITIATE_GRANT, json=payload, timeout=10
-            )
-
-            print("USER RESPONSE: \n", response.json())
-            print(
-                "REDIRECT USER FOR AUTH: ",
-                response.json()["recurring_grant"]["interact"]["redirect"],
-            )
-
-            auth_link = response.json()["recurring_grant"]["interact"]["redirect"]
-            notification_message = (
-                f"Please Authorize the recurring grant using this link: {auth_link}"
-            )
-
-            send_notification_message(
-                to=f"whatsapp:{applicant_cell_number}",
-                body=notification_message,
-            )
-
-            # Extract initial continue URI and token for contributions
-            initial_continue_uri_contribution = response.json()["continue_uri"]
-            initial_continue_token_contribution = response.json()["continue_token"][
-                "value"
-            ]
-            initial_payment_quote_contribution = response.json()["quote_id"]
-
-            payment_period_duration_converted, number_periods = (
-                double_number_periods_for_same_daterange(
-                    period=stokvel_dict.get("payout_frequency_duration")
-                )
-            )
-
-            # Prepare the payload for payout grant
-            payload_payout = {
-                "value": str(int(1)),  # Create an initial payment of 1c
-                "stokvel_contributions_start_date": get_iso_with_default_time(
-                    stokvel_dict.get("start_date")
-                ),
-                "walletAddressURL": find_wallet_by_userid(
-                    user_id=application_joiner_id
-                ),
-                "sender_walletAddressURL": "$ilp.interledger-test.dev/stokvelmasteraddress",
-                "payment_periods": number_payout_periods_between_start_end_date
-                * 2,  # Double the number of payout periods
-                "payment_period_length": payment_period_duration_converted,
-                "number_of_periods": str(number_periods),
-                "user_id": application_joiner_id,
-                "stokvel_id": application_stokvel_id,
-            }
-
-            print("SYSTEM AGENT PAYLOAD: \n", payload_payout)
-
-            # Send POST request for payout grant
-            response_payout_grant = requests.post(
-                NODE_SERVER_INITIATE_STOKVELPAYOUT_GRANT,
-                json=payload_payout,
-                timeout=10,
-            )
-            response_payout_grant.raise_for_status()
-            print("SYSTEM AGENT PAYLOAD: \n", response_payout_grant)
-
-            # Extract initial continue URI and token for payouts
-            initial_continue_uri_stokvel = response_payout_grant.json()["continue_uri"]
-            initial_continue_token_stokvel = response_payout_grant.json()[
-                "continue_token"
-            ]["value"]
-            initial_quote_stokvel = response_payout_grant.json()["quote_id"]
-
-            print(
-                "\n \n \nREDIRECT STOKVEL AGENT FOR AUTH: ",
-                response_payout_grant.json()["recurring_grant"]["interact"]["redirect"],
-            )
-
-            auth_link = response.json()["recurring_grant"]["interact"]["redirect"]
-            agent_auth_link = response_payout_grant.json()["recurring_grant"][
-                "interact"
-            ]["redirect"]
-            notification_message = f"SYSTEM REQUEST: Please Authorize the recurring grant using this link: {agent_auth_link}"
-
-            send_notification_message(
-                to=f"whatsapp:{os.getenv('SYSTEM_AGENT_NUMBER')}",  # Need to change
-                body=notification_message,
+            grants = request_member_grants(
+                stokvel_dict,
+                application_stokvel_id,
+                application_joiner_id,
+                user_contribution,
+                find_wallet_by_userid(user_id=application_joiner_id),
             )
 
+            # Admits the member and declines the remaining applications once the stokvel is full
             declined_applications_list = insert_stokvel_member(
                 application_id=application_id,
                 stokvel_id=application_stokvel_id,
                 user_id=application_joiner_id,
                 user_contribution=user_contribution,
-                user_token=initial_continue_token_contribution,
-                user_url=initial_continue_uri_contribution,
-                user_quote_id=initial_payment_quote_contribution,
-                stokvel_quote_id=initial_quote_stokvel,
-                stokvel_token=initial_continue_token_stokvel,
-                stokvel_url=initial_continue_uri_stokvel,
+                user_token=grants["user_token"],
+                user_url=grants["user_url"],
+                user_quote_id=grants["user_quote_id"],
+                stokvel_quote_id=grants["stokvel_quote_id"],
+                stokvel_token=grants["stokvel_token"],
+                stokvel_url=grants["stokvel_url"],
                 stokvel_initial_payment_needed=1,
             )
 
-            update_stokvel_members_count(application_stokvel_id)
-
-            if (
-                declined_applications_list is not None
-                and len(declined_applications_list) > 0
-            ):
-                error_message = "The stokvel is full. No new members can be added"
-
-                # Prepare the notification message
-                app_declined_notification_message = (
-                    f"Application to join the stokvel: {stokvel_name}!\n\n"
-                    f"Application declined.\n"
-                    f"Please contact the admin or apply for another stokvel\n"
-                )
+            # Prepare the notification message
+            app_declined_notification_message = (
+                f"Application to join the stokvel: {stokvel_name}!\n\n"
+                f"Application declined.\n"
+                f"Please contact the admin or apply for another stokvel\n"
+            )
+            notifications = [
+                (f"whatsapp:{number}", app_declined_notification_message)
+                for number in declined_applications_list
+            ]
 
-                for number in declined_applications_list:
-                    # Send the notification message
-                    send_notification_message(
-                        to=f"whatsapp:{number}", body=app_declined_notification_message
-                    )
+            if applicant_cell_number in declined_applications_list:
+                send_notification_messages(notifications)
 
                 return redirect(
                     url_for(
                         "stokvel.failed_approval_sv_full",
-                        error_message=error_message,
+                        error_message="The stokvel is full. No new members can be added",
                     )
                 )
 
-            # Prepare the notification message
+            # Prepare the notification messages
             app_accepted_notification_message = (
                 f"Welcome to the stokvel: {stokvel_name}!\n\n"
                 f"Your application approved - please expect contribution authorization request shortly.\n"
             )
-
-            # Send the notification message
-            send_notification_message(
-                to=f"whatsapp:{applicant_cell_number}",
-                body=app_accepted_notification_message,
+            notifications.extend(
+                [
+                    (
+                        f"whatsapp:{applicant_cell_number}",
+                        f"Please Authorize the recurring grant using this link: {grants['user_auth_link']}",
+                    ),
+                    (
+                        f"whatsapp:{os.getenv('SYSTEM_AGENT_NUMBER')}",  # Need to change
+                        f"SYSTEM REQUEST: Please Authorize the recurring grant using this link: {grants['agent_auth_link']}",
+                    ),
+                    (
+                        f"whatsapp:{applicant_cell_number}",
+                        app_accepted_notification_message,
+                    ),
+                ]
             )
 
+            # Send the notification messages
+            send_notification_messages(notifications)
+
             # Redirect to a route that fetches the latest applications with the requesting_number
             return redirect(
                 url_for(
@@ -1441,6 +1406,249 @@ def process_application():
         )
 
 
+@stokvel_bp.route(f"{BASE_ROUTE}/approvals/process_applications_bulk", methods=["POST"])
+def process_applications_bulk():
+    """
+    Process Stokvel Applications in Bulk
+    Approves or declines several stokvel applications of the admin at once. Approved
+    applications are admitted while their stokvel has space, in one transaction per
+    stokvel that also declines the remaining applications once it is full. Grants are
+    then requested for the admitted members concurrently, and members whose grant
+    request fails are returned to the pending applications, together with the
+    applications their stokvel declined, whose applicants are only notified once every
+    grant of the stokvel was requested.
+    ---
+    tags:
+      - Stokvel
+    consumes:
+      - application/x-www-form-urlencoded
+    parameters:
+      - in: formData
+        name: application_ids
+        type: array
+        items:
+          type: string
+        collectionFormat: multi
+        required: true
+        description: The IDs of the stokvel applications.
+        example: ["12345", "12346"]
+      - in: formData
+        name: action
+        type: string
+        required: true
+        description: The action to take ("approve" or "decline").
+        example: "approve"
+      - in: formData
+        name: requesting_number
+        type: string
+        required: true
+        description: The phone number of the admin processing the applications.
+        example: "+27821234567"
+      - in: formData
+        name: admin_id
+        type: string
+        required: true
+        description: The ID of the admin managing the applications.
+        example: "11111"
+    responses:
+      302:
+        description: Redirects to the applications with a summary of any declined applications or failed grant requests, or to a status page if an error occurred.
+    """
+    application_ids = [
+        int(application_id)
+        for application_id in request.form.getlist("application_ids")
+        if application_id.isdigit()
+    ]
+    action = request.form.get("action")
+    requesting_number = request.form.get("requesting_number")
+    admin_id = request.form.get("admin_id")
+
+    declined_notification_message = (
+        "Application to join the stokvel: {stokvel_name}!\n\n"
+        "Application declined.\n"
+        "Please contact the admin or apply for another stokvel\n"
+    )
+    messages = []
+
+    try:
+        applications = get_pending_applications(application_ids, admin_id)
+
+        if action == "decline":
+            update_applications_status(
+                [application["id"] for application in applications], "Declined"
+            )
+            send_notification_messages(
+                [
+                    (
+                        f"whatsapp:{application['user_number']}",
+                        declined_notification_message.format(
+                            stokvel_name=application["stokvel_name"]
+                        ),
+                    )
+                    for application in applications
+                ]
+            )
+
+        elif action == "approve":
+            applications_by_stokvel: Dict[int, List[Dict]] = {}
+            for application in applications:
+                applications_by_stokvel.setdefault(
+                    application["stokvel_id"], []
+                ).append(application)
+
+            # Admit first, so grants are only requested for members that got a seat
+            notifications = []
+            admitted_applications = []
+            declined_by_stokvel: Dict[int, List[Dict]] = {}
+            for stokvel_id, stokvel_applications in applications_by_stokvel.items():
+                admitted_ids, declined = insert_stokvel_members(
+                    stokvel_id,
+                    [
+                        {
+                            "application_id": application["id"],
+                            "user_id": application["user_id"],
+                            "user_contribution": application["user_contribution"],
+                        }
+                        for application in stokvel_applications
+                    ],
+                )
+                admitted_applications.extend(
+                    application
+                    for application in stokvel_applications
+                    if application["id"] in admitted_ids
+                )
+
+                if declined:
+                    declined_by_stokvel[stokvel_id] = declined
+
+            stokvel_details = {
+                stokvel_id: get_stokvel_details(stokvel_id=stokvel_id)
+                for stokvel_id in {
+                    application["stokvel_id"] for application in admitted_applications
+                }
+            }
+
+            def request_application_grants(
+                application: Dict,
+            ) -> Tuple[Optional[Dict], Optional[Exception]]:
+                try:
+                    grants = request_member_grants(
+                        stokvel_details[application["stokvel_id"]],
+                        application["stokvel_id"],
+                        application["user_id"],
+                        application["user_contribution"],
+                        application["ILP_wallet"],
+                    )
+                    return grants, None
+                except Exception as e:
+                    return None, e
+
+            with ThreadPoolExecutor(
+                max_workers=max(min(BULK_GRANT_WORKERS, len(admitted_applications)), 1)
+            ) as executor:
+                grant_results = list(
+                    executor.map(request_application_grants, admitted_applications)
+                )
+
+            granted_by_stokvel: Dict[int, List[Dict]] = {}
+            failed_by_stokvel: Dict[int, List[Dict]] = {}
+            for application, (grants, error) in zip(
+                admitted_applications, grant_results
+            ):
+                member = {
+                    **(grants or {}),
+                    "application_id": application["id"],
+                    "user_id": application["user_id"],
+                }
+                if error is not None:
+                    print(
+                        f"Error requesting grants for application {application['id']}: {error}"
+                    )
+                    failed_by_stokvel.setdefault(application["stokvel_id"], []).append(
+                        member
+                    )
+                    continue
+
+                granted_by_stokvel.setdefault(application["stokvel_id"], []).append(
+                    member
+                )
+                notifications.extend(
+                    [
+                        (
+                            f"whatsapp:{application['user_number']}",
+                            f"Please Authorize the recurring grant using this link: {grants['user_auth_link']}",
+                        ),
+                        (
+                            f"whatsapp:{os.getenv('SYSTEM_AGENT_NUMBER')}",
+                            f"SYSTEM REQUEST: Please Authorize the recurring grant using this link: {grants['agent_auth_link']}",
+                        ),
+                        (
+                            f"whatsapp:{application['user_number']}",
+                            f"Welcome to the stokvel: {application['stokvel_name']}!\n\n"
+                            f"Your application approved - please expect contribution authorization request shortly.\n",
+                        ),
+                    ]
+                )
+
+            for stokvel_id, members in granted_by_stokvel.items():
+                update_stokvel_member_grants(stokvel_id, members)
+            for stokvel_id, members in failed_by_stokvel.items():
+                # The released seats are open again, so the overflow declines are undone
+                revert_stokvel_member_admissions(
+                    stokvel_id,
+                    members,
+                    [
+                        application["application_id"]
+                        for application in declined_by_stokvel.pop(stokvel_id, [])
+                    ],
+                )
+
+            for stokvel_id, declined in declined_by_stokvel.items():
+                stokvel_name = applications_by_stokvel[stokvel_id][0]["stokvel_name"]
+                messages.append(
+                    f"{stokvel_name} is full, {len(declined)} applications were declined."
+                )
+                notifications.extend(
+                    (
+                        f"whatsapp:{application['user_number']}",
+                        declined_notification_message.format(stokvel_name=stokvel_name),
+                    )
+                    for application in declined
+                )
+
+            failed_ids = [
+                str(member["application_id"])
+                for members in failed_by_stokvel.values()
+                for member in members
+            ]
+            if failed_ids:
+                messages.append(
+                    f"Grant requests failed for applications {', '.join(failed_ids)}. "
+                    "They are back among the pending applications, with the "
+                    "applications their stokvels declined for lack of space."
+                )
+
+            send_notification_messages(notifications)
+
+        return redirect(
+            url_for(
+                "stokvel.display_applications",
+                admin_id=admin_id,
+                requesting_number=requesting_number,
+                message=" ".join(messages) or None,
+            )
+        )
+
+    except Exception as e:
+        print(f"General Error occurred during bulk application processing: {e}")
+        return redirect(
+            url_for(
+                "stokvel.failed_approval_sv_full",
+                error_message="An unknown integrity error occurred.",
+            )
+        )
+
+
 @stokvel_bp.route(f"{BASE_ROUTE}/approvals/applications", methods=["GET"])
 def display_applications():
     """
@@ -1462,6 +1670,12 @@ def display_applications():
         required: true
         description: The phone number of the admin requesting the applications.
         example: "+27821234567"
+      - in: query
+        name: message
+        type: string
+        required: false
+        description: The outcome of the last bulk action to show above the applications.
+        example: "Community Savings Club is full, 2 applications were declined."
     responses:
       200:
         description: Successfully displayed the list of applications for approval.
@@ -1479,6 +1693,8 @@ def display_applications():
         "requesting_number"
     )  # Get requesting_number from query parameters
 
+    message = request.args.get("message")
+
     applications = get_all_applications(user_id=admin_id)
 
     response = make_response(
@@ -1487,6 +1703,7 @@ def display_applications():
             requesting_number=requesting_number,
             admin_id=admin_id,
             applications=applications,
+            message=message,
         )
     )
     response.headers["Cache-Control"] = (
@@ -1607,7 +1824,7 @@ def stokvel_total_interest() -> str:
         # get monthly interest values
         interest_dict = get_stokvel_monthly_interest(stokvel_id)
         # get total accumulated interest for the period
-        stkvl_interest = sum(interest_dict.values())
+        stkvl_interest = total_interest(interest_dict.values())
         msg = f"The total interest for this Stokvel is: R{stkvl_interest}"
         return msg
     except Exception as e:
@@ -1793,7 +2010,7 @@ def user_interactive_grant_handle() -> str:
 
         print("USER PAYLOAD: \n", payload)
 
-        response = requests.post(
+        response = http_client.post(
             NODE_SERVER_CREATE_INITIAL_PAYMENT, json=payload, timeout=10
         )
 
@@ -1918,7 +2135,7 @@ def stokvel_interactive_grant_handle() -> str:
 
         print("SYSTEM AGENT PAYLOAD: \n", payload)
 
-        response = requests.post(
+        response = http_client.post(
             NODE_SERVER_CREATE_INITIAL_PAYMENT, json=payload, timeout=10
         )
 
@@ -2046,7 +2263,7 @@ def adhoc_payment_grant_handle() -> str:
 
             print("SYSTEM AGENT PAYLOAD: \n", payload)
 
-            response = requests.post(
+            response = http_client.post(
                 NODE_SERVER_CREATE_INITIAL_PAYMENT, json=payload, timeout=10
             )
             response.raise_for_status()
@@ -2165,7 +2382,7 @@ def leave_current_stokvel():
         }
 
         print("USER PAYLOAD: \n", payload)
-        response = requests.post(NODE_SERVER_ADHOC_PAYMENT, json=payload, timeout=10)
+        response = http_client.post(NODE_SERVER_ADHOC_PAYMENT, json=payload, timeout=10)
         response.raise_for_status()
         print("USER RESPONSE: \n", response.json())
 
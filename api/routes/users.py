@@ -1,21 +1,19 @@
 from flask import Blueprint, Response, redirect, render_template, request, url_for
 from sqlalchemy.exc import SQLAlchemyError
 
-from database.sqlite_connection import SQLiteConnection
 from database.stokvel_queries.queries import (
     get_all_applications,
     get_stokvel_id_by_name,
+    get_user_interest,
 )
 from database.user_queries.queries import (
     find_user_by_number,
     get_account_details,
     get_total_number_of_users,
-    get_user_interest,
     update_user_name,
     update_user_surname,
 )
 
-db_conn = SQLiteConnection(database="./database/test_db.db")
 users_bp = Blueprint("users", __name__)
 
 BASE_ROUTE = "/users"
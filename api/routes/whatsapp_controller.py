@@ -1,10 +1,17 @@
+import os
+
 from flask import Blueprint, request
 
+from whatsapp_utils._utils.message_worker import message_workers
 from whatsapp_utils._utils.state_manager import MessageStateManager
+from whatsapp_utils._utils.twilio_messenger import send_acknowledgement
 
 whatsapp_bp = Blueprint("whatsapp", __name__)
 
 BASE_ROUTE = "/whatsapp"
+# "sync" replies in the webhook response, "async" acknowledges straight away and
+# sends the reply as a notification once a background worker has processed the message
+WHATSAPP_PROCESSING_MODE = os.getenv("WHATSAPP_PROCESSING_MODE", "sync")
 
 
 @whatsapp_bp.route(BASE_ROUTE, methods=["POST"])
@@ -12,6 +19,8 @@ def whatsapp() -> str:
     """
     Handle Incoming WhatsApp Messages
     Processes user requests based on the current state managed through WhatsApp interactions.
+    With WHATSAPP_PROCESSING_MODE=async the message is acknowledged with an empty response and
+    the reply is sent as a notification once it has been processed.
     ---
     tags:
       - WhatsApp
@@ -34,7 +43,7 @@ def whatsapp() -> str:
               example: "+27821234567"
     responses:
       200:
-        description: Successfully processed the user request and returned a response message.
+        description: Successfully processed the user request and returned a response message, or acknowledged it in async mode.
         schema:
           type: string
           example: "Your balance is R500."
@@ -52,6 +61,10 @@ def whatsapp() -> str:
     incoming_msg = request.values.get("Body", "")
     from_number = request.values.get("From", "")
 
+    if WHATSAPP_PROCESSING_MODE == "async":
+        message_workers.submit(from_number=from_number, incoming_msg=incoming_msg)
+        return send_acknowledgement()
+
     state_manager = MessageStateManager(user_number=from_number)
     msg = state_manager.processes_user_request(user_action=incoming_msg)
 
@@ -20,7 +20,7 @@ class RegisterStokvelSchema(BaseModel):
     docstring
     """
 
-    stokvel_id: Optional[str] = Field(None, example="123")
+    stokvel_id: Optional[int] = Field(None, example=123)
     stokvel_name: str = Field(
         ..., example="John's Soccer Stokvel"
     )  # unique constraint here
@@ -28,7 +28,7 @@ class RegisterStokvelSchema(BaseModel):
     MOMO_wallet: Optional[str] = Field(None, example="MOMO10255")
     total_members: Optional[int] = Field(None, example=15)
     min_contributing_amount: float = Field(..., example=100.50)
-    max_number_of_contributors: int = Field(..., example=20)
+    max_number_of_contributors: int = Field(..., gt=0, example=20)
     Total_contributions: Optional[float] = Field(None, example=153800)
     start_date: str = Field(..., example="2024-10-01 00:00:00")
     end_date: str = Field(..., example="2024-10-01 00:00:00")
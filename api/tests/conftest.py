@@ -0,0 +1,71 @@
+import os
+
+import pytest
+from sqlalchemy import text
+
+from database import create_tables
+from database.identity_cache import identity_cache
+from database.migrations import run_migrations
+from database.sqlite_connection import sqlite_conn
+from database.user_queries.linked_stokvels_cache import linked_stokvels_cache
+
+# Tests record WhatsApp messages in the fake Twilio sink instead of sending them
+os.environ.setdefault("TWILIO_SINK", "fake")
+
+
+# Points the shared connection at a new database with the full schema for one test
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    database_path = tmp_path / "test.db"
+    database_path.touch()
+    monkeypatch.setattr(sqlite_conn, "database", str(database_path))
+    monkeypatch.setattr(sqlite_conn, "_engine", None)
+
+    create_tables.create_user_table_sqlite()
+    create_tables.create_resource_table_sqlite()
+    create_tables.create_admin_table_sqlite()
+    create_tables.create_contributions_table_sqlite()
+    create_tables.create_stokvel_members_table_sqlite()
+    create_tables.create_stokvel_table_sqlite()
+    create_tables.create_transaction_table_sqlite()
+    create_tables.create_user_wallet_table_sqlite()
+    create_tables.create_stokvel_wallet_table_sqlite()
+    create_tables.create_applications_table_sqlite()
+    create_tables.create_state_management_table()
+    create_tables.create_payouts_table_sqlite()
+    create_tables.create_interest_table()
+    run_migrations()
+
+    # The caches are per process, so they must not carry identities between databases
+    identity_cache.users.clear()
+    identity_cache.stokvels.clear()
+    linked_stokvels_cache.clear()
+
+    yield sqlite_conn
+
+    sqlite_conn.get_engine().dispose()
+
+
+# Runs a list of SQL statements with their parameters in the test database
+@pytest.fixture
+def execute(database):
+    def run(*statements):
+        with database.connect() as conn:
+            for statement in statements:
+                query, parameters = (
+                    statement if isinstance(statement, tuple) else (statement, {})
+                )
+                conn.execute(text(query), parameters)
+            conn.commit()
+
+    return run
+
+
+# Returns the rows of a query in the test database as tuples
+@pytest.fixture
+def fetch(database):
+    def run(query, parameters=None):
+        with database.connect() as conn:
+            return [tuple(row) for row in conn.execute(text(query), parameters or {})]
+
+    return run
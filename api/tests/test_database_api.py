@@ -0,0 +1,122 @@
+import pytest
+from flask import Flask
+
+from api.routes import database as database_routes
+
+
+# The database API on its own, in the given SQL mode
+@pytest.fixture
+def client(database, monkeypatch):
+    def create(sql_mode="raw"):
+        monkeypatch.setattr(database_routes, "DATABASE_API_SQL_MODE", sql_mode)
+        app = Flask(__name__)
+        app.register_blueprint(database_routes.database_bp)
+        return app.test_client()
+
+    return create
+
+
+def test_raw_sql_is_served_by_default(client, execute):
+    execute("INSERT INTO USERS (user_id, user_number) VALUES (1, '+27820000001')")
+    response = client().post(
+        "/database/query_db",
+        json={
+            "query": "SELECT user_number FROM USERS WHERE user_id = :id",
+            "parameters": {"id": 1},
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.get_json() == [{"user_number": "+27820000001"}]
+
+
+def test_named_mode_only_serves_registered_queries(client):
+    named = client("named")
+    raw_read = {"query": "SELECT * FROM USERS"}
+    raw_write = {"query": "DELETE FROM USERS"}
+
+    assert named.post("/database/query_db", json=raw_read).status_code == 403
+    assert named.post("/database/write_db", json=raw_write).status_code == 403
+    response = named.post(
+        "/database/write_batch",
+        json={
+            "statements": [{"name": "complete_engine_run", "parameters": []}, raw_write]
+        },
+    )
+    assert response.status_code == 403
+
+    response = named.post(
+        "/database/named_query",
+        json={"name": "due_contributions", "parameters": {"input_date": "2024-10-01"}},
+    )
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+
+@pytest.mark.parametrize(
+    "body, error",
+    [
+        ({"name": "drop_everything"}, "Unknown query 'drop_everything'."),
+        (
+            {"name": "insert_transaction", "parameters": {}},
+            "Query 'insert_transaction' is a write query.",
+        ),
+        (
+            {
+                "name": "due_contributions",
+                "parameters": {"input_date": "2024-10-01", "user_id": 1},
+            },
+            "Invalid parameters for query 'due_contributions': missing [], unknown ['user_id'].",
+        ),
+    ],
+)
+def test_named_queries_are_checked_against_the_registry(client, body, error):
+    response = client("named").post("/database/named_query", json=body)
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
+
+
+def test_batches_only_accept_registered_write_queries(client):
+    response = client("named").post(
+        "/database/write_batch",
+        json={
+            "statements": [
+                {
+                    "name": "due_contributions",
+                    "parameters": {"input_date": "2024-10-01"},
+                }
+            ]
+        },
+    )
+
+    assert response.status_code == 400
+    assert response.get_json() == {
+        "error": "Query 'due_contributions' is not a write query."
+    }
+
+
+def test_batch_writes_are_rolled_back_together(client, fetch):
+    insert_user = {
+        "query": "INSERT INTO USERS (user_id, user_number) VALUES (:user_id, :user_number)",
+        "parameters": [
+            {"user_id": 1, "user_number": "+27820000001"},
+            {"user_id": 2, "user_number": "+27820000002"},
+        ],
+    }
+    failing_insert = {
+        "query": "INSERT INTO USERS (user_id, user_number) VALUES (1, '+27820000003')",
+    }
+
+    response = client().post(
+        "/database/write_batch", json={"statements": [insert_user, failing_insert]}
+    )
+    assert response.status_code == 500
+    assert fetch("SELECT COUNT(*) FROM USERS") == [(0,)]
+
+    response = client().post(
+        "/database/write_batch", json={"statements": [insert_user]}
+    )
+    assert response.status_code == 200
+    assert response.get_json() == {"message": "success", "rowcounts": [2]}
+    assert fetch("SELECT COUNT(*) FROM USERS") == [(2,)]
@@ -0,0 +1,178 @@
+import importlib
+from datetime import datetime
+from urllib.parse import urlparse
+
+import pytest
+import requests
+from flask import Flask
+
+from api.routes.database import database_bp
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}: {self.body}")
+
+
+# Records the ILP calls of the engine and fails the ones of the wallets in `failing`
+class FakeIlpServer:
+    def __init__(self):
+        self.failing = set()
+        self.calls = []
+
+    def post(self, payload, headers):
+        self.calls.append(headers["Idempotency-Key"])
+        if payload["sender_wallet_address"] in self.failing:
+            return FakeResponse(500, {"error": "payment failed"})
+        return FakeResponse(200, {"token": "rotated", "manageurl": "manage"})
+
+
+@pytest.fixture
+def ilp_server():
+    return FakeIlpServer()
+
+
+# The contribution engine, talking to the database API in-process and to the fake ILP server
+@pytest.fixture
+def contribution_engine(database, ilp_server, monkeypatch):
+    pytest.importorskip("azure.functions")
+    engine = importlib.import_module("contribution_engine.DailyContributionOperation")
+
+    app = Flask(__name__)
+    app.register_blueprint(database_bp)
+    client = app.test_client()
+
+    def post(url, json=None, headers=None, timeout=None):
+        route = urlparse(url)
+        if route.path.startswith("/database/"):
+            response = client.post(route.path, json=json)
+            return FakeResponse(response.status_code, response.get_json())
+        return ilp_server.post(json, headers)
+
+    monkeypatch.setattr(engine.http_client, "post", post)
+    return engine
+
+
+# Two stokvels due on 2024-10-01, the first with two members and the second with one
+@pytest.fixture
+def due_contributions(execute):
+    execute(
+        "INSERT INTO STOKVELS (stokvel_id, stokvel_name, ILP_wallet, contribution_period) "
+        "VALUES (1, 'Monthly', '$wallet', 'Months'), (2, 'Weekly', '$wallet', 'Week')",
+        "INSERT INTO USERS (user_id, ILP_wallet) "
+        "VALUES (1, '$ilp.rafiki.money/one'), (2, '$ilp.rafiki.money/two'), (3, '$ilp.rafiki.money/three')",
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id, contribution_amount, user_payment_URI, user_payment_token) "
+        "VALUES (1, 1, 100, 'uri', 'token'), (1, 2, 50, 'uri', 'token'), (2, 3, 10, 'uri', 'token')",
+        "INSERT INTO CONTRIBUTIONS (stokvel_id, NextDate) VALUES (1, '2024-10-01'), (2, '2024-10-01')",
+    )
+
+
+def test_failed_members_keep_the_run_open_until_it_is_resumed(
+    contribution_engine, due_contributions, ilp_server, fetch
+):
+    ilp_server.failing = {"$ilp.rafiki.money/two"}
+    with pytest.raises(RuntimeError, match="contribution:2024-10-01"):
+        contribution_engine.run_batch_contributions("2024-10-01", datetime(2024, 10, 1))
+
+    # Only the stokvel whose members all paid moves on
+    assert fetch(
+        "SELECT stokvel_id, NextDate FROM CONTRIBUTIONS ORDER BY stokvel_id"
+    ) == [
+        (1, "2024-10-01"),
+        (2, "2024-10-08"),
+    ]
+    assert fetch("SELECT status FROM ENGINE_RUNS") == [("running",)]
+
+    # The next day's run resumes the open run and only retries the failed member
+    ilp_server.failing = set()
+    ilp_server.calls = []
+    contribution_engine.run_batch_contributions("2024-10-02", datetime(2024, 10, 2))
+
+    assert ilp_server.calls == ["contribution:2024-10-01:1:2"]
+    assert fetch(
+        "SELECT stokvel_id, NextDate FROM CONTRIBUTIONS ORDER BY stokvel_id"
+    ) == [
+        (1, "2024-11-01"),
+        (2, "2024-10-08"),
+    ]
+    assert fetch(
+        "SELECT status, members_completed, members_failed FROM ENGINE_RUNS"
+    ) == [("completed", 3, 0)]
+    assert fetch(
+        "SELECT stokvel_id, user_id, amount FROM TRANSACTIONS ORDER BY stokvel_id, user_id"
+    ) == [(1, 1, 100), (1, 2, 50), (2, 3, 10)]
+
+
+def test_members_left_pending_are_retried_with_the_same_key(
+    contribution_engine, due_contributions, ilp_server, fetch, monkeypatch
+):
+    # The run stops after the ILP calls of the first chunk, before recording them
+    def stop(statements):
+        if statements[0]["name"] == "insert_transaction":
+            raise requests.exceptions.ConnectionError("database API unavailable")
+        return write_db_batch(statements)
+
+    write_db_batch = contribution_engine.write_db_batch
+    monkeypatch.setattr(contribution_engine, "write_db_batch", stop)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        contribution_engine.run_batch_contributions("2024-10-01", datetime(2024, 10, 1))
+
+    assert fetch("SELECT DISTINCT status FROM ENGINE_RUN_MEMBERS") == [("pending",)]
+
+    first_calls = list(ilp_server.calls)
+    ilp_server.calls = []
+    monkeypatch.setattr(contribution_engine, "write_db_batch", write_db_batch)
+    contribution_engine.run_batch_contributions("2024-10-01", datetime(2024, 10, 1))
+
+    assert ilp_server.calls == first_calls
+    assert fetch("SELECT status FROM ENGINE_RUNS") == [("completed",)]
+    assert fetch("SELECT COUNT(*) FROM TRANSACTIONS") == [(3,)]
+
+
+def test_member_that_keeps_failing_is_quarantined(
+    contribution_engine, due_contributions, ilp_server, fetch, monkeypatch
+):
+    monkeypatch.setattr(contribution_engine, "ENGINE_MAX_MEMBER_ATTEMPTS", 3)
+    ilp_server.failing = {"$ilp.rafiki.money/two"}
+
+    # The member is retried by the resumes of the next two days
+    for day in ("2024-10-01", "2024-10-02"):
+        with pytest.raises(RuntimeError, match="contribution:2024-10-01"):
+            contribution_engine.run_batch_contributions(day, datetime(2024, 10, 1))
+        assert fetch(
+            "SELECT status, attempts FROM ENGINE_RUN_MEMBERS WHERE user_id = 2"
+        ) == [("retry", int(day[-1]))]
+
+    # Its third failure is final, so the run closes and the stokvel moves on without it
+    ilp_server.calls = []
+    contribution_engine.run_batch_contributions("2024-10-03", datetime(2024, 10, 3))
+
+    assert ilp_server.calls == ["contribution:2024-10-01:1:2"]
+    assert fetch(
+        "SELECT status, attempts FROM ENGINE_RUN_MEMBERS WHERE user_id = 2"
+    ) == [("failed", 3)]
+    assert fetch(
+        "SELECT run_id, status, members_completed, members_failed FROM ENGINE_RUNS"
+    ) == [("contribution:2024-10-01", "completed", 2, 1)]
+    assert fetch(
+        "SELECT stokvel_id, NextDate FROM CONTRIBUTIONS ORDER BY stokvel_id"
+    ) == [
+        (1, "2024-11-01"),
+        (2, "2024-10-08"),
+    ]
+    assert fetch(
+        "SELECT stokvel_id, user_id FROM TRANSACTIONS ORDER BY stokvel_id, user_id"
+    ) == [(1, 1), (2, 3)]
+
+    # The quarantined member is not retried again
+    ilp_server.calls = []
+    contribution_engine.run_batch_contributions("2024-10-04", datetime(2024, 10, 4))
+    assert ilp_server.calls == []
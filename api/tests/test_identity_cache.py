@@ -0,0 +1,43 @@
+from database.identity_cache import IdentityCache, identity_cache
+from database.stokvel_queries.queries import update_stokvel_name
+
+
+def test_renaming_a_stokvel_invalidates_its_identity(execute):
+    execute(
+        "INSERT INTO STOKVELS (stokvel_id, stokvel_name, ILP_wallet) VALUES (1, 'Savers', '$wallet')"
+    )
+    assert identity_cache.get_stokvel_id("Savers") == 1
+    assert identity_cache.get_stokvel_name(1) == "Savers"
+
+    update_stokvel_name("Savers", "Super Savers", "whatsapp:+27820000001")
+
+    assert identity_cache.get_stokvel_id("Savers") is None
+    assert identity_cache.get_stokvel_id("Super Savers") == 1
+    assert identity_cache.get_stokvel_name(1) == "Super Savers"
+
+
+def test_identities_expire_after_their_ttl(database, execute):
+    # Another process renamed the stokvel, so this process gets no invalidation
+    cache = IdentityCache(max_entries=10, ttl=0)
+    execute(
+        "INSERT INTO STOKVELS (stokvel_id, stokvel_name, ILP_wallet) VALUES (1, 'Savers', '$wallet')"
+    )
+    assert cache.get_stokvel_id("Savers") == 1
+
+    execute("UPDATE STOKVELS SET stokvel_name = 'Super Savers' WHERE stokvel_id = 1")
+    assert cache.get_stokvel_id("Savers") is None
+    assert cache.get_stokvel_name(1) == "Super Savers"
+
+
+def test_least_recently_stored_identities_are_dropped(database, execute):
+    cache = IdentityCache(max_entries=2, ttl=3600)
+    execute(
+        "INSERT INTO USERS (user_id, user_number) "
+        "VALUES (1, '+27820000001'), (2, '+27820000002'), (3, '+27820000003')"
+    )
+    for user_id in (1, 2, 3):
+        assert cache.get_user_number(user_id) == f"+2782000000{user_id}"
+
+    assert cache.users.get_key(1) is None
+    assert cache.users.get_id("+27820000003") == 3
+    assert cache.get_user_id("whatsapp:+27820000001") == 1
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from database.interest_allocation import allocate_balance_weighted_interest
+from database.stokvel_queries.queries import get_user_interest
+
+
+def previous_month(month):
+    return (
+        (datetime.strptime(month[:7], "%Y-%m") - timedelta(days=1))
+        .replace(day=1)
+        .strftime("%Y-%m")
+    )
+
+
+# The interest loop get_user_interest ran for one member before it was vectorised
+def baseline_user_interest(user_deposits, stokvel_deposits, stokvel_interest):
+    user_total_interest = 0.00
+    user_deposit = 0
+    stokvel_deposit = 0
+    for month, interest_value in stokvel_interest.items():
+        deposit_month = previous_month(month)
+        if deposit_month in user_deposits and deposit_month in stokvel_deposits:
+            user_deposit += user_deposits[deposit_month]
+            stokvel_deposit += stokvel_deposits[deposit_month]
+            user_total_interest += (user_deposit / stokvel_deposit) * interest_value
+    return round(user_total_interest, 2)
+
+
+@pytest.fixture
+def savings_period():
+    stokvel_interest = {
+        "2024-02-01": 12.5,
+        "2024-03-01": 7.25,
+        "2024-04-01": 30.0,
+        "2024-05-01": 4.75,
+    }
+    # Member deposits per deposit month, members skip some months
+    member_deposits = {
+        1: {"2024-01": 100.0, "2024-02": 100.0, "2024-03": 100.0, "2024-04": 100.0},
+        2: {"2024-01": 250.0, "2024-03": 50.0},
+        3: {"2024-02": 75.0, "2024-03": 80.0, "2024-04": 20.0},
+    }
+    return stokvel_interest, member_deposits
+
+
+def test_allocate_balance_weighted_interest_matches_baseline(savings_period):
+    stokvel_interest, member_deposits = savings_period
+    deposit_months = [previous_month(month) for month in stokvel_interest]
+    user_ids = sorted(member_deposits)
+
+    deposits = np.array(
+        [
+            [member_deposits[user_id].get(month, 0.0) for month in deposit_months]
+            for user_id in user_ids
+        ]
+    )
+    has_deposit = np.array(
+        [
+            [month in member_deposits[user_id] for month in deposit_months]
+            for user_id in user_ids
+        ]
+    )
+    allocated = allocate_balance_weighted_interest(
+        deposits,
+        has_deposit,
+        stokvel_deposits=deposits.sum(axis=0),
+        interest_values=np.array(list(stokvel_interest.values())),
+    )
+
+    stokvel_deposits = {
+        month: sum(deposits.get(month, 0.0) for deposits in member_deposits.values())
+        for month in deposit_months
+    }
+    for user_id, interest in zip(user_ids, allocated.tolist()):
+        assert interest == baseline_user_interest(
+            member_deposits[user_id], stokvel_deposits, stokvel_interest
+        )
+
+
+def test_get_user_interest_matches_baseline(execute, savings_period):
+    stokvel_interest, member_deposits = savings_period
+    execute(
+        "INSERT INTO STOKVELS (stokvel_id, stokvel_name, ILP_wallet, created_at) "
+        "VALUES (1, 'Savers', '$wallet', '2023-12-01 00:00:00')",
+        (
+            "INSERT INTO INTEREST (stokvel_id, date, interest_value) "
+            "VALUES (1, :date, :interest_value)",
+            [
+                {"date": date, "interest_value": interest_value}
+                for date, interest_value in stokvel_interest.items()
+            ],
+        ),
+        (
+            "INSERT INTO TRANSACTIONS (stokvel_id, user_id, amount, tx_type, tx_date) "
+            "VALUES (1, :user_id, :amount, 'DEPOSIT', :tx_date)",
+            # Each monthly deposit is split over two days of the month
+            [
+                {"user_id": user_id, "amount": amount / 2, "tx_date": f"{month}-{day}"}
+                for user_id, deposits in member_deposits.items()
+                for month, amount in deposits.items()
+                for day in ("03", "17")
+            ],
+        ),
+    )
+
+    stokvel_deposits = {}
+    for deposits in member_deposits.values():
+        for month, amount in deposits.items():
+            stokvel_deposits[month] = stokvel_deposits.get(month, 0.0) + amount
+
+    for user_id, deposits in member_deposits.items():
+        assert get_user_interest(user_id, 1) == baseline_user_interest(
+            deposits, stokvel_deposits, stokvel_interest
+        )
+    assert get_user_interest(4, 1) == 0.0
@@ -0,0 +1,41 @@
+import pytest
+
+from database.user_queries.linked_stokvels_cache import LinkedStokvelsCache
+
+
+# A user who belongs to one stokvel, and is admin of none
+@pytest.fixture
+def member(execute):
+    execute(
+        "INSERT INTO USERS (user_id, user_number) VALUES (1, '+27820000001')",
+        "INSERT INTO STOKVELS (stokvel_id, stokvel_name, ILP_wallet) "
+        "VALUES (1, 'Savers', '$wallet'), (2, 'Builders', '$wallet')",
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id, active_status) VALUES (1, 1, 'active')",
+    )
+    return "whatsapp:+27820000001"
+
+
+def join_builders(execute):
+    execute(
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id, active_status) VALUES (2, 1, 'active')"
+    )
+
+
+def test_menus_are_served_from_memory_until_invalidated(database, member, execute):
+    cache = LinkedStokvelsCache(max_users=10, ttl=3600)
+    assert cache.get_menu(member)["current_stokvels"] == ["Savers"]
+
+    join_builders(execute)
+    assert cache.get_menu(member)["current_stokvels"] == ["Savers"]
+
+    cache.invalidate([member])
+    assert cache.get_menu(member)["current_stokvels"] == ["Savers", "Builders"]
+
+
+def test_expired_menus_are_rendered_again(database, member, execute):
+    # Another process changed the membership, so this process gets no invalidation
+    cache = LinkedStokvelsCache(max_users=10, ttl=0)
+    assert cache.get_menu(member)["current_stokvels"] == ["Savers"]
+
+    join_builders(execute)
+    assert cache.get_menu(member)["current_stokvels"] == ["Savers", "Builders"]
@@ -0,0 +1,144 @@
+import pytest
+
+from database.member_summary import rebuild_stokvel_member_summary
+
+SUMMARY_QUERY = """
+SELECT stokvel_id, user_id, total_deposits, total_payouts, active_members,
+    min_contributing_amount, max_number_of_contributors, stokvel_created_at
+FROM STOKVEL_MEMBER_SUMMARY
+ORDER BY stokvel_id, user_id
+"""
+
+# The summary computed from scratch, as the WhatsApp summary read it before the read model
+FRESH_QUERY = """
+SELECT
+    sm.stokvel_id,
+    sm.user_id,
+    (SELECT COALESCE(SUM(amount), 0) FROM TRANSACTIONS t
+     WHERE t.stokvel_id = sm.stokvel_id AND t.user_id = sm.user_id AND t.tx_type = 'DEPOSIT'),
+    (SELECT COALESCE(SUM(amount), 0) FROM TRANSACTIONS t
+     WHERE t.stokvel_id = sm.stokvel_id AND t.user_id = sm.user_id AND t.tx_type = 'PAYOUT'),
+    (SELECT COUNT(*) FROM STOKVEL_MEMBERS a
+     WHERE a.stokvel_id = sm.stokvel_id AND a.active_status = 'active'),
+    s.min_contributing_amount,
+    s.max_number_of_contributors,
+    s.created_at
+FROM STOKVEL_MEMBERS sm
+JOIN STOKVELS s ON s.stokvel_id = sm.stokvel_id
+ORDER BY sm.stokvel_id, sm.user_id
+"""
+
+INSERT_TRANSACTION = """
+INSERT INTO TRANSACTIONS (id, stokvel_id, user_id, amount, tx_type, tx_date)
+VALUES (:id, :stokvel_id, :user_id, :amount, :tx_type, '2024-01-01')
+"""
+
+
+# Two stokvels, the first with two active members and the second with one
+@pytest.fixture
+def members(execute):
+    execute(
+        "INSERT INTO STOKVELS (stokvel_id, stokvel_name, ILP_wallet, min_contributing_amount, "
+        "max_number_of_contributors, created_at) VALUES "
+        "(1, 'Savers', '$wallet', 100, 5, '2024-01-01'), "
+        "(2, 'Spenders', '$wallet', 50, 3, '2024-02-01')",
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id, active_status) VALUES "
+        "(1, 1, 'active'), (1, 2, 'active'), (2, 1, 'active')",
+    )
+
+
+def test_summary_follows_transactions(members, execute, fetch):
+    execute(
+        (
+            INSERT_TRANSACTION,
+            [
+                {
+                    "id": 1,
+                    "stokvel_id": 1,
+                    "user_id": 1,
+                    "amount": 100,
+                    "tx_type": "DEPOSIT",
+                },
+                {
+                    "id": 2,
+                    "stokvel_id": 1,
+                    "user_id": 1,
+                    "amount": 40,
+                    "tx_type": "PAYOUT",
+                },
+                {
+                    "id": 3,
+                    "stokvel_id": 1,
+                    "user_id": 2,
+                    "amount": 70,
+                    "tx_type": "DEPOSIT",
+                },
+                {
+                    "id": 4,
+                    "stokvel_id": 2,
+                    "user_id": 1,
+                    "amount": 10,
+                    "tx_type": "DEPOSIT",
+                },
+                {"id": 5, "stokvel_id": 1, "user_id": 1, "amount": 5, "tx_type": "FEE"},
+            ],
+        )
+    )
+    assert fetch(SUMMARY_QUERY) == fetch(FRESH_QUERY)
+
+    # Moving a transaction to another member and type moves its amount
+    execute(
+        "UPDATE TRANSACTIONS SET amount = 80, user_id = 2, tx_type = 'PAYOUT' WHERE id = 1",
+        "DELETE FROM TRANSACTIONS WHERE id = 4",
+    )
+    assert fetch(SUMMARY_QUERY) == fetch(FRESH_QUERY)
+
+
+def test_summary_follows_members_and_stokvels(members, execute, fetch):
+    execute(
+        (
+            INSERT_TRANSACTION,
+            {
+                "id": 1,
+                "stokvel_id": 1,
+                "user_id": 3,
+                "amount": 60,
+                "tx_type": "DEPOSIT",
+            },
+        )
+    )
+
+    # A new member starts with the deposits they made before joining
+    execute(
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id, active_status) VALUES (1, 3, 'active')"
+    )
+    assert fetch(SUMMARY_QUERY) == fetch(FRESH_QUERY)
+
+    execute(
+        "UPDATE STOKVEL_MEMBERS SET active_status = 'inactive' WHERE stokvel_id = 1 AND user_id = 2",
+        "DELETE FROM STOKVEL_MEMBERS WHERE stokvel_id = 2 AND user_id = 1",
+        "UPDATE STOKVELS SET min_contributing_amount = 150, max_number_of_contributors = 8 WHERE stokvel_id = 1",
+    )
+    assert fetch(SUMMARY_QUERY) == fetch(FRESH_QUERY)
+    assert [row[4] for row in fetch(SUMMARY_QUERY)] == [2, 2, 2]
+
+
+def test_rebuild_repairs_a_drifted_summary(members, execute, fetch):
+    execute(
+        (
+            INSERT_TRANSACTION,
+            {
+                "id": 1,
+                "stokvel_id": 1,
+                "user_id": 1,
+                "amount": 100,
+                "tx_type": "DEPOSIT",
+            },
+        ),
+        "UPDATE STOKVEL_MEMBER_SUMMARY SET total_deposits = 0, active_members = 9",
+        "INSERT INTO STOKVEL_MEMBER_SUMMARY (stokvel_id, user_id) VALUES (9, 9)",
+    )
+    assert fetch(SUMMARY_QUERY) != fetch(FRESH_QUERY)
+
+    assert rebuild_stokvel_member_summary() == 3
+    assert fetch(SUMMARY_QUERY) == fetch(FRESH_QUERY)
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from database.migrations import MIGRATIONS, run_migrations
+
+# The migration that adds ENGINE_RUN_MEMBERS.idempotency_key, which fails if applied twice
+IDEMPOTENCY_KEY_MIGRATION = 7
+
+
+# Reverts the idempotency key migration so the next run applies it again
+@pytest.fixture
+def pending_migration(execute):
+    execute(
+        "ALTER TABLE ENGINE_RUN_MEMBERS DROP COLUMN idempotency_key",
+        (
+            "DELETE FROM SCHEMA_MIGRATIONS WHERE version = :version",
+            {"version": IDEMPOTENCY_KEY_MIGRATION},
+        ),
+    )
+    return next(
+        migration
+        for migration in MIGRATIONS
+        if migration[0] == IDEMPOTENCY_KEY_MIGRATION
+    )
+
+
+def columns(fetch):
+    return [row[1] for row in fetch("PRAGMA table_info(ENGINE_RUN_MEMBERS)")]
+
+
+def test_applied_migrations_are_skipped(database):
+    assert run_migrations() == []
+
+
+def test_concurrent_runs_apply_a_migration_once(pending_migration, fetch):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        runs = list(executor.map(lambda _: run_migrations(), range(4)))
+
+    assert sorted(version for run in runs for version in run) == [
+        IDEMPOTENCY_KEY_MIGRATION
+    ]
+    assert "idempotency_key" in columns(fetch)
+    assert fetch("SELECT COUNT(*) FROM SCHEMA_MIGRATIONS") == [(len(MIGRATIONS),)]
+
+
+def test_failed_migration_is_rolled_back_and_applied_again(
+    pending_migration, fetch, monkeypatch
+):
+    version, description, statements = pending_migration
+    failing = (version, description, [*statements, "SELECT * FROM MISSING_TABLE"])
+    monkeypatch.setattr("database.migrations.MIGRATIONS", [failing])
+    with pytest.raises(OperationalError):
+        run_migrations()
+
+    assert "idempotency_key" not in columns(fetch)
+
+    monkeypatch.setattr("database.migrations.MIGRATIONS", MIGRATIONS)
+    assert run_migrations() == [IDEMPOTENCY_KEY_MIGRATION]
+    assert "idempotency_key" in columns(fetch)
@@ -0,0 +1,83 @@
+import pytest
+
+from database.migrations import MIGRATIONS
+from database.monthly_ledger import rebuild_monthly_ledger
+
+LEDGER_QUERY = """
+SELECT stokvel_id, user_id, month, tx_type, total_amount, tx_count
+FROM MONTHLY_LEDGER
+ORDER BY stokvel_id, user_id, month, tx_type
+"""
+
+GROUP_BY_QUERY = """
+SELECT stokvel_id, user_id, strftime('%Y-%m', tx_date), tx_type, SUM(amount), COUNT(*)
+FROM TRANSACTIONS
+GROUP BY stokvel_id, user_id, strftime('%Y-%m', tx_date), tx_type
+ORDER BY stokvel_id, user_id, strftime('%Y-%m', tx_date), tx_type
+"""
+
+INSERT_TRANSACTION = """
+INSERT INTO TRANSACTIONS (id, stokvel_id, user_id, amount, tx_type, tx_date)
+VALUES (:id, :stokvel_id, :user_id, :amount, :tx_type, :tx_date)
+"""
+
+# The migration that creates MONTHLY_LEDGER and backfills it
+MONTHLY_LEDGER_MIGRATION = 4
+
+
+@pytest.fixture
+def transactions():
+    rows = [
+        (1, 1, 1, 100, "DEPOSIT", "2024-01-03"),
+        (2, 1, 1, 50, "DEPOSIT", "2024-01-20"),
+        (3, 1, 2, 70, "DEPOSIT", "2024-02-01"),
+        (4, 1, 1, 30, "PAYOUT", "2024-02-01"),
+        (5, 2, 1, 10, "DEPOSIT", "2024-02-28 23:59:59"),
+    ]
+    fields = ("id", "stokvel_id", "user_id", "amount", "tx_type", "tx_date")
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def test_ledger_matches_group_by_as_transactions_change(execute, fetch, transactions):
+    execute((INSERT_TRANSACTION, transactions))
+    assert fetch(LEDGER_QUERY) == fetch(GROUP_BY_QUERY)
+
+    # Moving a transaction to another month, member and type moves its totals
+    execute(
+        "UPDATE TRANSACTIONS SET amount = 80, tx_date = '2024-03-02', user_id = 2 WHERE id = 2",
+        "UPDATE TRANSACTIONS SET tx_type = 'DEPOSIT' WHERE id = 4",
+    )
+    assert fetch(LEDGER_QUERY) == fetch(GROUP_BY_QUERY)
+
+    # Emptied months are removed rather than left at zero
+    execute("DELETE FROM TRANSACTIONS WHERE id IN (1, 5)")
+    assert fetch(LEDGER_QUERY) == fetch(GROUP_BY_QUERY)
+
+
+def test_ledger_migration_backfills_existing_transactions(execute, fetch, transactions):
+    # Transactions written before the ledger existed are only picked up by the backfill
+    execute(
+        "DROP TRIGGER MONTHLY_LEDGER_AFTER_INSERT",
+        (INSERT_TRANSACTION, transactions),
+    )
+    assert fetch(LEDGER_QUERY) == []
+
+    statements = next(
+        statements
+        for version, _, statements in MIGRATIONS
+        if version == MONTHLY_LEDGER_MIGRATION
+    )
+    execute(*statements)
+    assert fetch(LEDGER_QUERY) == fetch(GROUP_BY_QUERY)
+
+
+def test_rebuild_repairs_a_drifted_ledger(execute, fetch, transactions):
+    execute(
+        (INSERT_TRANSACTION, transactions),
+        "UPDATE MONTHLY_LEDGER SET total_amount = 0, tx_count = 9",
+        "INSERT INTO MONTHLY_LEDGER VALUES (9, 9, '2023-12', 'DEPOSIT', 5, 1)",
+    )
+    assert fetch(LEDGER_QUERY) != fetch(GROUP_BY_QUERY)
+
+    assert rebuild_monthly_ledger() == 4
+    assert fetch(LEDGER_QUERY) == fetch(GROUP_BY_QUERY)
@@ -0,0 +1,67 @@
+import pytest
+
+from database.notification_outbox import enqueue_notifications
+from whatsapp_utils._utils.notification_outbox import NotificationOutbox
+from whatsapp_utils._utils.twilio_client import TwilioClient, fake_twilio_sink
+
+
+# An outbox sending through the fake Twilio sink on one thread, with due retries
+@pytest.fixture
+def outbox(database):
+    fake_twilio_sink.clear()
+    yield NotificationOutbox(
+        client=TwilioClient(),
+        batch_size=50,
+        send_workers=1,
+        account_rate=1000,
+        number_interval=0,
+        max_attempts=3,
+        retry_delay=0,
+        poll_interval=1,
+        claim_timeout=300,
+    )
+    fake_twilio_sink.clear()
+
+
+def outbox_rows(fetch):
+    return fetch("SELECT body, status, attempts FROM NOTIFICATION_OUTBOX ORDER BY id")
+
+
+def test_failed_send_holds_back_the_numbers_later_messages(outbox, fetch):
+    enqueue_notifications(
+        [("+27110", "first"), ("+27110", "second"), ("+27220", "other")]
+    )
+    fake_twilio_sink.fail_next()
+
+    assert outbox.drain_once() == 3
+    assert [message["body"] for message in fake_twilio_sink.sent] == ["other"]
+    assert outbox_rows(fetch) == [
+        ("first", "pending", 1),
+        ("second", "pending", 0),
+        ("other", "sent", 1),
+    ]
+
+    assert outbox.drain_once() == 2
+    assert [message["body"] for message in fake_twilio_sink.sent] == [
+        "other",
+        "first",
+        "second",
+    ]
+    assert outbox_rows(fetch) == [
+        ("first", "sent", 2),
+        ("second", "sent", 1),
+        ("other", "sent", 1),
+    ]
+
+
+def test_notification_fails_after_max_attempts(outbox, fetch):
+    enqueue_notifications([("+27110", "first"), ("+27110", "second")])
+    fake_twilio_sink.fail_next(3)
+
+    for _ in range(3):
+        outbox.drain_once()
+
+    # The failed notification no longer holds back the number's next message
+    assert outbox_rows(fetch) == [("first", "failed", 3), ("second", "sent", 1)]
+    assert outbox.status_counts() == {"failed": 1, "sent": 1}
+    assert outbox.drain_once() == 0
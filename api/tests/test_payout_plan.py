@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database.azure_function_queries.queries import payout_plan_operation
+
+PAYOUT_DATE = "2024-06-01"
+
+
+# Two stokvels due on PAYOUT_DATE and one that is not. User 1 of stokvel 1 was paid out
+# before, so only their later deposits and interest count towards this payout
+@pytest.fixture
+def stokvels(execute):
+    execute(
+        "INSERT INTO STOKVELS (stokvel_id, stokvel_name, ILP_wallet) "
+        "VALUES (1, 'Savers', '$wallet'), (2, 'Builders', '$wallet'), (3, 'Later', '$wallet')",
+        "INSERT INTO USERS (user_id, ILP_wallet) VALUES (1, '$one'), (2, '$two'), (3, '$three')",
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id) VALUES (1, 1), (1, 2), (2, 2), (2, 3), (3, 1)",
+        "INSERT INTO PAYOUTS (stokvel_id, NextDate) "
+        "VALUES (1, '2024-06-01'), (2, '2024-06-01 00:00:00'), (3, '2024-07-01')",
+        (
+            "INSERT INTO TRANSACTIONS (stokvel_id, user_id, amount, tx_type, tx_date) "
+            "VALUES (:stokvel_id, :user_id, :amount, :tx_type, :tx_date)",
+            [
+                {"stokvel_id": s, "user_id": u, "amount": a, "tx_type": t, "tx_date": d}
+                for s, u, a, t, d in [
+                    (1, 1, 100, "DEPOSIT", "2024-01-05"),
+                    (1, 2, 300, "DEPOSIT", "2024-01-07"),
+                    (1, 1, 150, "PAYOUT", "2024-02-10"),
+                    (1, 1, 200, "DEPOSIT", "2024-02-15"),
+                    (1, 2, 100, "DEPOSIT", "2024-02-20"),
+                    (1, 1, 50, "DEPOSIT", "2024-03-03"),
+                    (2, 2, 40, "DEPOSIT", "2024-03-09"),
+                    (2, 3, 60, "DEPOSIT", "2024-03-12"),
+                    (2, 3, 60, "DEPOSIT", "2024-04-12"),
+                    (3, 1, 500, "DEPOSIT", "2024-03-01"),
+                ]
+            ],
+        ),
+        (
+            "INSERT INTO INTEREST (stokvel_id, interest_value, date) "
+            "VALUES (:stokvel_id, :interest_value, :date)",
+            [
+                {"stokvel_id": s, "interest_value": v, "date": d}
+                for s, v, d in [
+                    (1, 1.5, "2024-02-01"),
+                    (1, 2.0, "2024-03-01"),
+                    (1, 1.2, "2024-04-01"),
+                    (2, 3.0, "2024-04-01"),
+                    (2, 2.5, "2024-05-01"),
+                    (3, 9.0, "2024-04-01"),
+                ]
+            ],
+        ),
+    )
+
+
+def previous_month(date):
+    return (datetime.strptime(date[:7], "%Y-%m") - timedelta(days=1)).strftime("%Y-%m")
+
+
+# The queries and arithmetic of the payout engine's original per_member loop
+def legacy_member_payout(fetch, stokvel_id, user_id):
+    member = {"stokvel_id": stokvel_id, "user_id": user_id}
+    total_deposits = fetch(
+        """
+        SELECT SUM(amount) AS total_deposits
+        FROM TRANSACTIONS
+        WHERE user_id = :user_id
+        AND stokvel_id = :stokvel_id
+        AND tx_type = 'DEPOSIT'
+        AND tx_date >= COALESCE((
+            SELECT MAX(tx_date)
+            FROM TRANSACTIONS
+            WHERE user_id = :user_id
+                AND stokvel_id = :stokvel_id
+                AND tx_type = 'PAYOUT'
+        ), '1900-01-01')
+        """,
+        member,
+    )[0][0]
+    total_deposits = total_deposits if total_deposits else 0
+
+    stokvel_interest = dict(
+        fetch(
+            """
+            SELECT date, interest_value
+            FROM INTEREST
+            WHERE stokvel_id = :stokvel_id
+            AND date > COALESCE((
+                SELECT MAX(tx_date)
+                FROM TRANSACTIONS
+                WHERE stokvel_id = :stokvel_id and user_id = :user_id
+                AND tx_type = 'PAYOUT'
+            ), '1900-01-01')
+            ORDER BY date ASC
+            """,
+            member,
+        )
+    )
+    start_date = next(iter(stokvel_interest))[:7] if stokvel_interest else "1900-01"
+    monthly_deposits = """
+        SELECT strftime('%Y-%m', tx_date) AS month, SUM(amount) AS total_deposit
+        FROM TRANSACTIONS
+        WHERE stokvel_id = :stokvel_id
+        AND tx_type = 'DEPOSIT'
+        AND tx_date > :previous_month_date
+        {user_filter}
+        GROUP BY strftime('%Y-%m', tx_date)
+    """
+    parameters = {**member, "previous_month_date": previous_month(start_date)}
+    user_monthly_deposits = dict(
+        fetch(monthly_deposits.format(user_filter="AND user_id = :user_id"), parameters)
+    )
+    stokvel_monthly_deposits = dict(
+        fetch(monthly_deposits.format(user_filter=""), parameters)
+    )
+
+    user_total_interest = 0.0
+    for month, interest_value in stokvel_interest.items():
+        previous = previous_month(month)
+        if previous in user_monthly_deposits and previous in stokvel_monthly_deposits:
+            user_deposit = user_monthly_deposits[previous]
+            stokvel_deposit = stokvel_monthly_deposits[previous]
+            user_total_interest += (
+                (user_deposit / stokvel_deposit)
+                * interest_value
+                / 100
+                * stokvel_deposit
+            )
+    return total_deposits + round(user_total_interest, 2)
+
+
+def test_payout_plan_matches_the_per_member_loop(stokvels, fetch):
+    plan = payout_plan_operation(PAYOUT_DATE)
+
+    assert [(entry["stokvel_id"], entry["user_id"]) for entry in plan] == [
+        (1, 1),
+        (1, 2),
+        (2, 2),
+        (2, 3),
+    ]
+    for entry in plan:
+        expected = legacy_member_payout(fetch, entry["stokvel_id"], entry["user_id"])
+        assert entry["amount"] == pytest.approx(expected, abs=0.005)
+    assert any(entry["interest"] for entry in plan)
+
+
+def test_payout_plan_is_empty_when_no_stokvel_is_due(stokvels):
+    assert payout_plan_operation("2024-06-02") == []
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from database.state_manager.session import SessionCache
+
+
+# A session cache of its own, with a flush interval long enough to only flush on demand
+@pytest.fixture
+def session_cache(database):
+    return SessionCache(max_sessions=2, flush_interval=3600)
+
+
+def saved_stack(fetch, user_number):
+    rows = fetch(
+        "SELECT stack_state FROM STATE_MANAGEMENT WHERE user_number = :user_number",
+        {"user_number": user_number},
+    )
+    return json.loads(rows[0][0]) if rows else None
+
+
+def test_session_changes_are_written_behind(session_cache, fetch):
+    session = session_cache.get("whatsapp:+27820000001")
+    session.push_state("menu")
+    assert saved_stack(fetch, "+27820000001") is None
+
+    session_cache.flush_all()
+    assert saved_stack(fetch, "+27820000001") == ["menu"]
+
+    session.push_state("my_stokvels")
+    session_cache.flush_all()
+    assert saved_stack(fetch, "+27820000001") == ["menu", "my_stokvels"]
+
+
+def test_invalidate_saves_and_reloads_the_session(session_cache, execute, fetch):
+    session = session_cache.get("+27820000001")
+    session.push_state("menu")
+    session_cache.invalidate("whatsapp:+27820000001")
+    assert saved_stack(fetch, "+27820000001") == ["menu"]
+
+    # Changes made in the database after the invalidation are read by the next message
+    execute("INSERT INTO USERS (user_id, user_number) VALUES (1, '+27820000001')")
+    reloaded = session_cache.get("+27820000001")
+    assert reloaded is not session
+    assert reloaded.registration_status
+    assert reloaded.stack_state == ["menu"]
+
+
+def test_evicted_sessions_are_saved(session_cache, fetch):
+    for number in ("+27820000001", "+27820000002", "+27820000003"):
+        session_cache.get(number).push_state(f"menu {number}")
+
+    assert saved_stack(fetch, "+27820000001") == ["menu +27820000001"]
+    assert saved_stack(fetch, "+27820000003") is None
+
+
+# Two API worker processes, each with a session cache of its own
+@pytest.fixture
+def other_session_cache(database):
+    return SessionCache(max_sessions=2, flush_interval=3600)
+
+
+def test_sessions_saved_by_another_process_are_read_again(
+    session_cache, other_session_cache
+):
+    session = session_cache.get("+27820000001")
+    session.push_state("menu")
+    session.flush()
+    other_session = other_session_cache.get("+27820000001")
+    assert other_session.stack_state == ["menu"]
+
+    # The next message reaches the other process, which answers and saves it
+    other_session.push_state("my_stokvels")
+    other_session.flush()
+
+    reloaded = session_cache.get("+27820000001")
+    assert reloaded is not session
+    assert reloaded.stack_state == ["menu", "my_stokvels"]
+    assert session_cache.get("+27820000001") is reloaded
+
+
+def test_invalidation_reaches_other_processes(
+    session_cache, other_session_cache, execute
+):
+    session = other_session_cache.get("+27820000001")
+    session.push_state("unregistered_number")
+    session.flush()
+    assert not session.registration_status
+
+    # The user registers through a request handled by the first process
+    execute("INSERT INTO USERS (user_id, user_number) VALUES (1, '+27820000001')")
+    session_cache.invalidate("+27820000001")
+
+    assert other_session_cache.get("+27820000001").registration_status
+
+
+def test_unsaved_changes_are_kept_until_the_reply(session_cache, execute):
+    session = session_cache.get("+27820000001")
+    session.push_state("menu")
+    session.flush()
+    session.push_state("my_stokvels")
+
+    execute("UPDATE STATE_MANAGEMENT SET version = version + 1")
+    assert session_cache.get("+27820000001") is session
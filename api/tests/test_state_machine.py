@@ -0,0 +1,51 @@
+import pytest
+
+from whatsapp_utils._utils.state_config import MESSAGE_STATES
+from whatsapp_utils._utils.state_machine import StateMachine
+
+
+def message_states(**states):
+    return {
+        "base_state": ["Hi"],
+        "unrecognized_state": "Unknown action:\n",
+        **states,
+    }
+
+
+def test_selecting_an_unknown_state_is_rejected():
+    states = message_states(
+        menu={
+            "tag": "menu",
+            "message": "Menu:\n1. Go",
+            "state_selection": {"1": "gone"},
+        }
+    )
+
+    with pytest.raises(ValueError, match="'menu' selects unknown state 'gone'"):
+        StateMachine(states)
+
+
+def test_selections_of_defined_back_and_dynamic_states_are_accepted():
+    states = message_states(
+        menu={
+            "tag": "menu",
+            "message": "Menu:\n1. Next\n2. Mine\n3. Back",
+            "state_selection": {"1": "next", "2": "my_stokvels", "3": "back_state"},
+            "input_request_states": {
+                "4": {"tag": "name", "message": "Enter a name", "valid_type": str}
+            },
+        },
+        next={"tag": "next", "message": "Next:\n1. Back"},
+    )
+
+    machine = StateMachine(states)
+
+    assert machine.get("menu").state_selection["1"] == "next"
+    assert machine.get("menu:input_request_states:4").is_input_request
+    assert machine.get("missing") is None
+
+
+def test_message_states_compile():
+    machine = StateMachine(MESSAGE_STATES)
+
+    assert machine.base_greetings == frozenset(MESSAGE_STATES["base_state"])
@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from database.stokvel_queries.queries import (
+    insert_stokvel,
+    insert_stokvel_member,
+    insert_stokvel_members,
+    revert_stokvel_member_admissions,
+    update_stokvel_member_grants,
+)
+
+
+# A stokvel with space for three members, one of them already admitted, and eight applicants
+@pytest.fixture
+def stokvel(execute):
+    execute(
+        "INSERT INTO STOKVELS (stokvel_id, stokvel_name, ILP_wallet, max_number_of_contributors, total_members) "
+        "VALUES (1, 'Savers', '$wallet', 3, 1)",
+        (
+            "INSERT INTO USERS (user_id, user_number) VALUES (:user_id, :user_number)",
+            [
+                {"user_id": user_id, "user_number": f"+2782000000{user_id}"}
+                for user_id in range(1, 10)
+            ],
+        ),
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id) VALUES (1, 1)",
+        (
+            "INSERT INTO APPLICATIONS (id, stokvel_id, user_id, AppStatus) "
+            "VALUES (:id, 1, :user_id, 'Application Submitted')",
+            [{"id": 10 + user_id, "user_id": user_id} for user_id in range(2, 10)],
+        ),
+    )
+    return 1
+
+
+def admit(user_id):
+    return insert_stokvel_member(
+        application_id=10 + user_id,
+        stokvel_id=1,
+        user_id=user_id,
+        user_contribution=100,
+        user_token=None,
+        user_url=None,
+        user_quote_id=None,
+        stokvel_token=None,
+        stokvel_url=None,
+        stokvel_quote_id=None,
+        stokvel_initial_payment_needed=1,
+    )
+
+
+def seats(fetch):
+    return fetch(
+        "SELECT total_members, (SELECT COUNT(*) FROM STOKVEL_MEMBERS) FROM STOKVELS"
+    )[0]
+
+
+def application_statuses(fetch):
+    return dict(fetch("SELECT user_id, AppStatus FROM APPLICATIONS"))
+
+
+def test_filling_the_last_seat_declines_the_remaining_applications(stokvel, fetch):
+    assert admit(2) == []
+    declined = admit(3)
+
+    assert seats(fetch) == (3, 3)
+    assert sorted(declined) == [f"+2782000000{user_id}" for user_id in range(4, 10)]
+    statuses = application_statuses(fetch)
+    assert statuses[2] == statuses[3] == "Approved"
+    assert {statuses[user_id] for user_id in range(4, 10)} == {"Declined"}
+
+    # A full stokvel admits no one and leaves the counter alone
+    admit(4)
+    assert seats(fetch) == (3, 3)
+
+
+def test_concurrent_admissions_never_overfill(stokvel, fetch):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(admit, range(2, 10)))
+
+    assert seats(fetch) == (3, 3)
+    statuses = application_statuses(fetch)
+    assert sorted(statuses.values()).count("Approved") == 2
+
+
+def test_bulk_admission_claims_seats_and_declines_overflow(stokvel, fetch):
+    members = [
+        {"application_id": 10 + user_id, "user_id": user_id, "user_contribution": 100}
+        for user_id in range(2, 6)
+    ]
+    admitted, declined = insert_stokvel_members(1, members)
+
+    assert admitted == [12, 13]
+    assert declined == [
+        {"application_id": 10 + user_id, "user_number": f"+2782000000{user_id}"}
+        for user_id in range(4, 10)
+    ]
+    assert seats(fetch) == (3, 3)
+
+    # Reverting an admission releases its seat and resubmits its application, and the
+    # applications declined for lack of space
+    revert_stokvel_member_admissions(
+        1, [members[1]], [application["application_id"] for application in declined]
+    )
+    assert seats(fetch) == (2, 2)
+    assert set(application_statuses(fetch).values()) == {
+        "Approved",
+        "Application Submitted",
+    }
+    assert application_statuses(fetch)[2] == "Approved"
+
+
+def test_bulk_admitted_members_wait_for_their_grants(stokvel, fetch):
+    members = [
+        {"application_id": 10 + user_id, "user_id": user_id, "user_contribution": 100}
+        for user_id in (2, 3)
+    ]
+    insert_stokvel_members(1, members)
+
+    def statuses():
+        return dict(fetch("SELECT user_id, active_status FROM STOKVEL_MEMBERS"))
+
+    assert statuses() == {1: None, 2: "pending_grant", 3: "pending_grant"}
+
+    update_stokvel_member_grants(
+        1,
+        [
+            {
+                "user_id": 2,
+                "user_token": "token",
+                "user_url": "uri",
+                "user_quote_id": "quote",
+                "stokvel_token": "token",
+                "stokvel_url": "uri",
+                "stokvel_quote_id": "quote",
+            }
+        ],
+    )
+    assert statuses() == {1: None, 2: None, 3: "pending_grant"}
+    assert fetch(
+        "SELECT user_payment_token FROM STOKVEL_MEMBERS WHERE user_id = 2"
+    ) == [("token",)]
+
+
+def create_stokvel(stokvel_id, max_number_of_contributors):
+    return insert_stokvel(
+        stokvel_id=stokvel_id,
+        stokvel_name=f"Stokvel {stokvel_id}",
+        ILP_wallet="$wallet",
+        MOMO_wallet="MOMO",
+        min_contributing_amount=100,
+        max_number_of_contributors=max_number_of_contributors,
+        total_contributions=0,
+        start_date="2024-10-01 00:00:00",
+        end_date="2025-10-01 00:00:00",
+        payout_frequency_duration="month",
+        contribution_period="month",
+    )
+
+
+def test_new_stokvels_count_their_members_on_the_server(execute, fetch):
+    execute(
+        (
+            "INSERT INTO USERS (user_id, user_number) VALUES (:user_id, :user_number)",
+            [
+                {"user_id": user_id, "user_number": f"+2782000000{user_id}"}
+                for user_id in (1, 2)
+            ],
+        ),
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id) VALUES (5, 1)",
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id) VALUES (6, 1)",
+        "INSERT INTO STOKVEL_MEMBERS (stokvel_id, user_id) VALUES (6, 2)",
+    )
+
+    stokvel_id = create_stokvel(None, 3)
+    assert fetch(
+        "SELECT total_members FROM STOKVELS WHERE stokvel_id = :stokvel_id",
+        {"stokvel_id": stokvel_id},
+    ) == [(0,)]
+
+    # Members left behind under a reused id are counted, and must fit the stokvel
+    assert create_stokvel(5, 1) == 5
+    assert fetch("SELECT total_members FROM STOKVELS WHERE stokvel_id = 5") == [(1,)]
+    with pytest.raises(ValueError):
+        create_stokvel(6, 1)
+    assert fetch("SELECT COUNT(*) FROM STOKVELS WHERE stokvel_id = 6") == [(0,)]
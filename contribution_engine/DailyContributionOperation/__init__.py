@@ -1,12 +1,21 @@
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import urlparse
 
 import requests
 from azure.functions import TimerRequest
 from dateutil.relativedelta import relativedelta
 
+from .http_client import http_client
+
 BASE_READ_ROUTE = "http://127.0.0.1:5000/database/query_db"
 BASE_WRITE_ROUTE = "http://127.0.0.1:5000/database/write_db"
+BASE_WRITE_BATCH_ROUTE = "http://127.0.0.1:5000/database/write_batch"
+BASE_NAMED_QUERY_ROUTE = "http://127.0.0.1:5000/database/named_query"
 
 node_server_create_initial_payment = (
     "http://localhost:3001/payments/initial_outgoing_payment"
@@ -19,6 +28,425 @@ node_server_recurring_payment_with_interest = (
     "http://localhost:3001/payments/process_recurring_winterest_payment"
 )
 
+# "batch" loads and persists the whole run with a handful of set-based requests,
+# "per_member" keeps the original request-per-member loop. The per_member loop
+# sends raw SQL, so the database API must run with DATABASE_API_SQL_MODE=raw.
+CONTRIBUTION_ENGINE_MODE = os.getenv("CONTRIBUTION_ENGINE_MODE", "batch")
+
+MASTER_STOKVEL_WALLET = "$ilp.rafiki.money/masterstokveladdress"
+
+# Bounded parallelism for the ILP calls of a batch run. The per-host limit caps
+# how many payments run against the same wallet provider at once.
+ILP_DISPATCH_WORKERS = int(os.getenv("ILP_DISPATCH_WORKERS", "8"))
+ILP_PER_HOST_LIMIT = int(os.getenv("ILP_PER_HOST_LIMIT", "4"))
+
+# Members paid and recorded per write of a batch run. A run that stops part way
+# resumes after the last recorded chunk.
+ENGINE_RUN_CHUNK_SIZE = int(os.getenv("ENGINE_RUN_CHUNK_SIZE", "50"))
+# Payment attempts a member gets across the resumes of a run. A member still failing
+# after the last one is marked failed for good, so the rest of its stokvel moves on.
+ENGINE_MAX_MEMBER_ATTEMPTS = int(os.getenv("ENGINE_MAX_MEMBER_ATTEMPTS", "3"))
+
+
+def read_named_query(name: str, parameters: Optional[Dict] = None) -> List[Dict]:
+    """
+    Runs a query registered with the database API by name and returns the rows.
+    """
+    response = http_client.post(
+        BASE_NAMED_QUERY_ROUTE,
+        json={"name": name, "parameters": parameters or {}},
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def write_db_batch(statements: List[Dict]) -> List[int]:
+    """
+    Runs a list of `{"name", "parameters"}` write statements through the database
+    API in a single transaction and returns the rows affected by each statement.
+    """
+    response = http_client.post(
+        BASE_WRITE_BATCH_ROUTE,
+        json={"statements": statements},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()["rowcounts"]
+
+
+def load_engine_run(
+    run_id: str,
+) -> Tuple[Optional[str], Set[Tuple[int, int]], Dict[Tuple[int, int], int]]:
+    """
+    Reads a run from the engine run ledger.
+
+    Returns:
+        Tuple[Optional[str], Set[Tuple[int, int]], Dict[Tuple[int, int], int]]: The
+        status of the run, None if it never started, the (stokvel_id, user_id) of every
+        member it settled, that is completed or failed for good, and the payment
+        attempts made for every member it recorded.
+    """
+    rows = read_named_query("engine_run_status", {"run_id": run_id})
+    if not rows:
+        return None, set(), {}
+    members = [row for row in rows if row["stokvel_id"] is not None]
+    settled = {
+        (row["stokvel_id"], row["user_id"])
+        for row in members
+        if row["member_status"] in ("completed", "failed")
+    }
+    attempts = {(row["stokvel_id"], row["user_id"]): row["attempts"] for row in members}
+    return rows[0]["status"], settled, attempts
+
+
+def load_open_engine_run_dates(engine: str) -> List[str]:
+    """
+    Reads the run dates of every run of the engine the ledger has not completed,
+    oldest first.
+    """
+    rows = read_named_query("open_engine_runs", {"engine": engine})
+    return [row["run_date"] for row in rows]
+
+
+def get_period_delta(contribution_period: str) -> Union[timedelta, relativedelta]:
+    """
+    Maps a stokvel contribution period onto the delta between two contribution dates.
+    """
+    if contribution_period == "Days":
+        return timedelta(days=1)
+    if contribution_period == "Week":
+        return timedelta(weeks=1)
+    if contribution_period == "Months":
+        return relativedelta(months=1)
+    if contribution_period == "Years":
+        return relativedelta(years=1)
+    raise ValueError("Invalid contribution period specified.")
+
+
+def load_due_contributions(input_date: str) -> List[Dict]:
+    """
+    Loads every member of every stokvel with a contribution due on the input date,
+    along with their wallet and payment grant details, in a single joined read.
+    """
+    return read_named_query("due_contributions", {"input_date": input_date})
+
+
+def execute_member_payment(member: Dict, idempotency_key: str) -> Dict:
+    """
+    Sends the member's contribution to the ILP server. Members that still hold a
+    quote make their initial outgoing payment, everyone else a recurring payment.
+    The ILP server executes a payment once per `idempotency_key`, and replays its
+    response when the same key is sent again.
+
+    Returns:
+        Dict: The new `token` and `manageurl` returned by the ILP server.
+    """
+    if member["user_quote_id"] is not None:
+        payload = {
+            "quote_id": member["user_quote_id"],
+            "continueUri": member["user_payment_URI"],
+            "continueAccessToken": member["user_payment_token"],
+            "walletAddressURL": member["ILP_wallet"],
+            "interact_ref": str(member["user_interaction_ref"]),
+        }
+        route = node_server_create_initial_payment
+    else:
+        payload = {
+            "sender_wallet_address": member["ILP_wallet"],
+            "receiving_wallet_address": MASTER_STOKVEL_WALLET,
+            "manageUrl": member["user_payment_URI"],
+            "previousToken": member["user_payment_token"],
+        }
+        route = node_server_recurring_payment
+
+    response = http_client.post(
+        route,
+        json=payload,
+        headers={"Idempotency-Key": idempotency_key},
+        timeout=10,
+    )
+    response.raise_for_status()
+    body = response.json()
+    return {"token": body["token"], "manageurl": body["manageurl"]}
+
+
+def get_wallet_host(wallet_address: Optional[str]) -> str:
+    """
+    Extracts the wallet provider host from an ILP wallet address. Payment pointers
+    (`$ilp.rafiki.money/alice`) and URLs (`https://ilp.rafiki.money/alice`) both
+    resolve to `ilp.rafiki.money`.
+    """
+    if not wallet_address:
+        return ""
+    address = wallet_address.strip()
+    if address.startswith("$"):
+        address = "https://" + address[1:]
+    elif "://" not in address:
+        address = "https://" + address
+    return urlparse(address).netloc.lower()
+
+
+def dispatch_member_payments(
+    members: List[Dict],
+    idempotency_keys: List[str],
+    max_workers: int = ILP_DISPATCH_WORKERS,
+    per_host_limit: int = ILP_PER_HOST_LIMIT,
+) -> List[Optional[Dict]]:
+    """
+    Fans the ILP payments for all members out over a thread pool, allowing at most
+    `per_host_limit` in-flight payments per wallet host. Each payment is sent with
+    the idempotency key at the same position in `idempotency_keys`.
+
+    Returns:
+        List[Optional[Dict]]: The ILP response for each member, in the same order as
+        `members`. Failed payments are logged and returned as None.
+    """
+    host_limits = {
+        host: threading.BoundedSemaphore(per_host_limit)
+        for host in {get_wallet_host(member["ILP_wallet"]) for member in members}
+    }
+
+    def pay(member: Dict, idempotency_key: str) -> Optional[Dict]:
+        with host_limits[get_wallet_host(member["ILP_wallet"])]:
+            try:
+                return execute_member_payment(member, idempotency_key)
+            except (requests.exceptions.RequestException, KeyError) as e:
+                logging.error(
+                    f"Contribution failed for user_id {member['user_id']} "
+                    f"in stokvel_id {member['stokvel_id']}: {e}"
+                )
+                return None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return list(executor.map(pay, members, idempotency_keys))
+
+
+def get_member_status(paid: bool, attempt: int) -> str:
+    """
+    The ledger status of a member after a payment attempt: 'completed' if it was paid,
+    'retry' if it failed with attempts left, and 'failed' for good after the last one.
+    """
+    if paid:
+        return "completed"
+    return "retry" if attempt < ENGINE_MAX_MEMBER_ATTEMPTS else "failed"
+
+
+def run_batch_contributions(input_date: str, tx_date: datetime) -> None:
+    """
+    Resumes every contribution run the ledger still holds open, oldest first, then
+    processes the contributions due on the input date.
+
+    Raises:
+        RuntimeError: If any run is left open because some of its members failed and
+            have attempts left.
+    """
+    run_dates = load_open_engine_run_dates("contribution")
+    if input_date not in run_dates:
+        run_dates.append(input_date)
+
+    open_runs = [
+        f"contribution:{run_date}"
+        for run_date in run_dates
+        if not process_contribution_run(run_date, tx_date)
+    ]
+    if open_runs:
+        raise RuntimeError(
+            f"Contribution runs left open with failed members: {', '.join(open_runs)}"
+        )
+
+
+def process_contribution_run(input_date: str, tx_date: datetime) -> bool:
+    """
+    Processes all contributions due on the input date as one batch: a single read
+    for the due members, concurrent ILP calls for them chunk by chunk, and one bulk
+    write per chunk for the DEPOSIT transactions, token/URI updates and cleared quotes.
+    The CONTRIBUTIONS.NextDate advances are written last, only for the stokvels
+    whose members all completed.
+
+    The run is recorded in the engine run ledger under 'contribution:<input_date>'.
+    A chunk's members are recorded as pending, with the idempotency key their ILP
+    call is sent with, before any call is made. Every member is then recorded as
+    completed or failed in the same transaction as their deposit, so a run that
+    stops part way resumes with the members it has not completed, repeating their
+    ILP calls under the same keys, and running a completed day again only reads
+    the ledger.
+
+    A run with failed members stays open and their stokvels keep their NextDate, so
+    they are still due for the run date when the next run resumes it. A member that
+    has failed ENGINE_MAX_MEMBER_ATTEMPTS times is recorded as failed for good and
+    quarantined: it is not retried, and its stokvel moves on without it.
+
+    Returns:
+        bool: Whether the run is completed.
+    """
+    run_id = f"contribution:{input_date}"
+    status, settled, attempts = load_engine_run(run_id)
+    if status == "completed":
+        logging.info(f"Contribution run {run_id} already completed.")
+        return True
+
+    due_members = load_due_contributions(input_date)
+    logging.info(f"Due contributions for {input_date}: {len(due_members)} members")
+
+    if not due_members:
+        # An open run whose stokvels have all moved on has nothing left to retry
+        if status is not None:
+            write_db_batch(
+                [{"name": "complete_engine_run", "parameters": {"run_id": run_id}}]
+            )
+        logging.info(f"No contributions due for {input_date}.")
+        return True
+
+    write_db_batch(
+        [
+            {
+                "name": "start_engine_run",
+                "parameters": {
+                    "run_id": run_id,
+                    "engine": "contribution",
+                    "run_date": input_date,
+                },
+            }
+        ]
+    )
+
+    pending_members = [
+        member
+        for member in due_members
+        if (member["stokvel_id"], member["user_id"]) not in settled
+    ]
+    if settled:
+        logging.info(
+            f"Resuming contribution run {run_id}: {len(settled)} members already settled."
+        )
+
+    tx_timestamp = tx_date.strftime("%Y-%m-%d %H:%M:%S")
+    date_updates: Dict[int, Dict] = {}
+    for member in due_members:
+        stokvel_id = member["stokvel_id"]
+        if stokvel_id not in date_updates:
+            next_date = datetime.strptime(input_date, "%Y-%m-%d") + get_period_delta(
+                member["contribution_period"]
+            )
+            date_updates[stokvel_id] = {
+                "PreviousDate": input_date,
+                "NextDate": next_date.strftime("%Y-%m-%d"),
+                "stokvel_id": stokvel_id,
+            }
+
+    paid = 0
+    failed_stokvels: Set[int] = set()
+    for start in range(0, len(pending_members), ENGINE_RUN_CHUNK_SIZE):
+        end = start + ENGINE_RUN_CHUNK_SIZE
+        chunk = pending_members[start:end]
+        pending_ledger_members = [
+            {
+                "run_id": run_id,
+                "stokvel_id": member["stokvel_id"],
+                "user_id": member["user_id"],
+                "status": "pending",
+                "tx_type": "DEPOSIT",
+                "amount": member["contribution_amount"],
+                "idempotency_key": f"{run_id}:{member['stokvel_id']}:{member['user_id']}",
+            }
+            for member in chunk
+        ]
+        write_db_batch(
+            [{"name": "record_engine_run_member", "parameters": pending_ledger_members}]
+        )
+        payments = dispatch_member_payments(
+            chunk, [entry["idempotency_key"] for entry in pending_ledger_members]
+        )
+
+        transactions = []
+        token_updates = []
+        cleared_quotes = []
+        ledger_members = []
+
+        for member, ledger_member, payment in zip(
+            chunk, pending_ledger_members, payments
+        ):
+            stokvel_id = member["stokvel_id"]
+            user_id = member["user_id"]
+            ledger_members.append(
+                {
+                    **ledger_member,
+                    "status": get_member_status(
+                        payment is not None,
+                        attempts.get((stokvel_id, user_id), 0) + 1,
+                    ),
+                }
+            )
+
+            if payment is None:
+                if ledger_members[-1]["status"] == "retry":
+                    failed_stokvels.add(stokvel_id)
+                else:
+                    logging.error(
+                        f"Contribution of user_id {user_id} in stokvel_id {stokvel_id} "
+                        f"failed {ENGINE_MAX_MEMBER_ATTEMPTS} times, quarantined in {run_id}."
+                    )
+                continue
+
+            transactions.append(
+                {
+                    "user_id": user_id,
+                    "stokvel_id": stokvel_id,
+                    "amount": member["contribution_amount"],
+                    "tx_type": "DEPOSIT",
+                    "tx_date": tx_timestamp,
+                    "created_at": tx_timestamp,
+                    "updated_at": tx_timestamp,
+                }
+            )
+
+            token_updates.append(
+                {
+                    "new_token": payment["token"],
+                    "new_uri": payment["manageurl"],
+                    "stokvel_id": stokvel_id,
+                    "user_id": user_id,
+                }
+            )
+
+            if member["user_quote_id"] is not None:
+                cleared_quotes.append({"stokvel_id": stokvel_id, "user_id": user_id})
+
+        # Persist the chunk and its ledger entries in one request and one commit
+        write_db_batch(
+            [
+                {"name": "insert_transaction", "parameters": transactions},
+                {"name": "update_member_payment_token", "parameters": token_updates},
+                {"name": "clear_member_quote", "parameters": cleared_quotes},
+                {"name": "record_engine_run_member", "parameters": ledger_members},
+            ]
+        )
+        paid += len(transactions)
+
+    statements = [
+        {
+            "name": "update_next_contribution_date",
+            "parameters": [
+                date_update
+                for stokvel_id, date_update in date_updates.items()
+                if stokvel_id not in failed_stokvels
+            ],
+        }
+    ]
+    if not failed_stokvels:
+        statements.append(
+            {"name": "complete_engine_run", "parameters": {"run_id": run_id}}
+        )
+    write_db_batch(statements)
+
+    logging.info(
+        f"Batch contribution run {run_id}: {paid} of {len(pending_members)} pending "
+        f"members paid across {len(date_updates)} stokvels, "
+        f"{len(failed_stokvels)} stokvels left open."
+    )
+    return not failed_stokvels
+
 
 def main(DailyContributionOperation: TimerRequest) -> None:
     """
@@ -31,8 +459,12 @@ def main(DailyContributionOperation: TimerRequest) -> None:
     print(input_date)
 
     try:
+        if CONTRIBUTION_ENGINE_MODE == "batch":
+            run_batch_contributions(input_date=input_date, tx_date=tx_date)
+            return
+
         # Step 1: Check if the contribution process should be kicked off
-        contribution_trigger_date_response = requests.post(
+        contribution_trigger_date_response = http_client.post(
             BASE_READ_ROUTE,
             json={
                 "query": (
@@ -69,7 +501,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
             logging.info(f"Processing stokvel_id: {stokvel_id}")
 
             # Fetch all members of the stokvel
-            stokvel_members_response = requests.post(
+            stokvel_members_response = http_client.post(
                 BASE_READ_ROUTE,
                 json={
                     "query": (
@@ -77,6 +509,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                         SELECT *
                         FROM STOKVEL_MEMBERS
                         WHERE stokvel_id = :stokvel_id
+                        AND active_status IS NOT 'pending_grant'
                         """
                     ),
                     "parameters": {"stokvel_id": stokvel_id},
@@ -112,45 +545,16 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                 print(
                     f"Processing member: user_id={user_id}, amount={amount}, tx_type={tx_type}"
                 )
-                # Step 3: Get the next unique transaction ID
-                table_name = "TRANSACTIONS"
-                id_column = "id"
-
-                max_id_response = requests.post(
-                    BASE_READ_ROUTE,
-                    json={
-                        "query": f"SELECT MAX({id_column}) AS max_id FROM {table_name}"
-                    },
-                    timeout=10,
-                )
-
-                # Raise an exception for HTTP error responses
-                max_id_response.raise_for_status()
-
-                # Parse the JSON response
-                max_id_result = max_id_response.json()
-
-                logging.info(f"Max ID result: {max_id_result}")
-                print(f"Max ID result: {max_id_result}")
-
-                if max_id_result and isinstance(max_id_result, list):
-                    max_id = max_id_result[0].get("max_id", 0)
-                    id = (max_id or 0) + 1
-                else:
-                    id = 1
-
-                logging.info(f"Calculated transaction ID: {id}")
 
                 # Step 5: Insert the transaction
-                insert_response = requests.post(
+                insert_response = http_client.post(
                     BASE_WRITE_ROUTE,
                     json={
                         "query": """
-                            INSERT INTO TRANSACTIONS (id, user_id, stokvel_id, amount, tx_type, tx_date, created_at, updated_at)
-                            VALUES (:id, :user_id, :stokvel_id, :amount, :tx_type, :tx_date, :created_at, :updated_at)
+                            INSERT INTO TRANSACTIONS (user_id, stokvel_id, amount, tx_type, tx_date, created_at, updated_at)
+                            VALUES (:user_id, :stokvel_id, :amount, :tx_type, :tx_date, :created_at, :updated_at)
                             """,
                         "parameters": {
-                            "id": id,
                             "user_id": user_id,
                             "stokvel_id": stokvel_id,
                             "amount": amount,
@@ -169,7 +573,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                 insert_response.raise_for_status()
 
                 logging.info(
-                    f"Inserted transaction ID {id} for user_id {user_id} and stokvel_id {stokvel_id}."
+                    f"Inserted transaction for user_id {user_id} and stokvel_id {stokvel_id}."
                 )
                 logging.info(
                     f"Insert response status: {insert_response.status_code}, response text: {insert_response.text}"
@@ -179,7 +583,6 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                 )
 
                 parameters = {
-                    "id": id,
                     "user_id": user_id,
                     "stokvel_id": stokvel_id,
                     "amount": amount,
@@ -211,7 +614,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                     parameters = {"stokvel_id": stokvel_id, "user_id": user_id}
 
                     # Send the POST request to the API
-                    stokvel_members_details_response = requests.post(
+                    stokvel_members_details_response = http_client.post(
                         BASE_READ_ROUTE,  # Assuming you're using a different route for reads
                         json={
                             "query": query,
@@ -245,7 +648,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
 
                     print("PAYLOAD: \n", payload)
 
-                    initial_payment_response = requests.post(
+                    initial_payment_response = http_client.post(
                         node_server_create_initial_payment, json=payload, timeout=10
                     )
 
@@ -276,7 +679,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                     }
 
                     # Send the POST request to the API
-                    stokvel_members_token_url_update_response = requests.post(
+                    stokvel_members_token_url_update_response = http_client.post(
                         BASE_WRITE_ROUTE,  # Assuming you're using a different route for reads
                         json={
                             "query": update_token_url_query,
@@ -321,7 +724,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                     }
 
                     # Send the POST request to the API
-                    member_contributions_update_response = requests.post(
+                    member_contributions_update_response = http_client.post(
                         BASE_WRITE_ROUTE,  # Assuming you're using a different route for reads
                         json={
                             "query": update_next_contribution_query,
@@ -334,7 +737,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
 
                     # endregion
 
-                    update_response = requests.post(
+                    update_response = http_client.post(
                         BASE_WRITE_ROUTE,
                         json={
                             "query": (
@@ -370,7 +773,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                     parameters = {"stokvel_id": stokvel_id, "user_id": user_id}
 
                     # Send the POST request to the API
-                    stokvel_members_details_response = requests.post(
+                    stokvel_members_details_response = http_client.post(
                         BASE_READ_ROUTE,  # Assuming you're using a different route for reads
                         json={
                             "query": query,
@@ -400,7 +803,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
 
                     print("PAYLOAD: \n", payload)
 
-                    recurring_payment_response = requests.post(
+                    recurring_payment_response = http_client.post(
                         node_server_recurring_payment, json=payload, timeout=10
                     )
                     print("RESPONSE: \n", recurring_payment_response.json())
@@ -432,7 +835,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                     }
 
                     # Send the POST request to the API
-                    stokvel_members_token_url_update_response = requests.post(
+                    stokvel_members_token_url_update_response = http_client.post(
                         BASE_WRITE_ROUTE,  # Assuming you're using a different route for reads
                         json={
                             "query": update_token_url_query,
@@ -477,7 +880,7 @@ def main(DailyContributionOperation: TimerRequest) -> None:
                     }
 
                     # Send the POST request to the API
-                    member_contributions_update_response = requests.post(
+                    member_contributions_update_response = http_client.post(
                         BASE_WRITE_ROUTE,  # Assuming you're using a different route for reads
                         json={
                             "query": update_next_contribution_query,
@@ -497,6 +900,9 @@ def main(DailyContributionOperation: TimerRequest) -> None:
         logging.error(f"Error in {main.__name__}: {e}")
         raise
 
+    finally:
+        logging.info(f"HTTP latency by host: {http_client.latency_stats()}")
+
 
 if __name__ == "__main__":
     main(None)
@@ -0,0 +1,462 @@
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+
+
+class NamedQuery:
+    """
+    A SQL statement registered under a name. The statement is built with `text()` once,
+    when it is registered, so SQLAlchemy's compiled cache can reuse it across calls.
+
+    Args:
+        name (str): The name the statement is called by.
+        sql (str): The SQL text of the statement.
+        parameters (List[str]): The bind parameters the statement requires.
+        write (bool): Whether the statement modifies data.
+    """
+
+    def __init__(self, name: str, sql: str, parameters: List[str], write: bool = False):
+        self.name = name
+        self.statement: TextClause = text(sql)
+        self.parameters = frozenset(parameters)
+        self.write = write
+
+    def validate(self, params: Union[Dict, List[Dict]]) -> None:
+        """
+        Checks that every parameter set carries exactly the parameters the statement binds.
+
+        Args:
+            params (Union[Dict, List[Dict]]): A parameter dictionary, or a list of them for an executemany.
+
+        Raises:
+            ValueError: If a parameter is missing or unknown, or a list is passed to a read.
+        """
+        if isinstance(params, list):
+            if not self.write:
+                raise ValueError(
+                    f"Query '{self.name}' does not accept a parameter list."
+                )
+            param_sets = params
+        else:
+            param_sets = [params]
+
+        for param_set in param_sets:
+            if not isinstance(param_set, dict):
+                raise ValueError(f"Parameters for query '{self.name}' must be objects.")
+            missing = self.parameters - param_set.keys()
+            unknown = param_set.keys() - self.parameters
+            if missing or unknown:
+                raise ValueError(
+                    f"Invalid parameters for query '{self.name}': "
+                    f"missing {sorted(missing)}, unknown {sorted(unknown)}."
+                )
+
+
+class QueryRegistry:
+    """
+    Holds the named queries served by the database API and records how long each
+    one takes to execute.
+    """
+
+    def __init__(self):
+        self._queries: Dict[str, NamedQuery] = {}
+        self._latencies: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self, name: str, sql: str, parameters: List[str], write: bool = False
+    ) -> NamedQuery:
+        """
+        Registers a statement under a name.
+
+        Raises:
+            ValueError: If the name is already registered.
+        """
+        if name in self._queries:
+            raise ValueError(f"Query '{name}' is already registered.")
+        query = NamedQuery(name=name, sql=sql, parameters=parameters, write=write)
+        self._queries[name] = query
+        return query
+
+    def get(self, name: str) -> NamedQuery:
+        """
+        Looks up a registered query.
+
+        Raises:
+            ValueError: If no query is registered under the name.
+        """
+        query: Optional[NamedQuery] = self._queries.get(name)
+        if query is None:
+            raise ValueError(f"Unknown query '{name}'.")
+        return query
+
+    def items(self) -> List[Tuple[str, NamedQuery]]:
+        """
+        Returns every registered query with its name, in registration order.
+        """
+        return list(self._queries.items())
+
+    def record_latency(self, name: str, elapsed_seconds: float) -> None:
+        """
+        Adds one execution of the named query to its latency statistics.
+        """
+        elapsed_ms = elapsed_seconds * 1000
+        with self._lock:
+            stats = self._latencies.setdefault(
+                name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the call count and the average and maximum latency of every executed query.
+        """
+        with self._lock:
+            return {
+                name: {
+                    "calls": stats["calls"],
+                    "avg_ms": round(stats["total_ms"] / stats["calls"], 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                }
+                for name, stats in self._latencies.items()
+            }
+
+
+query_registry = QueryRegistry()
+
+# region Contribution engine
+
+query_registry.register(
+    "due_contributions",
+    """
+    SELECT
+        c.stokvel_id,
+        s.contribution_period,
+        sm.user_id,
+        sm.contribution_amount,
+        sm.user_quote_id,
+        sm.user_payment_URI,
+        sm.user_payment_token,
+        sm.user_interaction_ref,
+        u.ILP_wallet AS ILP_wallet
+    FROM CONTRIBUTIONS c
+    JOIN STOKVELS s ON s.stokvel_id = c.stokvel_id
+    JOIN STOKVEL_MEMBERS sm ON sm.stokvel_id = c.stokvel_id
+    JOIN USERS u ON u.user_id = sm.user_id
+    WHERE DATE(c.NextDate) = :input_date  -- Compare only the date part
+    AND sm.active_status IS NOT 'pending_grant'  -- Members still awaiting grants
+    ORDER BY c.stokvel_id, sm.user_id
+    """,
+    parameters=["input_date"],
+)
+
+query_registry.register(
+    "insert_transaction",
+    """
+    INSERT INTO TRANSACTIONS (user_id, stokvel_id, amount, tx_type, tx_date, created_at, updated_at)
+    VALUES (:user_id, :stokvel_id, :amount, :tx_type, :tx_date, :created_at, :updated_at)
+    """,
+    parameters=[
+        "user_id",
+        "stokvel_id",
+        "amount",
+        "tx_type",
+        "tx_date",
+        "created_at",
+        "updated_at",
+    ],
+    write=True,
+)
+
+query_registry.register(
+    "update_member_payment_token",
+    """
+    UPDATE STOKVEL_MEMBERS
+    SET user_payment_token = :new_token,
+        user_payment_URI = :new_uri,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE stokvel_id = :stokvel_id AND user_id = :user_id
+    """,
+    parameters=["new_token", "new_uri", "stokvel_id", "user_id"],
+    write=True,
+)
+
+query_registry.register(
+    "clear_member_quote",
+    """
+    UPDATE STOKVEL_MEMBERS
+    SET user_quote_id = NULL
+    WHERE stokvel_id = :stokvel_id AND user_id = :user_id
+    """,
+    parameters=["stokvel_id", "user_id"],
+    write=True,
+)
+
+query_registry.register(
+    "update_next_contribution_date",
+    """
+    UPDATE CONTRIBUTIONS
+    SET PreviousDate = :PreviousDate, NextDate = :NextDate
+    WHERE stokvel_id = :stokvel_id
+    """,
+    parameters=["PreviousDate", "NextDate", "stokvel_id"],
+    write=True,
+)
+
+# endregion
+
+# region Payout engine
+
+query_registry.register(
+    "member_payout_totals",
+    """
+    SELECT
+        p.stokvel_id,
+        s.payout_frequency_duration,
+        sm.user_id,
+        sm.stokvel_payment_URI,
+        sm.stokvel_payment_token,
+        u.ILP_wallet AS ILP_wallet,
+        lp.last_payout_date,
+        COALESCE(SUM(t.amount), 0) AS total_deposits
+    FROM PAYOUTS p
+    JOIN STOKVELS s ON s.stokvel_id = p.stokvel_id
+    JOIN STOKVEL_MEMBERS sm ON sm.stokvel_id = p.stokvel_id
+    JOIN USERS u ON u.user_id = sm.user_id
+    LEFT JOIN (
+        SELECT stokvel_id, user_id, MAX(tx_date) AS last_payout_date
+        FROM TRANSACTIONS
+        WHERE tx_type = 'PAYOUT'
+        GROUP BY stokvel_id, user_id
+    ) lp ON lp.stokvel_id = sm.stokvel_id AND lp.user_id = sm.user_id
+    LEFT JOIN TRANSACTIONS t
+        ON t.stokvel_id = sm.stokvel_id
+        AND t.user_id = sm.user_id
+        AND t.tx_type = 'DEPOSIT'
+        AND t.tx_date >= COALESCE(lp.last_payout_date, '1900-01-01')
+    WHERE DATE(p.NextDate) = :input_date  -- Compare only the date part
+    AND sm.active_status IS NOT 'pending_grant'  -- Members still awaiting grants
+    GROUP BY p.stokvel_id, sm.user_id
+    ORDER BY p.stokvel_id, sm.user_id
+    """,
+    parameters=["input_date"],
+)
+
+# One row per member and interest entry since their last payout, paired with the
+# member's and the stokvel's deposits in the month the interest was earned on
+query_registry.register(
+    "member_payout_interest_inputs",
+    """
+    WITH due AS (
+        SELECT stokvel_id FROM PAYOUTS WHERE DATE(NextDate) = :input_date
+    ),
+    member_monthly AS (
+        SELECT l.stokvel_id, l.user_id, l.month, l.total_amount AS user_deposit
+        FROM MONTHLY_LEDGER l
+        JOIN due d ON d.stokvel_id = l.stokvel_id
+        WHERE l.tx_type = 'DEPOSIT'
+    ),
+    stokvel_monthly AS (
+        SELECT stokvel_id, month, SUM(user_deposit) AS stokvel_deposit
+        FROM member_monthly
+        GROUP BY stokvel_id, month
+    ),
+    last_payout AS (
+        SELECT stokvel_id, user_id, MAX(tx_date) AS last_payout_date
+        FROM TRANSACTIONS
+        WHERE tx_type = 'PAYOUT'
+        GROUP BY stokvel_id, user_id
+    )
+    SELECT
+        mm.stokvel_id,
+        mm.user_id,
+        i.id AS interest_id,
+        i.date AS interest_date,
+        i.interest_value,
+        mm.user_deposit,
+        sm.stokvel_deposit
+    FROM INTEREST i
+    JOIN due d ON d.stokvel_id = i.stokvel_id
+    JOIN member_monthly mm
+        ON mm.stokvel_id = i.stokvel_id
+        AND mm.month = strftime('%Y-%m', i.date, 'start of month', '-1 month')
+    JOIN stokvel_monthly sm ON sm.stokvel_id = mm.stokvel_id AND sm.month = mm.month
+    LEFT JOIN last_payout lp ON lp.stokvel_id = mm.stokvel_id AND lp.user_id = mm.user_id
+    WHERE i.date > COALESCE(lp.last_payout_date, '1900-01-01')
+    ORDER BY mm.stokvel_id, mm.user_id, i.date
+    """,
+    parameters=["input_date"],
+)
+
+query_registry.register(
+    "update_member_stokvel_payment_token",
+    """
+    UPDATE STOKVEL_MEMBERS
+    SET stokvel_payment_token = :new_token,
+        stokvel_payment_URI = :new_uri,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE stokvel_id = :stokvel_id AND user_id = :user_id
+    """,
+    parameters=["new_token", "new_uri", "stokvel_id", "user_id"],
+    write=True,
+)
+
+query_registry.register(
+    "update_next_payout_date",
+    """
+    UPDATE PAYOUTS
+    SET PreviousDate = :PreviousDate, NextDate = :NextDate
+    WHERE stokvel_id = :stokvel_id
+    """,
+    parameters=["PreviousDate", "NextDate", "stokvel_id"],
+    write=True,
+)
+
+# endregion
+
+# region Engine jobs
+
+# The transactions of a type a member already has on a run date, so a redelivered
+# engine job can tell its payment was made
+query_registry.register(
+    "member_transactions_on_date",
+    """
+    SELECT id, amount, tx_date
+    FROM TRANSACTIONS
+    WHERE stokvel_id = :stokvel_id
+    AND user_id = :user_id
+    AND tx_type = :tx_type
+    AND tx_date >= :run_date
+    AND tx_date < DATE(:run_date, '+1 day')
+    """,
+    parameters=["stokvel_id", "user_id", "tx_type", "run_date"],
+)
+
+# Inserts a transaction unless the member already has one of the type on the run date
+query_registry.register(
+    "insert_transaction_once",
+    """
+    INSERT INTO TRANSACTIONS (user_id, stokvel_id, amount, tx_type, tx_date, created_at, updated_at)
+    SELECT :user_id, :stokvel_id, :amount, :tx_type, :tx_date, :created_at, :updated_at
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM TRANSACTIONS
+        WHERE stokvel_id = :stokvel_id
+        AND user_id = :user_id
+        AND tx_type = :tx_type
+        AND tx_date >= :run_date
+        AND tx_date < DATE(:run_date, '+1 day')
+    )
+    """,
+    parameters=[
+        "user_id",
+        "stokvel_id",
+        "amount",
+        "tx_type",
+        "tx_date",
+        "created_at",
+        "updated_at",
+        "run_date",
+    ],
+    write=True,
+)
+
+# endregion
+
+# region Engine run ledger
+
+# A run and its recorded members, no rows if the run never started
+query_registry.register(
+    "engine_run_status",
+    """
+    SELECT r.status, m.stokvel_id, m.user_id, m.status AS member_status, m.attempts
+    FROM ENGINE_RUNS r
+    LEFT JOIN ENGINE_RUN_MEMBERS m ON m.run_id = r.run_id
+    WHERE r.run_id = :run_id
+    """,
+    parameters=["run_id"],
+)
+
+# Runs left open by failed members, resumed by the next run of the engine
+query_registry.register(
+    "open_engine_runs",
+    """
+    SELECT run_id, run_date
+    FROM ENGINE_RUNS
+    WHERE engine = :engine AND status != 'completed'
+    ORDER BY run_date
+    """,
+    parameters=["engine"],
+)
+
+query_registry.register(
+    "start_engine_run",
+    """
+    INSERT INTO ENGINE_RUNS (run_id, engine, run_date, status, attempts, started_at)
+    VALUES (:run_id, :engine, :run_date, 'running', 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (run_id) DO UPDATE SET
+        attempts = attempts + 1,
+        started_at = CURRENT_TIMESTAMP
+    """,
+    parameters=["run_id", "engine", "run_date"],
+    write=True,
+)
+
+# A member is recorded 'pending' before each ILP call, which counts an attempt, and after it
+# 'completed', 'retry' if it failed with attempts left, or 'failed' once they are used up.
+# 'completed' and 'failed' are final, 'retry' is overwritten when a resumed run retries it
+query_registry.register(
+    "record_engine_run_member",
+    """
+    INSERT INTO ENGINE_RUN_MEMBERS (
+        run_id, stokvel_id, user_id, status, tx_type, amount, idempotency_key, attempts, updated_at
+    )
+    VALUES (
+        :run_id, :stokvel_id, :user_id, :status, :tx_type, :amount, :idempotency_key,
+        CASE WHEN :status = 'pending' THEN 1 ELSE 0 END, CURRENT_TIMESTAMP
+    )
+    ON CONFLICT (run_id, stokvel_id, user_id) DO UPDATE SET
+        status = excluded.status,
+        amount = excluded.amount,
+        idempotency_key = excluded.idempotency_key,
+        attempts = ENGINE_RUN_MEMBERS.attempts + excluded.attempts,
+        updated_at = excluded.updated_at
+    WHERE ENGINE_RUN_MEMBERS.status NOT IN ('completed', 'failed')
+    """,
+    parameters=[
+        "run_id",
+        "stokvel_id",
+        "user_id",
+        "status",
+        "tx_type",
+        "amount",
+        "idempotency_key",
+    ],
+    write=True,
+)
+
+query_registry.register(
+    "complete_engine_run",
+    """
+    UPDATE ENGINE_RUNS
+    SET status = 'completed',
+        completed_at = CURRENT_TIMESTAMP,
+        members_completed = (
+            SELECT COUNT(*) FROM ENGINE_RUN_MEMBERS
+            WHERE run_id = :run_id AND status = 'completed'
+        ),
+        members_failed = (
+            SELECT COUNT(*) FROM ENGINE_RUN_MEMBERS
+            WHERE run_id = :run_id AND status = 'failed'
+        )
+    WHERE run_id = :run_id
+    """,
+    parameters=["run_id"],
+    write=True,
+)
+
+# endregion
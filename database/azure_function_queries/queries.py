@@ -1,11 +1,12 @@
-from typing import Dict, List
+import time
+from typing import Dict, List, Union
 
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
-from database.sqlite_connection import SQLiteConnection
-
-db_conn = SQLiteConnection(database="./database/test_db.db")
+from database.azure_function_queries.named_queries import query_registry
+from database.interest_allocation import allocate_deposit_rate_interest, pivot_rows
+from database.sqlite_connection import sqlite_conn
 
 
 def dynamic_read_operation(query: str, params: Dict) -> List[Dict]:
@@ -20,7 +21,7 @@ def dynamic_read_operation(query: str, params: Dict) -> List[Dict]:
         List[Dict]: A list of dictionaries representing the rows.
     """
     try:
-        with db_conn.connect() as conn:
+        with sqlite_conn.connect() as conn:
             result = conn.execute(text(query), params)
             rows = result.fetchall()
             # Convert each row to a dictionary using column names
@@ -31,7 +32,7 @@ def dynamic_read_operation(query: str, params: Dict) -> List[Dict]:
         return []
 
 
-def dynamic_write_operation(query: str, params: Dict) -> None:
+def dynamic_write_operation(query: str, params: Union[Dict, List[Dict]]) -> None:
     """
     Executes a dynamic SQL write operation with the provided parameters.
 
@@ -41,18 +42,166 @@ def dynamic_write_operation(query: str, params: Dict) -> None:
     Args:
         query (str): The SQL query to execute. This should be a write operation such as
                      an INSERT, UPDATE, or DELETE statement.
-        params (Dict): A dictionary of parameters to bind to the query, where the keys
-                       correspond to parameter names in the SQL query.
+        params (Union[Dict, List[Dict]]): A dictionary of parameters to bind to the query, where the keys
+                       correspond to parameter names in the SQL query. A list of dictionaries
+                       executes the statement once per entry (executemany) in one commit.
 
     Raises:
         SQLAlchemyError: If an error occurs during the execution of the query, the
                          exception is caught and re-raised after logging the error.
     """
     try:
-        with db_conn.connect() as conn:
+        with sqlite_conn.connect() as conn:
             conn.execute(text(query), params)
             conn.commit()
     except SQLAlchemyError as e:
         print(f"An error occurred during database query execution: {e}")
         conn.rollback()
         raise e
+
+
+def dynamic_batch_write_operation(statements: List[Dict]) -> List[int]:
+    """
+    Executes a list of SQL write statements in a single transaction.
+
+    Each statement is executed in order on the same connection and everything is
+    committed once at the end. If any statement fails the whole batch is rolled back.
+
+    Args:
+        statements (List[Dict]): The statements to execute. Each entry holds either a raw
+                       `query` or the `name` of a registered write query, and optional
+                       `parameters`, either a dictionary or a list of
+                       dictionaries to execute the statement once per entry (executemany).
+                       An empty list is skipped.
+
+    Returns:
+        List[int]: The number of rows affected by each statement, in request order.
+
+    Raises:
+        ValueError: If a named statement is unknown, not a write or given invalid parameters.
+        SQLAlchemyError: If an error occurs during the execution of any statement, the
+                         exception is caught and re-raised after rolling back the batch.
+    """
+    # Resolve and validate every named statement before anything is written
+    resolved = []
+    for statement in statements:
+        params = statement.get("parameters", {})
+        name = statement.get("name")
+        if name is not None:
+            named_query = query_registry.get(name)
+            if not named_query.write:
+                raise ValueError(f"Query '{name}' is not a write query.")
+            if params != []:
+                named_query.validate(params)
+            resolved.append((name, named_query.statement, params))
+        else:
+            resolved.append((None, text(statement["query"]), params))
+
+    with sqlite_conn.connect() as conn:
+        try:
+            rowcounts = []
+            for name, clause, params in resolved:
+                # An empty parameter array has no rows to write
+                if isinstance(params, list) and not params:
+                    rowcounts.append(0)
+                    continue
+                started = time.perf_counter()
+                result = conn.execute(clause, params)
+                if name is not None:
+                    query_registry.record_latency(name, time.perf_counter() - started)
+                rowcounts.append(result.rowcount)
+            conn.commit()
+            return rowcounts
+        except SQLAlchemyError as e:
+            print(f"An error occurred during database batch execution: {e}")
+            conn.rollback()
+            raise e
+
+
+def named_read_operation(name: str, params: Dict) -> List[Dict]:
+    """
+    Executes a registered read query by name.
+
+    Args:
+        name (str): The name the query is registered under.
+        params (Dict): The parameters to bind to the query. They must match the
+                       parameters the query declares.
+
+    Returns:
+        List[Dict]: A list of dictionaries representing the rows.
+
+    Raises:
+        ValueError: If the query is unknown, is a write query or the parameters are invalid.
+        SQLAlchemyError: If an error occurs during the execution of the query.
+    """
+    named_query = query_registry.get(name)
+    if named_query.write:
+        raise ValueError(f"Query '{name}' is a write query.")
+    named_query.validate(params)
+
+    started = time.perf_counter()
+    with sqlite_conn.connect() as conn:
+        result = conn.execute(named_query.statement, params)
+        data = [dict(row._mapping) for row in result.fetchall()]
+    query_registry.record_latency(name, time.perf_counter() - started)
+    return data
+
+
+def payout_plan_operation(input_date: str) -> List[Dict]:
+    """
+    Computes the payout of every member of every stokvel due on the input date.
+
+    The member totals and the interest inputs are each read with one set-based query.
+    Every member's interest share is then allocated at once over a member by
+    interest entry matrix.
+
+    Args:
+        input_date (str): The payout date in `YYYY-MM-DD` format.
+
+    Returns:
+        List[Dict]: One entry per member with the `amount` to pay out, the
+                    `total_deposits` and `interest` it is made up of, and the
+                    member's wallet and payment grant details.
+    """
+    members = named_read_operation("member_payout_totals", {"input_date": input_date})
+    if not members:
+        return []
+
+    interest_rows = [
+        {**row, "member": (row["stokvel_id"], row["user_id"])}
+        for row in named_read_operation(
+            "member_payout_interest_inputs", {"input_date": input_date}
+        )
+    ]
+    member_keys = [(member["stokvel_id"], member["user_id"]) for member in members]
+    interest_ids = sorted({row["interest_id"] for row in interest_rows})
+
+    matrices = {
+        field: pivot_rows(
+            interest_rows,
+            row_keys=member_keys,
+            column_keys=interest_ids,
+            row_field="member",
+            column_field="interest_id",
+            value_field=field,
+        )[0]
+        for field in ("user_deposit", "stokvel_deposit", "interest_value")
+    }
+    member_interest = allocate_deposit_rate_interest(
+        matrices["user_deposit"],
+        matrices["stokvel_deposit"],
+        matrices["interest_value"],
+    )
+
+    plan = []
+    for member, interest in zip(members, member_interest.tolist()):
+        total_deposits = member["total_deposits"] or 0
+        plan.append(
+            {
+                **member,
+                "total_deposits": total_deposits,
+                "interest": interest,
+                "amount": total_deposits + interest,
+            }
+        )
+    return plan
@@ -3,9 +3,7 @@ from typing import List, Tuple
 
 from sqlalchemy import text
 
-from database.sqlite_connection import SQLiteConnection
-
-sqlite_conn = SQLiteConnection(database="./database/test_db.db")
+from database.sqlite_connection import sqlite_conn
 
 
 def bulk_upload_transaction(table_rows: List[Tuple]):
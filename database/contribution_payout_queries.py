@@ -5,21 +5,7 @@ from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from sqlalchemy import text
 
-from .sqlite_connection import SQLiteConnection
-
-# from queries import get_next_unique_id
-
-
-sqlite_conn = SQLiteConnection(database="./database/test_db.db")
-
-
-def get_next_unique_id(conn, table_name, id_column):
-    """
-    Get the next unique id for the given table and id column.
-    """
-    result = conn.execute(text(f"SELECT MAX({id_column}) FROM {table_name}")).fetchone()
-    # If no result exists (table is empty), return 1, otherwise increment the max id
-    return (result[0] or 0) + 1
+from .sqlite_connection import sqlite_conn
 
 
 def insert_member_contribution_parameters(
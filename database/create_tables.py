@@ -1,9 +1,9 @@
 # from .sql_connection import sql_connection
 from sqlalchemy import text
 
-from .sqlite_connection import SQLiteConnection
+from .migrations import run_migrations
+from .sqlite_connection import sqlite_conn
 
-sqlite_conn = SQLiteConnection(database="./database/test_db.db")
 # sql_conn = sql_connection()
 
 # URL refers to the openAPI address of the stokvel
@@ -326,3 +326,4 @@ if __name__ == "__main__":
     create_state_management_table()
     create_payouts_table_sqlite()
     create_interest_table()
+    run_migrations()
@@ -0,0 +1,33 @@
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+
+def insert_with_generated_id(
+    conn: Connection, query: str, params: Dict, id_column: str = "id"
+) -> Optional[int]:
+    """
+    Executes an INSERT and lets SQLite allocate the primary key.
+
+    Every table in the schema is keyed by an INTEGER PRIMARY KEY, which aliases the
+    rowid. Binding NULL to that column makes SQLite assign the next id under the
+    write lock of the inserting transaction. Unlike a `SELECT MAX(id) + 1` lookup
+    before every insert, two concurrent writers can never receive the same id.
+
+    Args:
+        conn (Connection): The connection to run the insert on. The caller commits.
+        query (str): The INSERT statement. It may bind the id column or leave it out.
+        params (Dict): The parameters for the statement. An id already present in
+            the parameters is replaced by NULL.
+        id_column (str): The name of the id parameter in the statement.
+
+    Returns:
+        Optional[int]: The id SQLite assigned to the inserted row, or None if the
+        statement inserted no row.
+    """
+    params = {**params, id_column: None}
+    result = conn.execute(text(query), params)
+    if result.rowcount > 0:
+        return result.lastrowid
+    return None
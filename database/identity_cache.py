@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from database.sqlite_connection import sqlite_conn
+from database.utils import extract_whatsapp_number
+
+# Most users, and most stokvels, whose identities are kept in memory
+IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "10000"))
+# Seconds an identity is served from memory, which bounds how long a rename made by
+# another API worker process goes unseen
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "60"))
+
+
+class BidirectionalCache:
+    """
+    A bounded, thread-safe mapping between natural keys and ids that can be looked up
+    from either side. Pairs expire `ttl` seconds after they are stored, and the least
+    recently stored pair is dropped once `max_entries` is reached.
+
+    Args:
+        max_entries (int): The most pairs kept in memory.
+        ttl (float): Seconds a pair is served from memory.
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+        self._keys: Dict[int, str] = {}
+        self._stored_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get_id(self, key: str) -> Optional[int]:
+        """
+        Returns the cached id of a key, or None.
+        """
+        with self._lock:
+            if key not in self._ids or self._expire(key):
+                return None
+            return self._ids[key]
+
+    def get_key(self, id_: int) -> Optional[str]:
+        """
+        Returns the cached key of an id, or None.
+        """
+        with self._lock:
+            key = self._keys.get(id_)
+            if key is None or self._expire(key):
+                return None
+            return key
+
+    def put(self, key: str, id_: int) -> None:
+        """
+        Stores a pair, replacing any pair that shares its key or id.
+        """
+        with self._lock:
+            self._discard(key=key, id_=id_)
+            self._ids[key] = id_
+            self._keys[id_] = key
+            self._stored_at[key] = time.monotonic()
+            while len(self._ids) > self.max_entries:
+                evicted_key, evicted_id = self._ids.popitem(last=False)
+                self._keys.pop(evicted_id, None)
+                self._stored_at.pop(evicted_key, None)
+
+    def discard(self, key: Optional[str] = None, id_: Optional[int] = None) -> None:
+        """
+        Drops the pairs of a key and of an id.
+        """
+        with self._lock:
+            self._discard(key=key, id_=id_)
+
+    def clear(self) -> None:
+        """
+        Drops every pair.
+        """
+        with self._lock:
+            self._ids.clear()
+            self._keys.clear()
+            self._stored_at.clear()
+
+    def _expire(self, key: str) -> bool:
+        # Drops the pair of a key if it is older than the TTL, and reports whether it did
+        if time.monotonic() - self._stored_at[key] < self.ttl:
+            return False
+        self._discard(key=key, id_=None)
+        return True
+
+    def _discard(self, key: Optional[str], id_: Optional[int]) -> None:
+        if key is not None and key in self._ids:
+            self._keys.pop(self._ids.pop(key), None)
+            self._stored_at.pop(key, None)
+        if id_ is not None and id_ in self._keys:
+            discarded_key = self._keys.pop(id_)
+            self._ids.pop(discarded_key, None)
+            self._stored_at.pop(discarded_key, None)
+
+
+class IdentityCache:
+    """
+    Resolves phone numbers to user ids and stokvel names to stokvel ids, and back, so
+    queries can run on primary keys without resolving natural keys in subqueries.
+    Resolved identities are cached in memory, and numbers or names that do not exist
+    are not cached, so new users and stokvels are found as soon as they are inserted.
+
+    Each API worker process has its own cache, so identities expire after `ttl` seconds
+    and a stokvel renamed in another process resolves by its new name within that time.
+    Code that renames a stokvel must call `invalidate_stokvel`, so the process that made
+    the change sees it at once. User numbers never change.
+
+    Args:
+        max_entries (int): The most users, and most stokvels, kept in memory.
+        ttl (float): Seconds an identity is served from memory.
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.users = BidirectionalCache(max_entries, ttl)
+        self.stokvels = BidirectionalCache(max_entries, ttl)
+
+    def get_user_id(self, from_number: str) -> Optional[int]:
+        """
+        Returns the user_id of a phone number, with or without the 'whatsapp:' prefix,
+        or None if no user has the number.
+        """
+        user_number = extract_whatsapp_number(from_number=from_number)
+        user_id = self.users.get_id(user_number)
+        if user_id is None:
+            user_id = self._load(
+                "SELECT user_id FROM USERS WHERE user_number = :value", user_number
+            )
+            if user_id is not None:
+                self.users.put(user_number, user_id)
+        return user_id
+
+    def get_user_number(self, user_id: int) -> Optional[str]:
+        """
+        Returns the phone number of a user, or None if the user does not exist.
+        """
+        user_id = int(user_id)
+        user_number = self.users.get_key(user_id)
+        if user_number is None:
+            user_number = self._load(
+                "SELECT user_number FROM USERS WHERE user_id = :value", user_id
+            )
+            if user_number is not None:
+                self.users.put(user_number, user_id)
+        return user_number
+
+    def get_stokvel_id(self, stokvel_name: str) -> Optional[int]:
+        """
+        Returns the stokvel_id of a stokvel name, or None if no stokvel has the name.
+        """
+        stokvel_id = self.stokvels.get_id(stokvel_name)
+        if stokvel_id is None:
+            stokvel_id = self._load(
+                "SELECT stokvel_id FROM STOKVELS WHERE stokvel_name = :value",
+                stokvel_name,
+            )
+            if stokvel_id is not None:
+                self.stokvels.put(stokvel_name, stokvel_id)
+        return stokvel_id
+
+    def get_stokvel_name(self, stokvel_id: int) -> Optional[str]:
+        """
+        Returns the name of a stokvel, or None if the stokvel does not exist.
+        """
+        stokvel_id = int(stokvel_id)
+        stokvel_name = self.stokvels.get_key(stokvel_id)
+        if stokvel_name is None:
+            stokvel_name = self._load(
+                "SELECT stokvel_name FROM STOKVELS WHERE stokvel_id = :value",
+                stokvel_id,
+            )
+            if stokvel_name is not None:
+                self.stokvels.put(stokvel_name, stokvel_id)
+        return stokvel_name
+
+    def invalidate_stokvel(
+        self, stokvel_id: Optional[int] = None, stokvel_name: Optional[str] = None
+    ) -> None:
+        """
+        Drops the cached identity of a stokvel, by id, by name, or both.
+        """
+        self.stokvels.discard(
+            key=stokvel_name, id_=int(stokvel_id) if stokvel_id is not None else None
+        )
+
+    @staticmethod
+    def _load(query: str, value):
+        with sqlite_conn.connect() as conn:
+            try:
+                row = conn.execute(text(query), {"value": value}).fetchone()
+            except Exception as e:
+                print(f"An error occurred resolving an identity: {e}")
+                raise e
+        return row[0] if row else None
+
+
+identity_cache = IdentityCache(
+    max_entries=IDENTITY_CACHE_MAX_ENTRIES, ttl=IDENTITY_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,132 @@
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+def month_index(month: str) -> int:
+    """
+    Converts a `YYYY-MM` (or longer ISO date) string into a running month number,
+    so that consecutive months differ by one.
+    """
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def previous_month(month: str) -> str:
+    """
+    Returns the `YYYY-MM` month before the month of the given date string.
+    """
+    index = month_index(month) - 1
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def pivot_rows(
+    rows: Iterable[Dict],
+    row_keys: Sequence[Hashable],
+    column_keys: Sequence[Hashable],
+    row_field: str,
+    column_field: str,
+    value_field: str,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pivots long-format query rows into a dense matrix.
+
+    Args:
+        rows (Iterable[Dict]): The rows to pivot.
+        row_keys (Sequence[Hashable]): The values of `row_field` that make up the matrix rows.
+        column_keys (Sequence[Hashable]): The values of `column_field` that make up the matrix
+            columns. A key may repeat, every matching column receives the value.
+        row_field (str): The field holding the row key.
+        column_field (str): The field holding the column key.
+        value_field (str): The field holding the value.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The values, zero where no row matched, and a boolean
+        mask of the cells a row was found for. Rows with unknown keys are ignored.
+    """
+    row_positions = {key: i for i, key in enumerate(row_keys)}
+    column_positions: Dict[Hashable, List[int]] = {}
+    for j, key in enumerate(column_keys):
+        column_positions.setdefault(key, []).append(j)
+
+    values = np.zeros((len(row_keys), len(column_keys)))
+    present = np.zeros((len(row_keys), len(column_keys)), dtype=bool)
+    for row in rows:
+        i = row_positions.get(row[row_field])
+        columns = column_positions.get(row[column_field])
+        if i is None or columns is None:
+            continue
+        values[i, columns] = row[value_field] or 0
+        present[i, columns] = True
+    return values, present
+
+
+def allocate_balance_weighted_interest(
+    member_deposits: np.ndarray,
+    has_deposit: np.ndarray,
+    stokvel_deposits: np.ndarray,
+    interest_values: np.ndarray,
+) -> np.ndarray:
+    """
+    Splits interest amounts between members by their running share of the deposits.
+
+    Column `k` holds the deposits made in the month before interest entry `k` was
+    earned. For every entry a member deposited towards, they receive the entry's
+    amount weighted by their accumulated deposits over the stokvel deposits
+    accumulated in the same months.
+
+    Args:
+        member_deposits (np.ndarray): Deposits per member and entry, shape (members, entries).
+        has_deposit (np.ndarray): Whether the member deposited towards the entry, same shape.
+        stokvel_deposits (np.ndarray): Total stokvel deposits per entry, shape (entries,).
+        interest_values (np.ndarray): The interest amount of every entry, shape (entries,).
+
+    Returns:
+        np.ndarray: The interest of every member rounded to cents, shape (members,).
+    """
+    member_running = np.cumsum(np.where(has_deposit, member_deposits, 0.0), axis=1)
+    stokvel_running = np.cumsum(np.where(has_deposit, stokvel_deposits, 0.0), axis=1)
+    weights = np.divide(
+        member_running,
+        stokvel_running,
+        out=np.zeros_like(member_running),
+        where=has_deposit & (stokvel_running != 0),
+    )
+    return np.round(weights @ np.asarray(interest_values, dtype=float), 2)
+
+
+def allocate_deposit_rate_interest(
+    member_deposits: np.ndarray,
+    stokvel_deposits: np.ndarray,
+    interest_rates: np.ndarray,
+) -> np.ndarray:
+    """
+    Applies percentage interest rates to the stokvel deposits and splits the result
+    between members by their share of those deposits.
+
+    Args:
+        member_deposits (np.ndarray): Deposits per member and entry, shape (members, entries).
+            Entries a member does not earn interest on hold zero.
+        stokvel_deposits (np.ndarray): Total stokvel deposits per entry, shape (entries,)
+            or (members, entries).
+        interest_rates (np.ndarray): The rate of every entry as a percentage, shape (entries,)
+            or (members, entries).
+
+    Returns:
+        np.ndarray: The interest of every member rounded to cents, shape (members,).
+    """
+    stokvel_deposits = np.broadcast_to(stokvel_deposits, member_deposits.shape)
+    shares = np.divide(
+        member_deposits,
+        stokvel_deposits,
+        out=np.zeros_like(member_deposits, dtype=float),
+        where=stokvel_deposits != 0,
+    )
+    interest = shares * np.asarray(interest_rates, dtype=float) / 100 * stokvel_deposits
+    return np.round(interest.sum(axis=1), 2)
+
+
+def total_interest(interest_values: Iterable[float]) -> float:
+    """
+    Sums the interest amounts earned by a stokvel, rounded to cents.
+    """
+    return round(float(np.sum(np.fromiter(interest_values, dtype=float))), 2)
@@ -0,0 +1,78 @@
+from typing import List
+
+from sqlalchemy import text
+
+from database.sqlite_connection import sqlite_conn
+
+# Recomputes STOKVEL_MEMBER_SUMMARY from STOKVEL_MEMBERS, TRANSACTIONS and STOKVELS.
+# Migration 6 backfills the summary with these statements, and
+# rebuild_stokvel_member_summary repairs it
+REBUILD_STOKVEL_MEMBER_SUMMARY_STATEMENTS: List[str] = [
+    "DELETE FROM STOKVEL_MEMBER_SUMMARY",
+    """
+    INSERT INTO STOKVEL_MEMBER_SUMMARY (
+        stokvel_id, user_id, total_deposits, total_payouts, active_members,
+        min_contributing_amount, max_number_of_contributors, stokvel_created_at
+    )
+    SELECT
+        sm.stokvel_id,
+        sm.user_id,
+        COALESCE(t.total_deposits, 0),
+        COALESCE(t.total_payouts, 0),
+        COALESCE(a.active_members, 0),
+        s.min_contributing_amount,
+        s.max_number_of_contributors,
+        s.created_at
+    FROM STOKVEL_MEMBERS sm
+    JOIN STOKVELS s ON s.stokvel_id = sm.stokvel_id
+    LEFT JOIN (
+        SELECT
+            stokvel_id,
+            user_id,
+            SUM(CASE WHEN tx_type = 'DEPOSIT' THEN amount ELSE 0 END) AS total_deposits,
+            SUM(CASE WHEN tx_type = 'PAYOUT' THEN amount ELSE 0 END) AS total_payouts
+        FROM TRANSACTIONS
+        GROUP BY stokvel_id, user_id
+    ) t ON t.stokvel_id = sm.stokvel_id AND t.user_id = sm.user_id
+    LEFT JOIN (
+        SELECT stokvel_id, COUNT(*) AS active_members
+        FROM STOKVEL_MEMBERS
+        WHERE active_status = 'active'
+        GROUP BY stokvel_id
+    ) a ON a.stokvel_id = sm.stokvel_id
+    WHERE sm.user_id IS NOT NULL
+    """,
+]
+
+
+def rebuild_stokvel_member_summary() -> int:
+    """
+    Empty STOKVEL_MEMBER_SUMMARY and repopulate it in one transaction, to repair a summary
+    that drifted from the members, transactions and stokvels it is built from. The write
+    lock is taken first, so nothing is written between the two steps, and readers see
+    either the old summary or the rebuilt one.
+
+    Returns:
+        int: The number of summary rows written.
+    """
+    with sqlite_conn.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            delete_statement, insert_statement = (
+                REBUILD_STOKVEL_MEMBER_SUMMARY_STATEMENTS
+            )
+            conn.execute(text(delete_statement))
+            result = conn.execute(text(insert_statement))
+            conn.commit()
+            return result.rowcount
+        except Exception as e:
+            print(f"Error rebuilding the stokvel member summary: {e}")
+            conn.rollback()
+            raise e
+
+
+# Rebuild the summary from the repository root, after migrating:
+# python -m database.member_summary
+if __name__ == "__main__":
+    rows = rebuild_stokvel_member_summary()
+    print(f"Rebuilt STOKVEL_MEMBER_SUMMARY with {rows} row(s).")
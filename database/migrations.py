@@ -0,0 +1,405 @@
+from datetime import datetime
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from database.member_summary import REBUILD_STOKVEL_MEMBER_SUMMARY_STATEMENTS
+from database.monthly_ledger import REBUILD_MONTHLY_LEDGER_STATEMENTS
+from database.sqlite_connection import sqlite_conn
+
+# Ordered schema migrations as (version, description, statements). Applied migrations are
+# recorded in SCHEMA_MIGRATIONS, so only append new versions and never edit applied ones.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (
+        1,
+        "Secondary indexes for the WhatsApp and engine hot paths",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_users_user_number ON USERS (user_number)",
+            "CREATE INDEX IF NOT EXISTS idx_transactions_stokvel_user_type_date ON TRANSACTIONS (stokvel_id, user_id, tx_type, tx_date)",
+            "CREATE INDEX IF NOT EXISTS idx_transactions_type_stokvel_user_date ON TRANSACTIONS (tx_type, stokvel_id, user_id, tx_date)",
+            "CREATE INDEX IF NOT EXISTS idx_state_management_user_number ON STATE_MANAGEMENT (user_number)",
+            # The engines filter on DATE(NextDate), which only an expression index can serve
+            "CREATE INDEX IF NOT EXISTS idx_contributions_next_date ON CONTRIBUTIONS (DATE(NextDate))",
+            "CREATE INDEX IF NOT EXISTS idx_payouts_next_date ON PAYOUTS (DATE(NextDate))",
+            "CREATE INDEX IF NOT EXISTS idx_stokvels_stokvel_name ON STOKVELS (stokvel_name)",
+            "CREATE INDEX IF NOT EXISTS idx_interest_stokvel_date ON INTEREST (stokvel_id, date)",
+        ],
+    ),
+    (
+        2,
+        "Admin lookup by user for the WhatsApp session load",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_admin_user_id ON ADMIN (user_id)",
+        ],
+    ),
+    (
+        3,
+        "Engine run ledger for idempotent, resumable contribution and payout runs",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS ENGINE_RUNS (
+                run_id TEXT PRIMARY KEY,
+                engine TEXT NOT NULL,
+                run_date TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                started_at TIMESTAMP,
+                completed_at TIMESTAMP,
+                members_completed INTEGER,
+                members_failed INTEGER
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS ENGINE_RUN_MEMBERS (
+                run_id TEXT NOT NULL,
+                stokvel_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                tx_type TEXT,
+                amount REAL,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (run_id, stokvel_id, user_id)
+            )
+            """,
+        ],
+    ),
+    (
+        4,
+        "Monthly transaction ledger for the summary and interest reads",
+        [
+            # Running totals of TRANSACTIONS per stokvel, user, month and transaction type
+            """
+            CREATE TABLE IF NOT EXISTS MONTHLY_LEDGER (
+                stokvel_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,  -- YYYY-MM of the transaction date
+                tx_type TEXT NOT NULL,
+                total_amount NUMBER NOT NULL DEFAULT 0,
+                tx_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (stokvel_id, user_id, month, tx_type)
+            );
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS MONTHLY_LEDGER_AFTER_INSERT
+            AFTER INSERT ON TRANSACTIONS
+            WHEN NEW.stokvel_id IS NOT NULL
+                AND NEW.user_id IS NOT NULL
+                AND NEW.tx_type IS NOT NULL
+                AND strftime('%Y-%m', NEW.tx_date) IS NOT NULL
+            BEGIN
+                INSERT INTO MONTHLY_LEDGER (stokvel_id, user_id, month, tx_type, total_amount, tx_count)
+                VALUES (NEW.stokvel_id, NEW.user_id, strftime('%Y-%m', NEW.tx_date), NEW.tx_type, COALESCE(NEW.amount, 0), 1)
+                ON CONFLICT (stokvel_id, user_id, month, tx_type) DO UPDATE SET
+                    total_amount = total_amount + excluded.total_amount,
+                    tx_count = tx_count + 1;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS MONTHLY_LEDGER_AFTER_DELETE
+            AFTER DELETE ON TRANSACTIONS
+            BEGIN
+                UPDATE MONTHLY_LEDGER
+                SET total_amount = total_amount - COALESCE(OLD.amount, 0),
+                    tx_count = tx_count - 1
+                WHERE stokvel_id = OLD.stokvel_id
+                AND user_id = OLD.user_id
+                AND month = strftime('%Y-%m', OLD.tx_date)
+                AND tx_type = OLD.tx_type;
+                DELETE FROM MONTHLY_LEDGER WHERE tx_count <= 0;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS MONTHLY_LEDGER_AFTER_UPDATE
+            AFTER UPDATE OF stokvel_id, user_id, amount, tx_type, tx_date ON TRANSACTIONS
+            BEGIN
+                UPDATE MONTHLY_LEDGER
+                SET total_amount = total_amount - COALESCE(OLD.amount, 0),
+                    tx_count = tx_count - 1
+                WHERE stokvel_id = OLD.stokvel_id
+                AND user_id = OLD.user_id
+                AND month = strftime('%Y-%m', OLD.tx_date)
+                AND tx_type = OLD.tx_type;
+                DELETE FROM MONTHLY_LEDGER WHERE tx_count <= 0;
+                INSERT INTO MONTHLY_LEDGER (stokvel_id, user_id, month, tx_type, total_amount, tx_count)
+                SELECT NEW.stokvel_id, NEW.user_id, strftime('%Y-%m', NEW.tx_date), NEW.tx_type, COALESCE(NEW.amount, 0), 1
+                WHERE NEW.stokvel_id IS NOT NULL
+                    AND NEW.user_id IS NOT NULL
+                    AND NEW.tx_type IS NOT NULL
+                    AND strftime('%Y-%m', NEW.tx_date) IS NOT NULL
+                ON CONFLICT (stokvel_id, user_id, month, tx_type) DO UPDATE SET
+                    total_amount = total_amount + excluded.total_amount,
+                    tx_count = tx_count + 1;
+            END;
+            """,
+            # Backfill from the existing transactions. The triggers above keep it current from here
+            *REBUILD_MONTHLY_LEDGER_STATEMENTS,
+        ],
+    ),
+    (
+        5,
+        "Durable outbox for WhatsApp notifications",
+        [
+            # Rows are 'pending' until a sender claims them as 'sending', and end up 'sent'
+            # or 'failed'. A failed attempt goes back to 'pending' with a later next_attempt_at
+            """
+            CREATE TABLE IF NOT EXISTS NOTIFICATION_OUTBOX (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                to_number TEXT NOT NULL,
+                body TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP NOT NULL,
+                claimed_at TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP NOT NULL,
+                sent_at TIMESTAMP
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_status_next_attempt
+            ON NOTIFICATION_OUTBOX (status, next_attempt_at);
+            """,
+        ],
+    ),
+    (
+        6,
+        "Stokvel member summary read model for the WhatsApp summary and constitution",
+        [
+            # One row per stokvel member with their deposit and payout totals, the stokvel's
+            # active member count and its constitution, read by primary key
+            """
+            CREATE TABLE IF NOT EXISTS STOKVEL_MEMBER_SUMMARY (
+                stokvel_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                total_deposits NUMBER NOT NULL DEFAULT 0,
+                total_payouts NUMBER NOT NULL DEFAULT 0,
+                active_members INTEGER NOT NULL DEFAULT 0,
+                min_contributing_amount REAL,
+                max_number_of_contributors INTEGER,
+                stokvel_created_at TIMESTAMP,
+                PRIMARY KEY (stokvel_id, user_id)
+            );
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS STOKVEL_MEMBER_SUMMARY_AFTER_MEMBER_INSERT
+            AFTER INSERT ON STOKVEL_MEMBERS
+            BEGIN
+                INSERT INTO STOKVEL_MEMBER_SUMMARY (
+                    stokvel_id, user_id, total_deposits, total_payouts,
+                    min_contributing_amount, max_number_of_contributors, stokvel_created_at
+                )
+                SELECT
+                    s.stokvel_id,
+                    NEW.user_id,
+                    (SELECT COALESCE(SUM(amount), 0) FROM TRANSACTIONS
+                     WHERE stokvel_id = NEW.stokvel_id AND user_id = NEW.user_id AND tx_type = 'DEPOSIT'),
+                    (SELECT COALESCE(SUM(amount), 0) FROM TRANSACTIONS
+                     WHERE stokvel_id = NEW.stokvel_id AND user_id = NEW.user_id AND tx_type = 'PAYOUT'),
+                    s.min_contributing_amount,
+                    s.max_number_of_contributors,
+                    s.created_at
+                FROM STOKVELS s
+                WHERE s.stokvel_id = NEW.stokvel_id AND NEW.user_id IS NOT NULL
+                ON CONFLICT (stokvel_id, user_id) DO NOTHING;
+
+                UPDATE STOKVEL_MEMBER_SUMMARY
+                SET active_members = (
+                    SELECT COUNT(*)
+                    FROM STOKVEL_MEMBERS
+                    WHERE stokvel_id = NEW.stokvel_id
+                    AND active_status = 'active'
+                )
+                WHERE stokvel_id = NEW.stokvel_id;
+
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS STOKVEL_MEMBER_SUMMARY_AFTER_MEMBER_UPDATE
+            AFTER UPDATE OF active_status ON STOKVEL_MEMBERS
+            BEGIN
+
+                UPDATE STOKVEL_MEMBER_SUMMARY
+                SET active_members = (
+                    SELECT COUNT(*)
+                    FROM STOKVEL_MEMBERS
+                    WHERE stokvel_id = NEW.stokvel_id
+                    AND active_status = 'active'
+                )
+                WHERE stokvel_id = NEW.stokvel_id;
+
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS STOKVEL_MEMBER_SUMMARY_AFTER_MEMBER_DELETE
+            AFTER DELETE ON STOKVEL_MEMBERS
+            BEGIN
+                DELETE FROM STOKVEL_MEMBER_SUMMARY
+                WHERE stokvel_id = OLD.stokvel_id AND user_id = OLD.user_id;
+
+                UPDATE STOKVEL_MEMBER_SUMMARY
+                SET active_members = (
+                    SELECT COUNT(*)
+                    FROM STOKVEL_MEMBERS
+                    WHERE stokvel_id = OLD.stokvel_id
+                    AND active_status = 'active'
+                )
+                WHERE stokvel_id = OLD.stokvel_id;
+
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS STOKVEL_MEMBER_SUMMARY_AFTER_TRANSACTION_INSERT
+            AFTER INSERT ON TRANSACTIONS
+            WHEN NEW.tx_type IN ('DEPOSIT', 'PAYOUT')
+            BEGIN
+                UPDATE STOKVEL_MEMBER_SUMMARY
+                SET total_deposits = total_deposits + CASE WHEN NEW.tx_type = 'DEPOSIT' THEN COALESCE(NEW.amount, 0) ELSE 0 END,
+                    total_payouts = total_payouts + CASE WHEN NEW.tx_type = 'PAYOUT' THEN COALESCE(NEW.amount, 0) ELSE 0 END
+                WHERE stokvel_id = NEW.stokvel_id AND user_id = NEW.user_id;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS STOKVEL_MEMBER_SUMMARY_AFTER_TRANSACTION_DELETE
+            AFTER DELETE ON TRANSACTIONS
+            WHEN OLD.tx_type IN ('DEPOSIT', 'PAYOUT')
+            BEGIN
+                UPDATE STOKVEL_MEMBER_SUMMARY
+                SET total_deposits = total_deposits - CASE WHEN OLD.tx_type = 'DEPOSIT' THEN COALESCE(OLD.amount, 0) ELSE 0 END,
+                    total_payouts = total_payouts - CASE WHEN OLD.tx_type = 'PAYOUT' THEN COALESCE(OLD.amount, 0) ELSE 0 END
+                WHERE stokvel_id = OLD.stokvel_id AND user_id = OLD.user_id;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS STOKVEL_MEMBER_SUMMARY_AFTER_TRANSACTION_UPDATE
+            AFTER UPDATE OF stokvel_id, user_id, amount, tx_type ON TRANSACTIONS
+            BEGIN
+                UPDATE STOKVEL_MEMBER_SUMMARY
+                SET total_deposits = total_deposits - CASE WHEN OLD.tx_type = 'DEPOSIT' THEN COALESCE(OLD.amount, 0) ELSE 0 END,
+                    total_payouts = total_payouts - CASE WHEN OLD.tx_type = 'PAYOUT' THEN COALESCE(OLD.amount, 0) ELSE 0 END
+                WHERE stokvel_id = OLD.stokvel_id AND user_id = OLD.user_id;
+                UPDATE STOKVEL_MEMBER_SUMMARY
+                SET total_deposits = total_deposits + CASE WHEN NEW.tx_type = 'DEPOSIT' THEN COALESCE(NEW.amount, 0) ELSE 0 END,
+                    total_payouts = total_payouts + CASE WHEN NEW.tx_type = 'PAYOUT' THEN COALESCE(NEW.amount, 0) ELSE 0 END
+                WHERE stokvel_id = NEW.stokvel_id AND user_id = NEW.user_id;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS STOKVEL_MEMBER_SUMMARY_AFTER_STOKVEL_UPDATE
+            AFTER UPDATE OF min_contributing_amount, max_number_of_contributors, created_at ON STOKVELS
+            BEGIN
+                UPDATE STOKVEL_MEMBER_SUMMARY
+                SET min_contributing_amount = NEW.min_contributing_amount,
+                    max_number_of_contributors = NEW.max_number_of_contributors,
+                    stokvel_created_at = NEW.created_at
+                WHERE stokvel_id = NEW.stokvel_id;
+            END;
+            """,
+            # Backfill from the existing members. The triggers above keep it current from here
+            *REBUILD_STOKVEL_MEMBER_SUMMARY_STATEMENTS,
+        ],
+    ),
+    (
+        7,
+        "Idempotency key of every engine run member payment",
+        [
+            # Recorded as 'pending' before the ILP call and sent as its Idempotency-Key, so
+            # a resumed run repeats the call with the same key instead of paying twice
+            "ALTER TABLE ENGINE_RUN_MEMBERS ADD COLUMN idempotency_key TEXT",
+        ],
+    ),
+    (
+        8,
+        "Version of every WhatsApp session state row",
+        [
+            # Incremented by every save, so API workers can tell their cached session is stale
+            "ALTER TABLE STATE_MANAGEMENT ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        ],
+    ),
+    (
+        9,
+        "Payment attempts of every engine run member",
+        [
+            # Counted every time a member is recorded 'pending' before its ILP call, so a
+            # member that keeps failing is marked failed for good after a bounded number
+            "ALTER TABLE ENGINE_RUN_MEMBERS ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+        ],
+    ),
+]
+
+
+def create_schema_migrations_table(conn) -> None:
+    """
+    Create the SCHEMA_MIGRATIONS table that records which migrations have been applied.
+    """
+    conn.execute(
+        text(
+            """
+        CREATE TABLE IF NOT EXISTS SCHEMA_MIGRATIONS (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP
+        );
+        """
+        )
+    )
+    conn.commit()
+
+
+def run_migrations() -> List[int]:
+    """
+    Apply every pending migration in version order and record it in SCHEMA_MIGRATIONS.
+    Each migration is checked, applied and recorded in one exclusive transaction. A
+    migration that fails part way is rolled back as a whole and applied again on the
+    next run, and a process that starts while another one is migrating waits for its
+    lock and then skips the versions the other process recorded.
+
+    Returns:
+        List[int]: The versions applied by this run.
+    """
+    newly_applied = []
+
+    with sqlite_conn.connect() as conn:
+        create_schema_migrations_table(conn)
+        for version, description, statements in sorted(MIGRATIONS):
+            # Takes the write lock before the check, so no other process can apply the
+            # same version in between. SQLite rolls the DDL back with the transaction
+            conn.exec_driver_sql("BEGIN EXCLUSIVE")
+            try:
+                applied = conn.execute(
+                    text("SELECT 1 FROM SCHEMA_MIGRATIONS WHERE version = :version"),
+                    {"version": version},
+                ).first()
+                if applied:
+                    conn.rollback()
+                    continue
+                for statement in statements:
+                    conn.execute(text(statement))
+                conn.execute(
+                    text(
+                        """
+                    INSERT INTO SCHEMA_MIGRATIONS (version, description, applied_at)
+                    VALUES (:version, :description, :applied_at)
+                    """
+                    ),
+                    {
+                        "version": version,
+                        "description": description,
+                        "applied_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    },
+                )
+                conn.commit()
+                newly_applied.append(version)
+                print(f"Applied migration {version}: {description}")
+            except Exception as e:
+                print(f"Error applying migration {version}: {e}")
+                conn.rollback()
+                raise e
+
+    return newly_applied
+
+
+# Apply pending migrations before starting the API, from the repository root:
+# python -m database.migrations
+if __name__ == "__main__":
+    if not run_migrations():
+        print("Database schema is up to date.")
@@ -0,0 +1,52 @@
+from typing import List
+
+from sqlalchemy import text
+
+from database.sqlite_connection import sqlite_conn
+
+# Recomputes MONTHLY_LEDGER from TRANSACTIONS. Migration 4 backfills the ledger with
+# these statements, and rebuild_monthly_ledger repairs it
+REBUILD_MONTHLY_LEDGER_STATEMENTS: List[str] = [
+    "DELETE FROM MONTHLY_LEDGER",
+    """
+    INSERT INTO MONTHLY_LEDGER (stokvel_id, user_id, month, tx_type, total_amount, tx_count)
+    SELECT stokvel_id, user_id, strftime('%Y-%m', tx_date), tx_type, COALESCE(SUM(amount), 0), COUNT(*)
+    FROM TRANSACTIONS
+    WHERE stokvel_id IS NOT NULL
+    AND user_id IS NOT NULL
+    AND tx_type IS NOT NULL
+    AND strftime('%Y-%m', tx_date) IS NOT NULL
+    GROUP BY stokvel_id, user_id, strftime('%Y-%m', tx_date), tx_type
+    """,
+]
+
+
+def rebuild_monthly_ledger() -> int:
+    """
+    Empty MONTHLY_LEDGER and repopulate it from TRANSACTIONS in one transaction, to repair
+    a ledger that drifted from the transactions it totals. The write lock is taken
+    first, so no transaction is written between the two steps, and readers see either
+    the old ledger or the rebuilt one.
+
+    Returns:
+        int: The number of ledger rows written.
+    """
+    with sqlite_conn.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            delete_statement, insert_statement = REBUILD_MONTHLY_LEDGER_STATEMENTS
+            conn.execute(text(delete_statement))
+            result = conn.execute(text(insert_statement))
+            conn.commit()
+            return result.rowcount
+        except Exception as e:
+            print(f"Error rebuilding the monthly ledger: {e}")
+            conn.rollback()
+            raise e
+
+
+# Rebuild the ledger from the repository root, after migrating:
+# python -m database.monthly_ledger
+if __name__ == "__main__":
+    rows = rebuild_monthly_ledger()
+    print(f"Rebuilt MONTHLY_LEDGER with {rows} row(s).")
@@ -0,0 +1,161 @@
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import text
+
+from database.sqlite_connection import sqlite_conn
+
+
+def enqueue_notifications(messages: List[Tuple[str, str]]) -> None:
+    """
+    Add notifications to NOTIFICATION_OUTBOX in one transaction, due straight away.
+
+    Args:
+        messages (List[Tuple[str, str]]): The (to_number, body) of every notification.
+    """
+    if not messages:
+        return
+
+    now = datetime.now()
+    with sqlite_conn.connect() as conn:
+        try:
+            conn.execute(
+                text(
+                    """
+                INSERT INTO NOTIFICATION_OUTBOX (to_number, body, status, attempts, next_attempt_at, created_at)
+                VALUES (:to_number, :body, 'pending', 0, :now, :now)
+                """
+                ),
+                [
+                    {"to_number": to_number, "body": body, "now": now}
+                    for to_number, body in messages
+                ],
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Error queueing notifications: {e}")
+            conn.rollback()
+            raise e
+
+
+def claim_notifications(limit: int, stale_before: datetime) -> List[Dict[str, Any]]:
+    """
+    Mark the oldest due notifications as 'sending' and return them, oldest first.
+    Notifications left 'sending' since before `stale_before`, by a sender that stopped
+    part way, are claimed again.
+
+    Args:
+        limit (int): The most notifications to claim.
+        stale_before (datetime): The claim time before which a 'sending' notification is abandoned.
+
+    Returns:
+        List[Dict[str, Any]]: The id, to_number, body and attempts of every claimed notification.
+    """
+    now = datetime.now()
+    with sqlite_conn.connect() as conn:
+        try:
+            rows = (
+                conn.execute(
+                    text(
+                        """
+                    UPDATE NOTIFICATION_OUTBOX
+                    SET status = 'sending', claimed_at = :now
+                    WHERE id IN (
+                        SELECT id
+                        FROM NOTIFICATION_OUTBOX
+                        WHERE (status = 'pending' AND next_attempt_at <= :now)
+                        OR (status = 'sending' AND claimed_at <= :stale_before)
+                        ORDER BY id
+                        LIMIT :limit
+                    )
+                    RETURNING id, to_number, body, attempts
+                    """
+                    ),
+                    {"now": now, "stale_before": stale_before, "limit": limit},
+                )
+                .mappings()
+                .all()
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Error claiming notifications: {e}")
+            conn.rollback()
+            raise e
+
+    return sorted((dict(row) for row in rows), key=lambda row: row["id"])
+
+
+def settle_notifications(
+    sent_ids: List[int],
+    retries: List[Dict[str, Any]],
+    failures: List[Dict[str, Any]],
+) -> None:
+    """
+    Record the outcome of a batch of claimed notifications in one transaction.
+
+    Args:
+        sent_ids (List[int]): The notifications that were sent.
+        retries (List[Dict[str, Any]]): The notifications to try again, each with its id,
+            next_attempt_at, last_error and whether it was `attempted` (0 or 1).
+        failures (List[Dict[str, Any]]): The notifications that will not be retried, each
+            with its id and last_error.
+    """
+    now = datetime.now()
+    with sqlite_conn.connect() as conn:
+        try:
+            if sent_ids:
+                conn.execute(
+                    text(
+                        """
+                    UPDATE NOTIFICATION_OUTBOX
+                    SET status = 'sent', attempts = attempts + 1, sent_at = :now, last_error = NULL
+                    WHERE id = :id
+                    """
+                    ),
+                    [
+                        {"id": notification_id, "now": now}
+                        for notification_id in sent_ids
+                    ],
+                )
+            if retries:
+                conn.execute(
+                    text(
+                        """
+                    UPDATE NOTIFICATION_OUTBOX
+                    SET status = 'pending',
+                        attempts = attempts + :attempted,
+                        next_attempt_at = :next_attempt_at,
+                        last_error = :last_error,
+                        claimed_at = NULL
+                    WHERE id = :id
+                    """
+                    ),
+                    retries,
+                )
+            if failures:
+                conn.execute(
+                    text(
+                        """
+                    UPDATE NOTIFICATION_OUTBOX
+                    SET status = 'failed', attempts = attempts + 1, last_error = :last_error
+                    WHERE id = :id
+                    """
+                    ),
+                    failures,
+                )
+            conn.commit()
+        except Exception as e:
+            print(f"Error recording notification results: {e}")
+            conn.rollback()
+            raise e
+
+
+def count_notifications_by_status() -> Dict[str, int]:
+    """
+    Count the notifications in NOTIFICATION_OUTBOX per status.
+    """
+    with sqlite_conn.connect() as conn:
+        result = conn.execute(
+            text("SELECT status, COUNT(*) FROM NOTIFICATION_OUTBOX GROUP BY status")
+        )
+        return {status: count for status, count in result}
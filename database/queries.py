@@ -5,21 +5,11 @@ from typing import Optional
 
 from sqlalchemy import text
 
-from .sqlite_connection import SQLiteConnection
+from .sqlite_connection import sqlite_conn
 
-sqlite_conn = SQLiteConnection(database="./database/test_db.db")
 # sql_conn = sql_connection()
 
 
-def get_next_unique_id(conn, table_name, id_column):
-    """
-    Get the next unique id for the given table and id column.
-    """
-    result = conn.execute(text(f"SELECT MAX({id_column}) FROM {table_name}")).fetchone()
-    # If no result exists (table is empty), return 1, otherwise increment the max id
-    return (result[0] or 0) + 1
-
-
 def check_if_number_exists_sqlite(from_number: str) -> bool:
     """
     docstring
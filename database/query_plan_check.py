@@ -0,0 +1,90 @@
+import re
+import sys
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql.elements import TextClause
+
+from database.azure_function_queries.named_queries import query_registry
+from database.sqlite_connection import sqlite_conn
+from database.state_manager.session import SESSION_QUERY
+
+# Hot lookups made by the WhatsApp message flow outside of the named query registry
+HOT_QUERIES: Dict[str, str] = {
+    "user_by_number": "SELECT * FROM USERS WHERE user_number = :user_number",
+    "state_by_user_number": "SELECT * FROM STATE_MANAGEMENT WHERE user_number = :user_number",
+    "stokvel_by_name": "SELECT stokvel_id FROM STOKVELS WHERE stokvel_name = :stokvel_name",
+    "stokvel_interest_since": (
+        "SELECT interest_value, date FROM INTEREST WHERE stokvel_id = :stokvel_id AND date > :prev_payout"
+    ),
+    "user_session": SESSION_QUERY,
+}
+
+# Intermediate results SQLite builds while running a query, e.g. CTEs and subqueries
+MATERIALIZED_PATTERN = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\S+)")
+SCAN_PATTERN = re.compile(r"^SCAN (?:TABLE )?(?!CONSTANT ROW)(\S+)")
+
+
+def find_full_scans(conn: Connection, statement: TextClause) -> List[str]:
+    """
+    Runs EXPLAIN QUERY PLAN for a statement and returns every step that walks a whole
+    table or index instead of searching it. Scans of materialized CTEs and subqueries
+    are not table scans.
+
+    Args:
+        conn (Connection): The connection to explain the statement on.
+        statement (TextClause): The statement to explain.
+
+    Returns:
+        List[str]: The plan details of the full table scans, empty if there are none.
+    """
+    params = {name: None for name in statement.compile().params}
+    plan = conn.execute(text(f"EXPLAIN QUERY PLAN {statement.text}"), params)
+    details = [row[3] for row in plan]
+
+    materialized = {
+        match.group(1)
+        for match in (MATERIALIZED_PATTERN.match(detail) for detail in details)
+        if match
+    }
+    # The plan names a materialized CTE by the alias it is joined under
+    for name in list(materialized):
+        materialized.update(
+            re.findall(rf"\b{re.escape(name)}\s+(?:AS\s+)?(\w+)", statement.text, re.I)
+        )
+    return [
+        detail
+        for detail in details
+        if (match := SCAN_PATTERN.match(detail)) and match.group(1) not in materialized
+    ]
+
+
+def check_query_plans() -> Dict[str, List[str]]:
+    """
+    Checks the plan of every registered named query and every hot WhatsApp lookup.
+
+    Returns:
+        Dict[str, List[str]]: The full table scans of each query that has any, keyed by query name.
+    """
+    statements = {name: query.statement for name, query in query_registry.items()}
+    statements.update({name: text(sql) for name, sql in HOT_QUERIES.items()})
+
+    failures = {}
+    with sqlite_conn.connect() as conn:
+        for name, statement in statements.items():
+            scans = find_full_scans(conn, statement)
+            if scans:
+                failures[name] = scans
+    return failures
+
+
+# Run from the repository root with: python -m database.query_plan_check
+if __name__ == "__main__":
+    full_scans = check_query_plans()
+    for query_name, query_scans in full_scans.items():
+        print(f"{query_name} falls back to a full scan: {'; '.join(query_scans)}")
+    if full_scans:
+        print("Apply pending migrations with: python -m database.migrations")
+        sys.exit(1)
+    print("Every hot query is served by an index.")
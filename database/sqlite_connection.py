@@ -1,8 +1,35 @@
 import logging
 import os
+import threading
+from typing import Dict
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+SQLITE_DATABASE_PATH = os.getenv("SQLITE_DATABASE_PATH", "./database/test_db.db")
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "10"))
+# How long a connection waits on a locked database before raising "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# NORMAL is durable under WAL except for the last commits on power loss
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+
+def configure_sqlite_connection(dbapi_connection, connection_record) -> None:
+    """
+    Applies the journaling, locking and durability settings to every new pooled connection.
+    WAL lets readers run alongside a writer, and the busy timeout makes a writer wait for
+    the lock instead of failing straight away.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    finally:
+        cursor.close()
 
 
 class SQLiteConnection:
@@ -10,11 +37,17 @@ class SQLiteConnection:
     This class manages the SQL connection to an SQLite database. It encapsulates the connection details,
     such as the database file path. It provides methods to get an engine, a session, and a connection.
 
+    Engines are shared process-wide per database file, so every SQLiteConnection for the same file
+    draws from one connection pool.
+
     Args:
         database (str): The name of the SQLite database file to connect to.
         _engine (sqlalchemy.engine): The engine that is used to interact with the database.
     """
 
+    _engines: Dict[str, Engine] = {}
+    _engines_lock = threading.Lock()
+
     def __init__(self, database=None):
         """
         The constructor for the SQLiteConnection. It initializes the connection parameters.
@@ -39,17 +72,44 @@ class SQLiteConnection:
             Exception: An error occurred creating the engine.
         """
 
-        if not os.path.exists(self.database):
-            raise FileNotFoundError(f"SQLite database file '{self.database}' not found")
-
         if not self._engine:
-            try:
-                self._engine = create_engine(f"sqlite:///{self.database}")
-            except Exception as e:
-                logging.error("Error creating SQL engine: %s", e)
-                raise
+            self._engine = self._get_shared_engine(self.database)
         return self._engine
 
+    @classmethod
+    def _get_shared_engine(cls, database: str) -> Engine:
+        """
+        Returns the pooled engine for a database file, creating it on first use.
+
+        Raises:
+            FileNotFoundError: The database file does not exist.
+            Exception: An error occurred creating the engine.
+        """
+        key = os.path.abspath(database)
+        with cls._engines_lock:
+            if key not in cls._engines:
+                if not os.path.exists(database):
+                    raise FileNotFoundError(
+                        f"SQLite database file '{database}' not found"
+                    )
+                try:
+                    engine = create_engine(
+                        f"sqlite:///{database}",
+                        poolclass=QueuePool,
+                        pool_size=SQLITE_POOL_SIZE,
+                        max_overflow=SQLITE_MAX_OVERFLOW,
+                        connect_args={
+                            "check_same_thread": False,
+                            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+                        },
+                    )
+                    event.listen(engine, "connect", configure_sqlite_connection)
+                except Exception as e:
+                    logging.error("Error creating SQL engine: %s", e)
+                    raise
+                cls._engines[key] = engine
+            return cls._engines[key]
+
     def get_session(self):
         """
         This method returns a sqlalchemy session that is bound to the engine.
@@ -97,6 +157,10 @@ class SQLiteConnection:
             return response
 
 
+# The connection shared by every query module
+sqlite_conn = SQLiteConnection(database=SQLITE_DATABASE_PATH)
+
+
 # Usage example
 if __name__ == "__main__":
     test_connection = SQLiteConnection(database="./database/test_db.db")
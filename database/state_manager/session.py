@@ -0,0 +1,371 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from database.sqlite_connection import sqlite_conn
+from database.utils import extract_whatsapp_number
+
+# Conversations left idle for longer than this start again from an empty stack
+INACTIVITY_TIMEOUT = timedelta(hours=1)
+# Most conversations kept in memory before the least recently used one is saved and dropped
+STATE_CACHE_MAX_SESSIONS = int(os.getenv("STATE_CACHE_MAX_SESSIONS", "1000"))
+# How often changed conversations are written back to STATE_MANAGEMENT
+STATE_CACHE_FLUSH_SECONDS = float(os.getenv("STATE_CACHE_FLUSH_SECONDS", "2"))
+
+# Everything a WhatsApp message needs to know about its sender, in one round trip
+SESSION_QUERY = """
+SELECT
+    EXISTS (SELECT 1 FROM USERS WHERE user_number = :user_number) AS registered,
+    EXISTS (
+        SELECT 1
+        FROM USERS u
+        JOIN ADMIN a ON a.user_id = u.user_id
+        WHERE u.user_number = :user_number
+    ) AS is_admin,
+    sm.id AS state_id,
+    sm.version,
+    sm.stack_state,
+    sm.last_interaction,
+    sm.current_stokvel
+FROM (SELECT :user_number AS user_number) q
+LEFT JOIN STATE_MANAGEMENT sm ON sm.user_number = q.user_number
+ORDER BY sm.id
+LIMIT 1
+"""
+
+INSERT_STATE_QUERY = """
+INSERT INTO STATE_MANAGEMENT (user_number, last_interaction, stack_state, current_stokvel, version)
+VALUES (:user_number, :last_interaction, :stack_state, :current_stokvel, 1)
+RETURNING id, version
+"""
+
+# Every save increments the version, so other processes know their cached copy is stale
+UPDATE_STATE_QUERY = """
+UPDATE STATE_MANAGEMENT
+SET last_interaction = :last_interaction,
+    stack_state = :stack_state,
+    current_stokvel = :current_stokvel,
+    version = version + 1
+WHERE id = :state_id
+RETURNING id, version
+"""
+
+STATE_VERSION_QUERY = """
+SELECT version
+FROM STATE_MANAGEMENT
+WHERE user_number = :user_number
+ORDER BY id
+LIMIT 1
+"""
+
+INVALIDATE_STATE_QUERY = """
+UPDATE STATE_MANAGEMENT SET version = version + 1 WHERE user_number = :user_number
+"""
+
+
+class UserSession:
+    """
+    The conversation state of one WhatsApp user. Registration and admin status, the
+    state stack, the last interaction and the stokvel selection are read in one query,
+    changed in memory, and written back with one statement by `flush`. `version` is the
+    version of the state row the session was last read from or written to.
+
+    Sessions are shared between the requests of a process through `session_cache`, so
+    every change is made under the session's lock.
+
+    Args:
+        from_number (str): The user's phone number, with or without the 'whatsapp:' prefix.
+    """
+
+    def __init__(self, from_number: str) -> None:
+        self.user_number = extract_whatsapp_number(from_number=from_number)
+        self.registration_status = False
+        self.is_admin = False
+        self.stack_state: List[str] = []
+        self.last_interaction: Optional[datetime] = None
+        self.current_stokvel: Optional[str] = None
+        self.version: Optional[int] = None
+        self._state_id: Optional[int] = None
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    def load(self) -> None:
+        """
+        Reads the session from the database. A user without a state row gets an empty
+        stack, and an inactive stack is cleared. Both are only persisted by the next `flush`.
+        """
+        with sqlite_conn.connect() as conn:
+            try:
+                row = (
+                    conn.execute(text(SESSION_QUERY), {"user_number": self.user_number})
+                    .mappings()
+                    .one()
+                )
+            except Exception as e:
+                print(f"An error occurred loading the user session: {e}")
+                raise e
+
+        with self._lock:
+            self.registration_status = bool(row["registered"])
+            self.is_admin = bool(row["is_admin"])
+            self._state_id = row["state_id"]
+            self.version = row["version"]
+            self.stack_state = (
+                json.loads(row["stack_state"]) if row["stack_state"] else []
+            )
+            self.last_interaction = (
+                datetime.fromisoformat(row["last_interaction"])
+                if row["last_interaction"]
+                else None
+            )
+            self.current_stokvel = row["current_stokvel"]
+
+            if self._state_id is not None:
+                self._dirty = False
+                self.reset_if_inactive()
+            else:
+                self.last_interaction = datetime.now()
+                self._dirty = True
+
+    def is_current(self) -> bool:
+        """
+        Whether this session is still the latest version of the user's state. A session
+        with unsaved changes is current, because its changes are saved with the reply.
+        Otherwise the version of the state row is read again, and it differs if another
+        process saved or invalidated the session since this one last read or wrote it.
+        """
+        with self._lock:
+            if self._dirty:
+                return True
+            with sqlite_conn.connect() as conn:
+                version = conn.execute(
+                    text(STATE_VERSION_QUERY), {"user_number": self.user_number}
+                ).scalar()
+            return version == self.version
+
+    def is_inactive(self) -> bool:
+        """
+        Whether the user has not interacted for longer than INACTIVITY_TIMEOUT.
+        """
+        return (
+            self.last_interaction is None
+            or datetime.now() - self.last_interaction > INACTIVITY_TIMEOUT
+        )
+
+    def reset_if_inactive(self) -> None:
+        """
+        Clears the state stack if the user has been inactive for longer than INACTIVITY_TIMEOUT.
+        """
+        with self._lock:
+            if self.is_inactive():
+                self.clear_states()
+
+    @property
+    def current_state_tag(self) -> Optional[str]:
+        """
+        The tag on top of the state stack, or None if the stack is empty.
+        """
+        with self._lock:
+            return self.stack_state[-1] if self.stack_state else None
+
+    def push_state(self, tag: str) -> None:
+        """
+        Pushes a state tag onto the stack and records the interaction.
+        """
+        with self._lock:
+            self.stack_state.append(tag)
+            self.last_interaction = datetime.now()
+            self._dirty = True
+
+    def pop_state(self) -> None:
+        """
+        Pops the current state tag off the stack, if there is one.
+        """
+        with self._lock:
+            if self.stack_state:
+                self.stack_state.pop()
+                self._dirty = True
+
+    def clear_states(self) -> None:
+        """
+        Empties the state stack and records the interaction.
+        """
+        with self._lock:
+            self.stack_state = []
+            self.last_interaction = datetime.now()
+            self._dirty = True
+
+    def get_stokvel_selection(self) -> Optional[str]:
+        """
+        Returns the stokvel the user currently has selected.
+        """
+        return self.current_stokvel
+
+    def set_stokvel_selection(self, stokvel_selection: str) -> None:
+        """
+        Selects the stokvel that subsequent action requests apply to.
+        """
+        with self._lock:
+            self.current_stokvel = stokvel_selection
+            self._dirty = True
+
+    def flush(self) -> None:
+        """
+        Writes the session back with a single INSERT or UPDATE, if anything changed.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+
+            parameters = {
+                "user_number": self.user_number,
+                "last_interaction": self.last_interaction,
+                "stack_state": json.dumps(self.stack_state),
+                "current_stokvel": self.current_stokvel,
+            }
+            with sqlite_conn.connect() as conn:
+                try:
+                    row = None
+                    if self._state_id is not None:
+                        row = conn.execute(
+                            text(UPDATE_STATE_QUERY),
+                            {**parameters, "state_id": self._state_id},
+                        ).first()
+                    # A new user, or a state row that was deleted since it was read
+                    if row is None:
+                        row = conn.execute(text(INSERT_STATE_QUERY), parameters).one()
+                    conn.commit()
+                except Exception as e:
+                    print(f"An error occurred saving the user session: {e}")
+                    conn.rollback()
+                    raise e
+
+            self._state_id, self.version = row.id, row.version
+            self._dirty = False
+
+
+class SessionCache:
+    """
+    Keeps the sessions of active conversations in memory, so a message usually only
+    reads the version of the user's state row instead of loading the session. The
+    changes a message makes are written back once, when it is answered, and changes made
+    outside a message are written back in the background every `flush_interval` seconds
+    (write-behind). Sessions inactive for INACTIVITY_TIMEOUT are dropped, and the least
+    recently used session is dropped once `max_sessions` is reached. A session is always
+    saved before it is dropped.
+
+    Each API worker process has its own cache. Every save increments the version of the
+    state row, so a process whose cached session is older loads it again. Code that
+    changes USERS, ADMIN or STATE_MANAGEMENT rows of a user directly must call
+    `invalidate` for that user.
+
+    Args:
+        max_sessions (int): The most sessions kept in memory.
+        flush_interval (float): Seconds between background flushes.
+    """
+
+    def __init__(self, max_sessions: int, flush_interval: float) -> None:
+        self.max_sessions = max_sessions
+        self.flush_interval = flush_interval
+        self._sessions: "OrderedDict[str, UserSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+
+    def get(self, from_number: str) -> UserSession:
+        """
+        Returns the user's session, loading it from the database if it is not cached,
+        or if another process changed it since it was cached.
+        """
+        user_number = extract_whatsapp_number(from_number=from_number)
+        with self._lock:
+            session = self._sessions.get(user_number)
+            if session is not None:
+                self._sessions.move_to_end(user_number)
+
+        if session is not None:
+            if session.is_current():
+                session.reset_if_inactive()
+                return session
+            with self._lock:
+                if self._sessions.get(user_number) is session:
+                    del self._sessions[user_number]
+
+        loaded = UserSession(from_number=user_number)
+        loaded.load()
+        evicted = []
+        with self._lock:
+            # Another request for the same user may have loaded it in the meantime
+            session = self._sessions.setdefault(user_number, loaded)
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[1])
+        for evicted_session in evicted:
+            evicted_session.flush()
+
+        self._start_flusher()
+        return session
+
+    def invalidate(self, from_number: str) -> None:
+        """
+        Saves and drops the user's session, and increments the version of its state row
+        so other processes drop their copies too. The next message reads it from the database.
+        """
+        user_number = extract_whatsapp_number(from_number=from_number)
+        with self._lock:
+            session = self._sessions.pop(user_number, None)
+        if session is not None:
+            session.flush()
+
+        with sqlite_conn.connect() as conn:
+            try:
+                conn.execute(text(INVALIDATE_STATE_QUERY), {"user_number": user_number})
+                conn.commit()
+            except Exception as e:
+                print(f"An error occurred invalidating the user session: {e}")
+                conn.rollback()
+                raise e
+
+    def flush_all(self) -> None:
+        """
+        Saves every changed session and drops the inactive ones.
+        """
+        with self._lock:
+            sessions = list(self._sessions.items())
+
+        for user_number, session in sessions:
+            try:
+                session.flush()
+            except Exception as e:
+                print(f"An error occurred flushing the session of {user_number}: {e}")
+                continue
+
+            if session.is_inactive():
+                with self._lock:
+                    if self._sessions.get(user_number) is session:
+                        del self._sessions[user_number]
+
+    def _start_flusher(self) -> None:
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name="state-cache-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush_all()
+
+
+session_cache = SessionCache(
+    max_sessions=STATE_CACHE_MAX_SESSIONS, flush_interval=STATE_CACHE_FLUSH_SECONDS
+)
+atexit.register(session_cache.flush_all)
@@ -1,15 +1,23 @@
 import sqlite3
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import text
-
-from database.sqlite_connection import SQLiteConnection
+from sqlalchemy import bindparam, text
+
+from database.id_allocator import insert_with_generated_id
+from database.identity_cache import identity_cache
+from database.interest_allocation import (
+    allocate_balance_weighted_interest,
+    pivot_rows,
+    previous_month,
+)
+from database.sqlite_connection import sqlite_conn
+from database.state_manager.session import session_cache
+from database.user_queries.linked_stokvels_cache import linked_stokvels_cache
 from database.utils import extract_whatsapp_number
 
-sqlite_conn = SQLiteConnection(database="./database/test_db.db")
-
 
 def get_user_deposits_and_payouts_per_stokvel(phone_number: str, stokvel_name: str):
     """
@@ -22,29 +30,28 @@ def get_user_deposits_and_payouts_per_stokvel(phone_number: str, stokvel_name: s
     Returns:
         dict: A dictionary containing the user's total deposit and payout amounts.
     """
-    from_number = extract_whatsapp_number(from_number=phone_number)
+    user_id = identity_cache.get_user_id(phone_number)
+    stokvel_id = identity_cache.get_stokvel_id(stokvel_name)
 
     # Updated query to find total deposits and payouts for a specific user and stokvel
     query = """
     SELECT
-        SUM(CASE WHEN t.tx_type = 'DEPOSIT' THEN t.amount ELSE 0 END) AS total_deposits,
-        SUM(CASE WHEN t.tx_type = 'PAYOUT' THEN t.amount ELSE 0 END) AS total_payouts
+        SUM(CASE WHEN l.tx_type = 'DEPOSIT' THEN l.total_amount ELSE 0 END) AS total_deposits,
+        SUM(CASE WHEN l.tx_type = 'PAYOUT' THEN l.total_amount ELSE 0 END) AS total_payouts
     FROM
-        USERS u
-    JOIN
-        TRANSACTIONS t ON u.user_id = t.user_id
+        MONTHLY_LEDGER l
     WHERE
-        u.user_number = :user_number
-        AND t.stokvel_id = (SELECT stokvel_id FROM STOKVELS WHERE stokvel_name = :stokvel_name)
+        l.stokvel_id = :stokvel_id
+        AND l.user_id = :user_id
     GROUP BY
-        u.user_id;
+        l.user_id;
     """
 
     # Executing the query using the SQLite connection
     with sqlite_conn.connect() as conn:
         try:
             result = conn.execute(
-                text(query), {"user_number": from_number, "stokvel_name": stokvel_name}
+                text(query), {"user_id": user_id, "stokvel_id": stokvel_id}
             ).fetchone()
 
             if not result:
@@ -77,14 +84,14 @@ def get_deposits_per_stokvel(stokvel_name: str):
     # Updated query to fetch the total deposits using stokvel_id from the STOKVELS table
     query = """
     SELECT
-        SUM(t.amount) AS total_deposits
+        SUM(l.total_amount) AS total_deposits
     FROM
-        TRANSACTIONS t
+        MONTHLY_LEDGER l
     WHERE
-        t.stokvel_id = (SELECT stokvel_id FROM STOKVELS WHERE stokvel_name = :stokvel_name)
-        AND t.tx_type = 'DEPOSIT'
+        l.stokvel_id = :stokvel_id
+        AND l.tx_type = 'DEPOSIT'
     GROUP BY
-        t.stokvel_id;
+        l.stokvel_id;
     """
 
     # Executing the query using the SQLite connection
@@ -92,7 +99,8 @@ def get_deposits_per_stokvel(stokvel_name: str):
         try:
 
             result = conn.execute(
-                text(query), {"stokvel_name": stokvel_name}
+                text(query),
+                {"stokvel_id": identity_cache.get_stokvel_id(stokvel_name)},
             ).fetchone()
 
             if not result:
@@ -127,7 +135,7 @@ def get_nr_of_active_users_per_stokvel(stokvel_name: str):
     FROM
         STOKVEL_MEMBERS sm
     WHERE
-        sm.stokvel_id = (SELECT s.stokvel_id FROM STOKVELS s WHERE s.stokvel_name = :stokvel_name)
+        sm.stokvel_id = :stokvel_id
         AND sm.active_status = 'active';
     """
     # Executing the query using the SQLite connection
@@ -135,7 +143,8 @@ def get_nr_of_active_users_per_stokvel(stokvel_name: str):
         try:
 
             result = conn.execute(
-                text(query), {"stokvel_name": stokvel_name}
+                text(query),
+                {"stokvel_id": identity_cache.get_stokvel_id(stokvel_name)},
             ).fetchone()
 
             if not result or result[0] is None:
@@ -165,10 +174,12 @@ def get_stokvel_constitution(phone_number: str, stokvel_name: str):
         dict: A dictionary containing the stokvel's constitution details, including the minimum contribution amount,
               maximum number of contributors, and creation date.
     """
-    # Step 1: Format the phone number (if necessary, similar to `extract_whatsapp_number`)
+    # Step 1: Resolve the user and the stokvel
     formatted_number = extract_whatsapp_number(phone_number)
+    user_id = identity_cache.get_user_id(formatted_number)
+    stokvel_id = identity_cache.get_stokvel_id(stokvel_name)
 
-    # Step 2: SQL query to find stokvel details using USERS to validate membership
+    # Step 2: SQL query to find stokvel details using STOKVEL_MEMBERS to validate membership
     query = """
     SELECT
         s.min_contributing_amount AS minimum_contributing_amount,
@@ -178,11 +189,9 @@ def get_stokvel_constitution(phone_number: str, stokvel_name: str):
         STOKVELS s
     JOIN
         STOKVEL_MEMBERS sm ON s.stokvel_id = sm.stokvel_id
-    JOIN
-        USERS u ON sm.user_id = u.user_id
     WHERE
-        s.stokvel_name = :stokvel_name
-        AND u.user_number = :user_number;
+        s.stokvel_id = :stokvel_id
+        AND sm.user_id = :user_id;
     """
 
     # Step 3: Execute the query using the SQLite connection
@@ -191,7 +200,7 @@ def get_stokvel_constitution(phone_number: str, stokvel_name: str):
 
             result = conn.execute(
                 text(query),
-                {"stokvel_name": stokvel_name, "user_number": formatted_number},
+                {"stokvel_id": stokvel_id, "user_id": user_id},
             ).fetchone()
 
             if not result:
@@ -211,25 +220,65 @@ def get_stokvel_constitution(phone_number: str, stokvel_name: str):
             raise e
 
 
-def get_stokvel_id_by_name(stokvel_name) -> Optional[str]:
+def get_stokvel_member_summary(phone_number: str, stokvel_name: str) -> Optional[Dict]:
+    """
+    Retrieve a member's summary of a stokvel from STOKVEL_MEMBER_SUMMARY by primary key.
+
+    Args:
+        phone_number (str): The user's phone number.
+        stokvel_name (str): The name of the stokvel.
+
+    Returns:
+        Optional[Dict]: The stokvel_name, the user's total_deposits and total_payouts, the
+            nr_of_active_users, and the minimum_contributing_amount, max_number_of_contributors
+            and creation_date of the stokvel, or None if the user is not a member.
     """
-    docstring
+    query = """
+    SELECT
+        total_deposits,
+        total_payouts,
+        active_members AS nr_of_active_users,
+        min_contributing_amount AS minimum_contributing_amount,
+        max_number_of_contributors,
+        stokvel_created_at AS creation_date
+    FROM
+        STOKVEL_MEMBER_SUMMARY
+    WHERE
+        stokvel_id = :stokvel_id
+        AND user_id = :user_id;
     """
-    print(stokvel_name)
-    query = "SELECT stokvel_id FROM STOKVELS WHERE stokvel_name = :stokvel_name"
+
     with sqlite_conn.connect() as conn:
         try:
+            result = (
+                conn.execute(
+                    text(query),
+                    {
+                        "stokvel_id": identity_cache.get_stokvel_id(stokvel_name),
+                        "user_id": identity_cache.get_user_id(phone_number),
+                    },
+                )
+                .mappings()
+                .fetchone()
+            )
+            return {"stokvel_name": stokvel_name, **result} if result else None
+        except Exception as e:
+            print("Exception occured in get_stokvel_member_summary: ", e)
+            raise e
 
-            cursor = conn.execute(text(query), {"stokvel_name": stokvel_name})
-            result = cursor.fetchone()[0]
-            print(result)
-            if result:
-                return result
 
-            return None
-        except Exception as e:
-            print("Exception occured in get_stokvel_id_by_name: ", e)
-            raise
+def get_stokvel_id_by_name(stokvel_name) -> int:
+    """
+    Returns the stokvel_id of a stokvel name, raising a ValueError if no stokvel has the name.
+    """
+    try:
+        stokvel_id = identity_cache.get_stokvel_id(stokvel_name)
+        if stokvel_id is None:
+            raise ValueError(f"No stokvel found with the name {stokvel_name}")
+        return stokvel_id
+    except Exception as e:
+        print("Exception occured in get_stokvel_id_by_name: ", e)
+        raise
 
 
 def get_admin_by_stokvel(stokvel_id):
@@ -369,12 +418,23 @@ def get_all_applications(user_id):
             raise e
 
 
+# Counts the members of a stokvel as it is inserted, on the server, so total_members never
+# starts from a count supplied by the client
+SEED_STOKVEL_MEMBERS_COUNT_QUERY = """
+    UPDATE STOKVELS
+    SET total_members = (
+        SELECT COUNT(*) FROM STOKVEL_MEMBERS WHERE stokvel_id = :stokvel_id
+    )
+    WHERE stokvel_id = :stokvel_id
+    RETURNING total_members
+"""
+
+
 def insert_stokvel(
     stokvel_id: Optional[int],
     stokvel_name: str,  # unique constraint here
     ILP_wallet: str,
     MOMO_wallet: str,
-    total_members: Optional[int],
     min_contributing_amount: float,
     max_number_of_contributors: int,
     total_contributions: float,
@@ -384,11 +444,15 @@ def insert_stokvel(
     contribution_period: str,
     created_at: Optional[str] = None,
     updated_at: Optional[str] = None,
-) -> str:
+) -> Optional[int]:
     # Need to look at refactoring this
 
     """
     Inserts a new stokvel into the STOKVELS table AND returns the retrieved id of the stokvel
+
+    total_members is seeded from the stokvel's rows in STOKVEL_MEMBERS in the same
+    transaction, and only changes through seat claims after that. Raises ValueError if
+    max_number_of_contributors is below it.
     """
 
     if created_at is None:
@@ -417,7 +481,7 @@ def insert_stokvel(
             :stokvel_name,
             :ILP_wallet,
             :MOMO_wallet,
-            :total_members,
+            0,
             :min_contributing_amount,
             :max_number_of_contributors,
             :total_contributions,
@@ -436,7 +500,6 @@ def insert_stokvel(
         "stokvel_name": stokvel_name,
         "ILP_wallet": ILP_wallet,
         "MOMO_wallet": MOMO_wallet,
-        "total_members": total_members,
         "min_contributing_amount": min_contributing_amount,
         "max_number_of_contributors": max_number_of_contributors,
         "total_contributions": total_contributions,
@@ -448,20 +511,32 @@ def insert_stokvel(
         "contribution_period": contribution_period,
     }
 
-    stokvel_current_id = ""
+    stokvel_current_id: Optional[int] = None
     with sqlite_conn.connect() as conn:
         try:
             if stokvel_id is None:
-                stokvel_current_id = get_next_unique_id(conn, "STOKVELS", "stokvel_id")
-                parameters["stokvel_id"] = stokvel_current_id
-
-            result = conn.execute(text(insert_query), parameters)
+                stokvel_current_id = insert_with_generated_id(
+                    conn, insert_query, parameters, id_column="stokvel_id"
+                )
+            else:
+                result = conn.execute(text(insert_query), parameters)
+                stokvel_current_id = stokvel_id if result.rowcount > 0 else None
+
+            if stokvel_current_id is not None:
+                total_members = conn.execute(
+                    text(SEED_STOKVEL_MEMBERS_COUNT_QUERY),
+                    {"stokvel_id": stokvel_current_id},
+                ).scalar_one()
+                if max_number_of_contributors < total_members:
+                    raise ValueError(
+                        f"The stokvel allows {max_number_of_contributors} contributors, "
+                        f"but already has {total_members} members."
+                    )
             conn.commit()
 
-            if result.rowcount > 0:
-                print(f"Insert successful, {result.rowcount} row(s) affected.")
+            if stokvel_current_id is not None:
+                print(f"Insert successful, stokvel id {stokvel_current_id}.")
                 print("insert stokvel successful")
-
             else:
                 print("Insert failed.")
 
@@ -502,10 +577,89 @@ def check_if_stokvel_member(user_id, stokvel_id):
             raise e
 
 
+INSERT_STOKVEL_MEMBER_QUERY = """
+    INSERT INTO STOKVEL_MEMBERS (
+        stokvel_id, user_id, contribution_amount, user_payment_token, user_payment_URI, user_quote_id,
+        stokvel_payment_token, stokvel_payment_URI, stokvel_quote_id, stokvel_initial_payment_needed, created_at, updated_at
+    ) VALUES (
+        :stokvel_id, :user_id, :contribution_amount, :user_payment_token, :user_payment_URI, :user_quote_id,
+        :stokvel_payment_token, :stokvel_payment_URI, :stokvel_quote_id, :stokvel_initial_payment_needed, :created_at, :updated_at
+    )
+"""
+
+
+# Admits a member whose grants are still being requested. The engines and the WhatsApp
+# menus skip 'pending_grant' members until update_stokvel_member_grants clears the status
+INSERT_PENDING_GRANT_STOKVEL_MEMBER_QUERY = """
+    INSERT INTO STOKVEL_MEMBERS (
+        stokvel_id, user_id, active_status, contribution_amount, user_payment_token, user_payment_URI, user_quote_id,
+        stokvel_payment_token, stokvel_payment_URI, stokvel_quote_id, stokvel_initial_payment_needed, created_at, updated_at
+    ) VALUES (
+        :stokvel_id, :user_id, 'pending_grant', :contribution_amount, :user_payment_token, :user_payment_URI, :user_quote_id,
+        :stokvel_payment_token, :stokvel_payment_URI, :stokvel_quote_id, :stokvel_initial_payment_needed, :created_at, :updated_at
+    )
+"""
+
+
+# Claims one seat, only while the stokvel is below max_number_of_contributors. total_members
+# is the single count of seats taken, so concurrent admissions cannot overfill a stokvel
+CLAIM_STOKVEL_SEAT_QUERY = """
+    UPDATE STOKVELS
+    SET total_members = COALESCE(total_members, 0) + 1
+    WHERE stokvel_id = :stokvel_id
+    AND (
+        max_number_of_contributors IS NULL
+        OR COALESCE(total_members, 0) < max_number_of_contributors
+    )
+    RETURNING total_members, max_number_of_contributors
+"""
+
+
+def decline_overflow_applications(conn, stokvel_id) -> List[Dict[str, Any]]:
+    """
+    Declines every submitted application to a full stokvel, on the caller's connection
+    and in its transaction.
+
+    Returns:
+        List[Dict[str, Any]]: The `application_id` and the applicant's `user_number` of
+        every declined application.
+    """
+    declined = {
+        row[0]: row[1]
+        for row in conn.execute(
+            text(
+                """
+                UPDATE APPLICATIONS
+                SET AppStatus = 'Declined'
+                WHERE stokvel_id = :stokvel_id
+                AND AppStatus = 'Application Submitted'
+                RETURNING id, user_id
+                """
+            ),
+            {"stokvel_id": stokvel_id},
+        ).fetchall()
+    }
+    if not declined:
+        return []
+    user_numbers = dict(
+        conn.execute(
+            text(
+                "SELECT user_id, user_number FROM USERS WHERE user_id IN :user_ids"
+            ).bindparams(bindparam("user_ids", expanding=True)),
+            {"user_ids": list(set(declined.values()))},
+        ).fetchall()
+    )
+    return [
+        {"application_id": application_id, "user_number": user_numbers[user_id]}
+        for application_id, user_id in sorted(declined.items())
+        if user_id in user_numbers
+    ]
+
+
 def insert_stokvel_member(
     application_id: Optional[int],
-    stokvel_id: Optional[str],
-    user_id: Optional[str],
+    stokvel_id: Optional[int],
+    user_id: int,
     user_contribution: Optional[float],
     user_token: Optional[str],
     user_url: Optional[str],
@@ -518,9 +672,20 @@ def insert_stokvel_member(
     updated_at: Optional[str] = None,
 ) -> List:
     """
-    Inserts a new stokvel member into the STOKVEL_MEMBERS table, accounting for token, URL, and quote fields.
+    Admits a new member to a stokvel in one transaction. A seat is claimed by incrementing
+    the stokvel's total_members while it is below max_number_of_contributors, the member
+    is inserted and their application approved. Once the stokvel is full, every other
+    submitted application to it is declined in the same transaction.
+
+    If the stokvel was already full, the member is not inserted and their application is
+    declined with the others.
+
+    Returns:
+        List: The phone numbers of the applicants whose applications were declined.
+
     Raises:
-        Exception: If an error occurs during insert.
+        sqlite3.Error: If the user is already a member of the stokvel.
+        Exception: If an error occurs during insert, nothing is changed.
     """
 
     if created_at is None:
@@ -528,17 +693,6 @@ def insert_stokvel_member(
     if updated_at is None:
         updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Updated insert query with actual database column names
-    insert_query = """
-        INSERT INTO STOKVEL_MEMBERS (
-            stokvel_id, user_id, contribution_amount, user_payment_token, user_payment_URI, user_quote_id,
-            stokvel_payment_token, stokvel_payment_URI, stokvel_quote_id, stokvel_initial_payment_needed, created_at, updated_at
-        ) VALUES (
-            :stokvel_id, :user_id, :contribution_amount, :user_payment_token, :user_payment_URI, :user_quote_id,
-            :stokvel_payment_token, :stokvel_payment_URI, :stokvel_quote_id, :stokvel_initial_payment_needed, :created_at, :updated_at
-        )
-    """
-
     # Parameter dictionary for executing the query, with the correct column names
     parameters = {
         "stokvel_id": stokvel_id,
@@ -555,24 +709,46 @@ def insert_stokvel_member(
         "updated_at": updated_at,
     }
 
-    declined_applications_list = []
     with sqlite_conn.connect() as conn:
         try:
-            if check_available_space_in_stokvel(stokvel_id):
-                if not check_if_stokvel_member(user_id, stokvel_id):
-                    update_application_status(application_id, "Approved")
-                    conn.execute(text(insert_query), parameters)
-                    conn.commit()
-                else:
-                    print(
-                        f"Could not insert, user {user_id} is already a member of this stokvel {stokvel_id}"
-                    )
-                    raise sqlite3.Error("User is already a member of this stokvel")
+            if conn.execute(
+                text(
+                    "SELECT 1 FROM STOKVEL_MEMBERS WHERE user_id = :user_id AND stokvel_id = :stokvel_id"
+                ),
+                {"user_id": user_id, "stokvel_id": stokvel_id},
+            ).fetchone():
+                print(
+                    f"Could not insert, user {user_id} is already a member of this stokvel {stokvel_id}"
+                )
+                raise sqlite3.Error("User is already a member of this stokvel")
+
+            seat = conn.execute(
+                text(CLAIM_STOKVEL_SEAT_QUERY), {"stokvel_id": stokvel_id}
+            ).fetchone()
+            if seat is not None:
+                conn.execute(text(INSERT_STOKVEL_MEMBER_QUERY), parameters)
+                conn.execute(
+                    text(
+                        "UPDATE APPLICATIONS SET AppStatus = 'Approved' WHERE id = :id"
+                    ),
+                    {"id": application_id},
+                )
             else:
                 print(f"Could not insert, stokvel {stokvel_id} is full")
 
-                # Handle declined applications logic here
+            declined_applications_list = []
+            total_members, max_contributors = seat or (None, None)
+            if seat is None or (
+                max_contributors is not None and total_members >= max_contributors
+            ):
+                declined_applications_list = [
+                    application["user_number"]
+                    for application in decline_overflow_applications(conn, stokvel_id)
+                ]
 
+            conn.commit()
+            if seat is not None:
+                linked_stokvels_cache.invalidate_user_ids([user_id])
             return declined_applications_list
 
         except sqlite3.Error as e:
@@ -585,6 +761,304 @@ def insert_stokvel_member(
             raise e
 
 
+def get_pending_applications(application_ids: List[int], admin_id) -> List[Dict]:
+    """
+    Fetches the submitted applications among the given ids that belong to stokvels the
+    user is an admin of, with the applicant's number and wallet.
+
+    Args:
+        application_ids (List[int]): The ids of the applications.
+        admin_id: The user_id of the admin.
+
+    Returns:
+        List[Dict]: The applications, ordered by id.
+    """
+    if not application_ids:
+        return []
+
+    query = text(
+        """
+        SELECT
+            a.id,
+            a.stokvel_id,
+            a.user_id,
+            a.user_contribution,
+            u.user_number,
+            u.ILP_wallet,
+            s.stokvel_name
+        FROM APPLICATIONS a
+        JOIN USERS u ON a.user_id = u.user_id
+        JOIN STOKVELS s ON a.stokvel_id = s.stokvel_id
+        JOIN ADMIN ad ON s.stokvel_id = ad.stokvel_id
+        WHERE a.id IN :application_ids
+        AND ad.user_id = :admin_id
+        AND a.AppStatus = 'Application Submitted'
+        ORDER BY a.id
+        """
+    ).bindparams(bindparam("application_ids", expanding=True))
+
+    with sqlite_conn.connect() as conn:
+        try:
+            result = conn.execute(
+                query,
+                {"application_ids": list(application_ids), "admin_id": admin_id},
+            )
+            return [dict(row._mapping) for row in result.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Error occurred during getting pending applications: {e}")
+            raise e
+
+
+def insert_stokvel_members(
+    stokvel_id, members: List[Dict[str, Any]]
+) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """
+    Admits several members to a stokvel in one transaction, before their grants are
+    requested. Members are admitted in order, each claiming a seat from total_members
+    while the stokvel has space, users that are already members are skipped, and the
+    applications of the admitted members are approved. Once the stokvel is full, every
+    other submitted application to it is declined in the same transaction.
+
+    Admitted members have no grant details yet, so they are stored with the
+    'pending_grant' active_status, which the engines and the WhatsApp menus skip until
+    `update_stokvel_member_grants` stores their grants.
+
+    Args:
+        stokvel_id: The ID of the stokvel.
+        members (List[Dict[str, Any]]): One entry per member with the `application_id`,
+            `user_id` and `user_contribution`.
+
+    Returns:
+        Tuple[List[int], List[Dict[str, Any]]]: The application ids of the admitted
+        members, and the `application_id` and `user_number` of every application that
+        was declined because the stokvel is full.
+
+    Raises:
+        Exception: If an error occurs during insert, nothing is admitted.
+    """
+    if not members:
+        return [], []
+
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with sqlite_conn.connect() as conn:
+        try:
+            existing = {
+                row[0]
+                for row in conn.execute(
+                    text(
+                        """
+                        SELECT user_id FROM STOKVEL_MEMBERS
+                        WHERE stokvel_id = :stokvel_id AND user_id IN :user_ids
+                        """
+                    ).bindparams(bindparam("user_ids", expanding=True)),
+                    {
+                        "stokvel_id": stokvel_id,
+                        "user_ids": [int(member["user_id"]) for member in members],
+                    },
+                )
+            }
+
+            admitted = []
+            stokvel_full = False
+            for member in members:
+                if int(member["user_id"]) in existing:
+                    print(
+                        f"Could not insert, user {member['user_id']} is already a member of this stokvel {stokvel_id}"
+                    )
+                    continue
+                seat = conn.execute(
+                    text(CLAIM_STOKVEL_SEAT_QUERY), {"stokvel_id": stokvel_id}
+                ).fetchone()
+                if seat is None:
+                    print(f"Could not insert, stokvel {stokvel_id} is full")
+                    stokvel_full = True
+                    break
+                existing.add(int(member["user_id"]))
+                admitted.append(member)
+                total_members, max_contributors = seat
+                if max_contributors is not None and total_members >= max_contributors:
+                    stokvel_full = True
+                    break
+
+            if admitted:
+                conn.execute(
+                    text(INSERT_PENDING_GRANT_STOKVEL_MEMBER_QUERY),
+                    [
+                        {
+                            "stokvel_id": stokvel_id,
+                            "user_id": member["user_id"],
+                            "contribution_amount": member["user_contribution"],
+                            "user_payment_token": None,
+                            "user_payment_URI": None,
+                            "user_quote_id": None,
+                            "stokvel_payment_token": None,
+                            "stokvel_payment_URI": None,
+                            "stokvel_quote_id": None,
+                            "stokvel_initial_payment_needed": 1,
+                            "created_at": timestamp,
+                            "updated_at": timestamp,
+                        }
+                        for member in admitted
+                    ],
+                )
+                conn.execute(
+                    text(
+                        "UPDATE APPLICATIONS SET AppStatus = 'Approved' WHERE id = :id"
+                    ),
+                    [{"id": member["application_id"]} for member in admitted],
+                )
+
+            declined_applications_list = (
+                decline_overflow_applications(conn, stokvel_id) if stokvel_full else []
+            )
+
+            conn.commit()
+            linked_stokvels_cache.invalidate_user_ids(
+                [member["user_id"] for member in admitted]
+            )
+            return (
+                [member["application_id"] for member in admitted],
+                declined_applications_list,
+            )
+
+        except Exception as e:
+            print(f"Error occurred during bulk insert of stokvel members: {e}")
+            conn.rollback()
+            raise e
+
+
+def update_stokvel_member_grants(stokvel_id, members: List[Dict[str, Any]]) -> None:
+    """
+    Stores the grant details of members admitted by `insert_stokvel_members`, and clears
+    their 'pending_grant' status so the engines pick them up. They become active once
+    they accept their grants.
+
+    Args:
+        stokvel_id: The ID of the stokvel.
+        members (List[Dict[str, Any]]): One entry per member with the `user_id`, and the
+            `user_token`, `user_url`, `user_quote_id`, `stokvel_token`, `stokvel_url` and
+            `stokvel_quote_id` of its grants.
+    """
+    if not members:
+        return
+
+    query = """
+        UPDATE STOKVEL_MEMBERS
+        SET user_payment_token = :user_token,
+            user_payment_URI = :user_url,
+            user_quote_id = :user_quote_id,
+            stokvel_payment_token = :stokvel_token,
+            stokvel_payment_URI = :stokvel_url,
+            stokvel_quote_id = :stokvel_quote_id,
+            active_status = NULL,
+            updated_at = :updated_at
+        WHERE stokvel_id = :stokvel_id AND user_id = :user_id
+        AND active_status = 'pending_grant'
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with sqlite_conn.connect() as conn:
+        try:
+            conn.execute(
+                text(query),
+                [
+                    {
+                        "stokvel_id": stokvel_id,
+                        "user_id": member["user_id"],
+                        "user_token": member["user_token"],
+                        "user_url": member["user_url"],
+                        "user_quote_id": member["user_quote_id"],
+                        "stokvel_token": member["stokvel_token"],
+                        "stokvel_url": member["stokvel_url"],
+                        "stokvel_quote_id": member["stokvel_quote_id"],
+                        "updated_at": timestamp,
+                    }
+                    for member in members
+                ],
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Error occurred during update of stokvel member grants: {e}")
+            conn.rollback()
+            raise e
+
+
+def revert_stokvel_member_admissions(
+    stokvel_id,
+    members: List[Dict[str, Any]],
+    declined_application_ids: Optional[List[int]] = None,
+) -> None:
+    """
+    Undoes the admission of members by `insert_stokvel_members` whose grants could not
+    be requested. The members are removed, their seats are released and their
+    applications are submitted again, in one transaction. The applications that the
+    same admission declined because the stokvel was full are submitted again too, as
+    the released seats are open to them. Their applicants must not be notified of
+    the decline.
+
+    Args:
+        stokvel_id: The ID of the stokvel.
+        members (List[Dict[str, Any]]): One entry per member with the `application_id`
+            and `user_id`.
+        declined_application_ids (Optional[List[int]]): The applications the admission
+            declined for lack of space.
+    """
+    if not members:
+        return
+
+    with sqlite_conn.connect() as conn:
+        try:
+            removed = conn.execute(
+                text(
+                    """
+                    DELETE FROM STOKVEL_MEMBERS
+                    WHERE stokvel_id = :stokvel_id AND user_id = :user_id
+                    AND active_status = 'pending_grant'
+                    """
+                ),
+                [
+                    {"stokvel_id": stokvel_id, "user_id": member["user_id"]}
+                    for member in members
+                ],
+            ).rowcount
+            conn.execute(
+                text(
+                    """
+                    UPDATE STOKVELS
+                    SET total_members = MAX(COALESCE(total_members, 0) - :removed, 0)
+                    WHERE stokvel_id = :stokvel_id
+                    """
+                ),
+                {"stokvel_id": stokvel_id, "removed": removed},
+            )
+            conn.execute(
+                text(
+                    "UPDATE APPLICATIONS SET AppStatus = 'Application Submitted' WHERE id = :id"
+                ),
+                [{"id": member["application_id"]} for member in members],
+            )
+            if declined_application_ids:
+                conn.execute(
+                    text(
+                        """
+                        UPDATE APPLICATIONS SET AppStatus = 'Application Submitted'
+                        WHERE id = :id AND AppStatus = 'Declined'
+                        """
+                    ),
+                    [
+                        {"id": application_id}
+                        for application_id in declined_application_ids
+                    ],
+                )
+            conn.commit()
+            linked_stokvels_cache.invalidate_user_ids(
+                [member["user_id"] for member in members]
+            )
+        except Exception as e:
+            print(f"Error occurred during revert of stokvel member admissions: {e}")
+            conn.rollback()
+            raise e
+
+
 def check_update_stokvel_initial_payout_required(stokvel_id, user_id):
     """
     Checks if a user needs to make an initial payout to a stokvel.
@@ -718,9 +1192,9 @@ def get_all_stokvels():
 
 
 def insert_admin(
-    stokvel_id: Optional[str],  # unique constraint here
+    stokvel_id: Optional[int],  # unique constraint here
     stokvel_name: str,
-    user_id: Optional[str],
+    user_id: int,
     total_contributions: int,
     total_members: int,
     created_at: Optional[str] = None,
@@ -755,13 +1229,12 @@ def insert_admin(
     with sqlite_conn.connect() as conn:
         try:
             print("Connected in stokvel_admin insert")
-            parameters["id"] = get_next_unique_id(conn, "ADMIN", "id")
-
-            result = conn.execute(text(insert_query), parameters)
+            admin_id = insert_with_generated_id(conn, insert_query, parameters)
             conn.commit()
+            linked_stokvels_cache.invalidate_user_ids([user_id])
 
-            if result.rowcount > 0:
-                print(f"Insert successful, {result.rowcount} row(s) affected.")
+            if admin_id is not None:
+                print(f"Insert successful, admin id {admin_id}.")
             else:
                 print("Insert failed.")
         except sqlite3.Error as e:
@@ -775,39 +1248,6 @@ def insert_admin(
             raise e
 
 
-def update_stokvel_members_count(stokvel_id):
-    """
-    Updates the stokvel members count
-    """
-
-    count_query = "SELECT COUNT(*) FROM STOKVEL_MEMBERS WHERE stokvel_id = :stokvel_id;"
-    parameters = {"stokvel_id": stokvel_id}
-    with sqlite_conn.connect() as conn:
-        try:
-            print("Connected to the database for stokvel members update")
-
-            cursor = conn.execute(text(count_query), parameters)
-            total_members = cursor.fetchone()[0]
-
-            update_query = "UPDATE STOKVELS SET total_members = :total_members WHERE stokvel_id = :stokvel_id;"
-
-            update_parameters = {
-                "stokvel_id": stokvel_id,
-                "total_members": total_members,
-            }
-
-            conn.execute(text(update_query), update_parameters)
-            conn.commit()
-
-            print(
-                f"Updated total_members for stokvel_id {stokvel_id} to {total_members}"
-            )
-
-        except Exception as e:
-            conn.rollback()
-            print(f"An error occurred: {e}")
-
-
 def check_application_pending_approved(user_id, stokvel_id):
     """
     Check if a user already has a pending application in the database.
@@ -857,8 +1297,8 @@ def check_available_space_in_stokvel(stokvel_id):
 
 
 def insert_stokvel_join_application(
-    stokvel_id: Optional[str],  # unique constraint here
-    user_id: Optional[str],
+    stokvel_id: Optional[int],  # unique constraint here
+    user_id: Optional[int],
     user_contribution: Optional[float],
     app_status: Optional[str] = None,
     app_date: Optional[str] = None,
@@ -897,19 +1337,14 @@ def insert_stokvel_join_application(
         try:
 
             if check_available_space_in_stokvel(stokvel_id):
-                if stokvel_id is None:
-                    current_application_id = get_next_unique_id(
-                        conn, "APPLICATIONS", "id"
-                    )
-                    parameters["id"] = current_application_id
-
-                result = conn.execute(text(insert_query), parameters)
+                application_id = insert_with_generated_id(
+                    conn, insert_query, parameters
+                )
                 conn.commit()
 
-                if result.rowcount > 0:
-                    print(f"Insert successful, {result.rowcount} row(s) affected.")
+                if application_id is not None:
+                    print(f"Insert successful, application id {application_id}.")
                     print("insert application successful")
-
                 else:
                     print("Insert failed.")
             else:
@@ -973,6 +1408,44 @@ def update_application_status(app_id: Optional[int], app_status: str):
             raise e
 
 
+def update_applications_status(app_ids: List[int], app_status: str) -> int:
+    """
+    Updates the application status of several applications in one statement.
+
+    Args:
+        app_ids (List[int]): The IDs of the applications to update.
+        app_status (str): The new status of the applications.
+
+    Returns:
+        int: The number of applications updated.
+    """
+    if not app_ids:
+        return 0
+
+    update_query = text(
+        """
+        UPDATE APPLICATIONS
+        SET
+            AppStatus = :AppStatus
+        WHERE
+            id IN :ids
+    """
+    ).bindparams(bindparam("ids", expanding=True))
+
+    with sqlite_conn.connect() as conn:
+        try:
+            result = conn.execute(
+                update_query, {"ids": list(app_ids), "AppStatus": app_status}
+            )
+            conn.commit()
+            return result.rowcount
+
+        except Exception as e:
+            print(f"Error occurred during update of applications: {e}")
+            conn.rollback()
+            raise e
+
+
 def calculate_number_periods(payout_period, start_date, end_date):
     """
     Calculates the number of periods between two dates based on the specified payout period.
@@ -1077,13 +1550,13 @@ def update_user_active_status(user_number: str, stokvel_name: str, active_status
     query = """
         UPDATE STOKVEL_MEMBERS
         SET active_status = :active_status
-        WHERE user_id = (SELECT user_id FROM USERS WHERE user_number = :user_number)
-        AND stokvel_id = (SELECT stokvel_id FROM STOKVELS WHERE stokvel_name = :stokvel_name)
+        WHERE user_id = :user_id
+        AND stokvel_id = :stokvel_id
     """
     params = {
         "active_status": active_status,
-        "user_number": user_number,
-        "stokvel_name": stokvel_name,
+        "user_id": identity_cache.get_user_id(user_number),
+        "stokvel_id": identity_cache.get_stokvel_id(stokvel_name),
     }
 
     # Execute the query
@@ -1091,6 +1564,7 @@ def update_user_active_status(user_number: str, stokvel_name: str, active_status
         try:
             conn.execute(text(query), params)
             conn.commit()
+            linked_stokvels_cache.invalidate([user_number])
         except sqlite3.Error as e:
             print(f"Error updating user status: {e}")
             conn.rollback()
@@ -1101,41 +1575,24 @@ def update_user_active_status(user_number: str, stokvel_name: str, active_status
             raise e
 
 
-def get_next_unique_id(conn, table_name, id_column):
-    """
-    Get the next unique id for the given table and id column.
-    """
-    try:
-        result = conn.execute(
-            text(f"SELECT MAX({id_column}) FROM {table_name}")
-        ).fetchone()
-        # If no result exists (table is empty), return 1, otherwise increment the max id
-        return (result[0] or 0) + 1
-    except Exception as e:
-        print(f"Error getting next unique id: {e}")
-        raise e
-
-
 def insert_transaction(user_id, stokvel_id, amount, tx_type, tx_date):
     """
     Insert a transaction into the TRANSACTIONS table with success and exception handling.
+
+    Returns:
+        Optional[int]: The id SQLite assigned to the transaction, or None if the insert failed.
     """
     with sqlite_conn.connect() as conn:
 
         try:
-            # Insert the transaction into the table
-            # Get the next unique id for the transaction
-            transaction_id = get_next_unique_id(conn, "TRANSACTIONS", "id")
-
-            conn.execute(
-                text(
-                    """
+            # Insert the transaction into the table and let SQLite allocate its id
+            transaction_id = insert_with_generated_id(
+                conn,
+                """
                 INSERT INTO TRANSACTIONS (id, user_id, stokvel_id, amount, tx_type, tx_date, created_at, updated_at)
                 VALUES (:id, :user_id, :stokvel_id, :amount, :tx_type, :tx_date, :created_at, :updated_at)
-                """
-                ),
+                """,
                 {
-                    "id": transaction_id,
                     "user_id": user_id,
                     "stokvel_id": stokvel_id,
                     "amount": amount,
@@ -1148,9 +1605,12 @@ def insert_transaction(user_id, stokvel_id, amount, tx_type, tx_date):
 
             conn.commit()  # Commit the transaction to the database
 
+            return transaction_id
+
         except Exception as e:
             print(f"Failed to insert transaction. Error: {str(e)}")
             conn.rollback()
+            return None
 
 
 def update_max_nr_of_contributors(stokvel_name: str, max_nr_of_contributors: float):
@@ -1169,7 +1629,7 @@ def update_max_nr_of_contributors(stokvel_name: str, max_nr_of_contributors: flo
     update_query = """
     UPDATE STOKVELS
     SET max_number_of_contributors = :max_nr_of_contributors
-    WHERE stokvel_id = (SELECT stokvel_id FROM STOKVELS WHERE stokvel_name = :stokvel_name);
+    WHERE stokvel_id = :stokvel_id;
     """
 
     with sqlite_conn.connect() as conn:
@@ -1177,7 +1637,7 @@ def update_max_nr_of_contributors(stokvel_name: str, max_nr_of_contributors: flo
             conn.execute(
                 text(update_query),
                 {
-                    "stokvel_name": stokvel_name,
+                    "stokvel_id": identity_cache.get_stokvel_id(stokvel_name),
                     "max_nr_of_contributors": max_nr_of_contributors,
                 },
             )
@@ -1202,10 +1662,11 @@ def update_stokvel_name(stokvel_name: str, new_stokvelname: str, user_number: st
 
     # SQL query to update user name
     user_number = extract_whatsapp_number(from_number=user_number)
+    stokvel_id = identity_cache.get_stokvel_id(stokvel_name)
     update_query = """
     UPDATE STOKVELS
     SET stokvel_name = :new_stokvelname
-    WHERE stokvel_id = (SELECT stokvel_id FROM STOKVELS WHERE stokvel_name = :stokvel_name);
+    WHERE stokvel_id = :stokvel_id;
     """
     update_state_query = """
     UPDATE STATE_MANAGEMENT
@@ -1216,13 +1677,15 @@ def update_stokvel_name(stokvel_name: str, new_stokvelname: str, user_number: st
     update_admin_table = """
     UPDATE ADMIN
     SET stokvel_name = :new_stokvelname
-    WHERE stokvel_id = (SELECT stokvel_id FROM STOKVELS WHERE stokvel_name = :new_stokvelname);
+    WHERE stokvel_id = :stokvel_id;
     """
+    # Save and drop the cached session so it does not write the old selection back
+    session_cache.invalidate(from_number=user_number)
     with sqlite_conn.connect() as conn:
         try:
             conn.execute(
                 text(update_query),
-                {"stokvel_name": stokvel_name, "new_stokvelname": new_stokvelname},
+                {"stokvel_id": stokvel_id, "new_stokvelname": new_stokvelname},
             )
             conn.execute(
                 text(update_state_query),
@@ -1230,16 +1693,20 @@ def update_stokvel_name(stokvel_name: str, new_stokvelname: str, user_number: st
             )
             conn.execute(
                 text(update_admin_table),
-                {"stokvel_name": stokvel_name, "new_stokvelname": new_stokvelname},
+                {"stokvel_id": stokvel_id, "new_stokvelname": new_stokvelname},
             )
             conn.commit()
+            identity_cache.invalidate_stokvel(
+                stokvel_id=stokvel_id, stokvel_name=stokvel_name
+            )
+            linked_stokvels_cache.invalidate_stokvel(stokvel_name)
         except Exception as e:
             conn.rollback()
             print(f"Error updating stokvel name: {e}")
             raise e
 
 
-def get_stokvel_monthly_interest(stokvel_id: Optional[str]) -> Dict[str, float]:
+def get_stokvel_monthly_interest(stokvel_id: int) -> Dict[str, float]:
     """
     Get the accumulated interest for a stokvel in the current savings period.
 
@@ -1295,115 +1762,80 @@ def get_stokvel_monthly_interest(stokvel_id: Optional[str]) -> Dict[str, float]:
             return {}
 
 
-def get_user_interest(user_id: int, stokvel_id: int) -> float:
+def get_member_interest_shares(stokvel_id: int) -> Dict[int, float]:
     """
-    Get the accumulated interest for a user in the current savings period.
+    Get the accumulated interest of every member of a stokvel in the current savings period.
 
-    :param user_id: the ID of the user to check interest for.
     :param stokvel_id: The ID of the stokvel to check interest for.
-    :return: Total user interest for the savings period.
+    :return: Total interest for the savings period keyed by user ID.
     """
-
     stokvel_interest = get_stokvel_monthly_interest(stokvel_id)
 
-    start_date = next(iter(stokvel_interest))
+    if not stokvel_interest:
+        return {}
 
-    start_date = start_date[:7]
+    # Interest earned in a month is shared by the deposits of the month before
+    interest_dates = list(stokvel_interest)
+    deposit_months = [previous_month(date) for date in interest_dates]
 
-    # Convert start_date to a datetime object and calculate the date one month before
-    start_date_dt = datetime.strptime(start_date, "%Y-%m")
-    previous_month_date = (
-        (start_date_dt - timedelta(days=1)).replace(day=1).strftime("%Y-%m")
-    )
-
-    engine = sqlite_conn.get_engine()
-    with engine.connect() as conn:
-        transaction = conn.begin()
+    with sqlite_conn.connect() as conn:
         try:
-            # SQL query to get monthly sums of users deposits after the start_date
-            user_deposit_query = text(
+            # SQL query to get monthly sums of every member's deposits since the month before the interest period
+            member_deposit_query = text(
                 """
-                SELECT
-                    strftime('%Y-%m', tx_date) AS month,  -- Get the year-month part of the date
-                    SUM(amount) AS total_deposit
-                FROM TRANSACTIONS
-                WHERE user_id = :user_id
-                AND stokvel_id = :stokvel_id
-                AND tx_type = 'DEPOSIT'
-                AND tx_date > :previous_month_date  -- Start from the month before the interest period
-                GROUP BY strftime('%Y-%m', tx_date)  -- Group by year-month
-            """
-            )
-
-            user_deposit_result = conn.execute(
-                user_deposit_query,
-                {
-                    "user_id": user_id,
-                    "stokvel_id": stokvel_id,
-                    "previous_month_date": previous_month_date,
-                },
-            )
-
-            # Store the deposit sums in a dictionary (keyed by year-month)
-            user_monthly_deposits = {row[0]: row[1] for row in user_deposit_result}
-
-            # SQL query to get monthly total deposits into stokvel after the start_date
-            stokvel_deposits_query = text(
-                """
-                SELECT strftime('%Y-%m', tx_date) AS month,  -- Get the year-month part of the date
-                    SUM(amount) AS total_deposit_stokvel
-                FROM TRANSACTIONS
+                SELECT user_id, month, total_amount AS total_deposit
+                FROM MONTHLY_LEDGER
                 WHERE stokvel_id = :stokvel_id
                 AND tx_type = 'DEPOSIT'
-                AND tx_date > :previous_month_date  -- Start from the month before the interest period
-                GROUP BY strftime('%Y-%m', tx_date)  -- Group by year-month
+                AND month >= :previous_month_date  -- Start from the month before the interest period
             """
             )
 
-            stokvel_deposits_result = conn.execute(
-                stokvel_deposits_query,
-                {"stokvel_id": stokvel_id, "previous_month_date": previous_month_date},
+            member_deposit_rows = (
+                conn.execute(
+                    member_deposit_query,
+                    {
+                        "stokvel_id": stokvel_id,
+                        "previous_month_date": deposit_months[0],
+                    },
+                )
+                .mappings()
+                .all()
             )
 
-            # Store stokvel contributions in a dictionary keyed by year-month
-            stokvel_monthly_deposits = {
-                row[0]: row[1] for row in stokvel_deposits_result
-            }
-
-            # Calculate the user's total interest for the savings period
-            user_total_interest = 0.00
-            user_deposit = 0
-            stokvel_deposit = 0
-            for month, interest_value in stokvel_interest.items():
-                # Calculate the previous month (shift the deposits back by one month)
-                previous_month = (
-                    (datetime.strptime(month[:7], "%Y-%m") - timedelta(days=1))
-                    .replace(day=1)
-                    .strftime("%Y-%m")
-                )
+        except Exception as e:
+            print(f"There was an error retrieving the SQL data: {e}")
+            return {}
 
-                # If the previous month's deposits are available
-                if (
-                    previous_month in user_monthly_deposits
-                    and previous_month in stokvel_monthly_deposits
-                ):
-                    user_deposit += user_monthly_deposits[previous_month]
-                    stokvel_deposit += stokvel_monthly_deposits[previous_month]
+    member_ids = sorted({row["user_id"] for row in member_deposit_rows})
+    member_deposits, has_deposit = pivot_rows(
+        member_deposit_rows,
+        row_keys=member_ids,
+        column_keys=deposit_months,
+        row_field="user_id",
+        column_field="month",
+        value_field="total_deposit",
+    )
 
-                    # Calculate the user's share of the interest for the current month
-                    user_interest = (user_deposit / stokvel_deposit) * interest_value
-                    user_total_interest += user_interest
+    member_interest = allocate_balance_weighted_interest(
+        member_deposits,
+        has_deposit,
+        stokvel_deposits=member_deposits.sum(axis=0),
+        interest_values=np.fromiter(stokvel_interest.values(), dtype=float),
+    )
 
-            user_total_interest = round(user_total_interest, 2)
+    return dict(zip(member_ids, member_interest.tolist()))
 
-            transaction.commit()
 
-            return user_total_interest
+def get_user_interest(user_id: int, stokvel_id: int) -> float:
+    """
+    Get the accumulated interest for a user in the current savings period.
 
-        except Exception as e:
-            transaction.rollback()
-            print(f"There was an error retrieving the SQL data: {e}")
-            return 0.00
+    :param user_id: the ID of the user to check interest for.
+    :param stokvel_id: The ID of the stokvel to check interest for.
+    :return: Total user interest for the savings period.
+    """
+    return get_member_interest_shares(stokvel_id).get(user_id, 0.00)
 
 
 def get_stokvel_details(stokvel_id):
@@ -1516,6 +1948,7 @@ def update_member_grantaccepted(
         try:
             result = conn.execute(text(update_query), parameters)
             conn.commit()
+            linked_stokvels_cache.invalidate_user_ids([user_id])
 
             if result.rowcount > 0:
                 print(
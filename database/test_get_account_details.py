@@ -1,11 +1,8 @@
 from sqlalchemy import text
 
-from database.sqlite_connection import SQLiteConnection
+from database.sqlite_connection import sqlite_conn
 from database.utils import extract_whatsapp_number
 
-# Use the provided SQLite connection
-sqlite_conn = SQLiteConnection(database="./database/test_db.db")
-
 
 def get_account_details(phone_number: str):
     """
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import bindparam, text
+
+from database.sqlite_connection import sqlite_conn
+from database.user_queries.queries import get_linked_stokvels
+from database.utils import extract_whatsapp_number
+
+# Most users whose "My stokvels" menu is kept in memory before the least recently used is dropped
+LINKED_STOKVELS_CACHE_MAX_USERS = int(
+    os.getenv("LINKED_STOKVELS_CACHE_MAX_USERS", "5000")
+)
+# Seconds a menu is served from memory, which bounds how long a change made by another
+# API worker process goes unseen
+LINKED_STOKVELS_CACHE_TTL_SECONDS = float(
+    os.getenv("LINKED_STOKVELS_CACHE_TTL_SECONDS", "30")
+)
+
+
+def render_my_stokvels_menu(linked_accounts: List[Tuple[str, int]]) -> Dict:
+    """
+    Builds the dynamic "My stokvels" state of a user from their linked stokvels. Admins
+    of a stokvel are taken to its admin actions, other members to its user actions.
+
+    Args:
+        linked_accounts (List[Tuple[str, int]]): The (stokvel_name, admin_ind) of every linked stokvel.
+
+    Returns:
+        Dict: The tag, message, valid_actions, state_selection and current_stokvels of the state.
+    """
+    valid_actions = []
+    state_selection = {}
+    current_stokvels = []
+
+    for i, (stokvel_name, admin_ind) in enumerate(linked_accounts, 1):
+        valid_actions.append(str(i))  # Action is the index as a string
+        current_stokvels.append(stokvel_name)
+        state_selection[str(i)] = (
+            "stokvel_actions_admin" if admin_ind == 1 else "stokvel_actions_user"
+        )
+
+    # Add the "back_state" as the last action
+    last_action = len(linked_accounts) + 1
+    valid_actions.append(str(last_action))
+    state_selection[str(last_action)] = "back_state"
+
+    stokvel_names = [
+        f"{i}. {stokvel_name}" for i, (stokvel_name, _) in enumerate(linked_accounts, 1)
+    ]
+    message = (
+        "Please choose one of your stokvels:\n"
+        + "\n".join(stokvel_names)
+        + f"\n{last_action}. Back"
+    )
+
+    return {
+        "tag": "my_stokvels",
+        "message": message,
+        "valid_actions": valid_actions,
+        "state_selection": state_selection,
+        "current_stokvels": current_stokvels,
+    }
+
+
+class LinkedStokvelsCache:
+    """
+    Keeps the rendered "My stokvels" menu of recently active users in memory, keyed by
+    phone number, so opening the menu usually needs no database access.
+
+    Each API worker process has its own cache, and invalidations only reach the process
+    that makes them, so menus are rendered again once they are `ttl` seconds old. Code
+    that changes a user's STOKVEL_MEMBERS or ADMIN rows, or the name of a stokvel, must
+    invalidate the users it affects. An invalidation during a load keeps the loaded menu
+    out of the cache.
+
+    Args:
+        max_users (int): The most menus kept in memory.
+        ttl (float): Seconds a menu is served from memory.
+    """
+
+    def __init__(self, max_users: int, ttl: float) -> None:
+        self.max_users = max_users
+        self.ttl = ttl
+        self._menus: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_menu(self, from_number: str) -> Dict:
+        """
+        Returns the user's "My stokvels" state, rendering it from their linked stokvels
+        if it is not cached. The state is shared, callers must not change it.
+        """
+        user_number = extract_whatsapp_number(from_number=from_number)
+        with self._lock:
+            cached = self._menus.get(user_number)
+            if cached is not None:
+                rendered_at, menu = cached
+                if time.monotonic() - rendered_at < self.ttl:
+                    self._menus.move_to_end(user_number)
+                    return menu
+                del self._menus[user_number]
+            generation = self._generation
+
+        rendered_at = time.monotonic()
+        menu = render_my_stokvels_menu(get_linked_stokvels(user_number))
+        with self._lock:
+            if self._generation == generation:
+                self._menus[user_number] = (rendered_at, menu)
+                while len(self._menus) > self.max_users:
+                    self._menus.popitem(last=False)
+        return menu
+
+    def invalidate(self, from_numbers: Iterable[str]) -> None:
+        """
+        Drops the menus of the given phone numbers.
+        """
+        with self._lock:
+            self._generation += 1
+            for from_number in from_numbers:
+                self._menus.pop(extract_whatsapp_number(from_number=from_number), None)
+
+    def invalidate_user_ids(self, user_ids: Iterable[int]) -> None:
+        """
+        Drops the menus of the given users.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+
+        query = text(
+            "SELECT user_number FROM USERS WHERE user_id IN :user_ids"
+        ).bindparams(bindparam("user_ids", expanding=True))
+        with sqlite_conn.connect() as conn:
+            try:
+                user_numbers = [
+                    row[0] for row in conn.execute(query, {"user_ids": user_ids})
+                ]
+            except Exception as e:
+                print(f"An error occurred finding the users to invalidate: {e}")
+                self.clear()
+                return
+        self.invalidate(user_numbers)
+
+    def invalidate_stokvel(self, stokvel_name: str) -> None:
+        """
+        Drops the menus that list the stokvel.
+        """
+        with self._lock:
+            self._generation += 1
+            for user_number in [
+                user_number
+                for user_number, (_, menu) in self._menus.items()
+                if stokvel_name in menu["current_stokvels"]
+            ]:
+                del self._menus[user_number]
+
+    def clear(self) -> None:
+        """
+        Drops every menu.
+        """
+        with self._lock:
+            self._generation += 1
+            self._menus.clear()
+
+
+linked_stokvels_cache = LinkedStokvelsCache(
+    max_users=LINKED_STOKVELS_CACHE_MAX_USERS, ttl=LINKED_STOKVELS_CACHE_TTL_SECONDS
+)
@@ -1,14 +1,12 @@
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 
 from sqlalchemy import text
 
-from database.sqlite_connection import SQLiteConnection
-from database.stokvel_queries.queries import get_stokvel_monthly_interest
-from database.utils import extract_whatsapp_number
-
-sqlite_conn = SQLiteConnection(database="./database/test_db.db")
+from database.identity_cache import identity_cache
+from database.sqlite_connection import sqlite_conn
+from database.state_manager.session import session_cache
 
 
 def get_total_number_of_users() -> int:
@@ -50,19 +48,11 @@ def check_if_number_exists_sqlite(from_number: str) -> bool:
     bool
         True if the user exists, False otherwise.
     """
-    from_number = extract_whatsapp_number(from_number=from_number)
-    query = "SELECT * FROM USERS WHERE user_number = :from_number"
-    with sqlite_conn.connect() as conn:
-        try:
-            cursor = conn.execute(text(query), {"from_number": from_number})
-            result = cursor.fetchone()
-            if result:
-                return True
-
-            return False
-        except Exception as e:
-            print(f"An error occurred in check_if_number_exists: {e}")
-            raise e
+    try:
+        return identity_cache.get_user_id(from_number) is not None
+    except Exception as e:
+        print(f"An error occurred in check_if_number_exists: {e}")
+        raise e
 
 
 def check_if_number_is_admin(from_number: str) -> bool:
@@ -79,18 +69,17 @@ def check_if_number_is_admin(from_number: str) -> bool:
     bool
         True if the user is an admin, False otherwise.
     """
-    from_number = extract_whatsapp_number(from_number=from_number)
+    user_id = identity_cache.get_user_id(from_number)
 
     query = """
     SELECT COUNT(*)
-    FROM USERS u
-    JOIN ADMIN a ON u.user_id = a.user_id
-    WHERE u.user_number = :user_number
+    FROM ADMIN a
+    WHERE a.user_id = :user_id
     """
 
     with sqlite_conn.connect() as conn:
         try:
-            cursor = conn.execute(text(query), {"user_number": from_number})
+            cursor = conn.execute(text(query), {"user_id": user_id})
             result = cursor.fetchone()
             return result[0] >= 1
         except Exception as e:
@@ -113,16 +102,12 @@ def get_linked_stokvels(user_number):
         A list of tuples, where each tuple contains the name of a stokvel, and a boolean indicating whether the user is an admin of that stokvel.
     """
 
-    user_number = extract_whatsapp_number(from_number=user_number)
+    user_id = identity_cache.get_user_id(user_number)
     query = """
     SELECT
         a.stokvel_name,
         CASE
-            WHEN b.user_id IN (
-                SELECT user_id
-                FROM USERS
-                WHERE user_number = :user_number
-            )
+            WHEN b.user_id = :user_id
             THEN 1
             ELSE 0
         END AS admin_ind
@@ -131,15 +116,13 @@ def get_linked_stokvels(user_number):
     WHERE a.stokvel_id IN (
         SELECT stokvel_id
         FROM STOKVEL_MEMBERS
-        WHERE user_id IN (
-            SELECT user_id FROM USERS WHERE user_number = :user_number
-        ) AND active_status = 'active'
+        WHERE user_id = :user_id AND active_status = 'active'
     );
     """
 
     with sqlite_conn.connect() as conn:
         try:
-            cursor = conn.execute(text(query), {"user_number": user_number})
+            cursor = conn.execute(text(query), {"user_id": user_id})
             result = cursor.fetchall()
         except Exception as e:
             print(f"An error occurred in get_linked_stokvels: {e}")
@@ -151,7 +134,7 @@ def get_linked_stokvels(user_number):
     return linked_accounts
 
 
-def find_user_by_number(from_number: str) -> Optional[str]:
+def find_user_by_number(from_number: str) -> int:
     """
     Find a user by their phone number.
 
@@ -162,23 +145,22 @@ def find_user_by_number(from_number: str) -> Optional[str]:
 
     Returns
     -------
-    Optional[str]
-        The user_id if the user exists, otherwise None.
-    """
-    query = "SELECT user_id FROM USERS WHERE user_number = :from_number"
-    from_number = extract_whatsapp_number(from_number=from_number)
-    with sqlite_conn.connect() as conn:
-        try:
-            cursor = conn.execute(text(query), {"from_number": from_number})
-            result = cursor.fetchone()[0]
-            print(result)
-            if result:
-                return result
+    int
+        The user_id of the user.
 
-            return None
-        except Exception as e:
-            print(f"An error occurred in find_user_by_number: {e}")
-            raise e
+    Raises
+    ------
+    ValueError
+        If no user has the phone number.
+    """
+    try:
+        user_id = identity_cache.get_user_id(from_number)
+        if user_id is None:
+            raise ValueError(f"No user found with the number {from_number}")
+        return user_id
+    except Exception as e:
+        print(f"An error occurred in find_user_by_number: {e}")
+        raise e
 
 
 def find_number_by_userid(user_id: str) -> Optional[str]:
@@ -193,22 +175,21 @@ def find_number_by_userid(user_id: str) -> Optional[str]:
     Returns
     -------
     Optional[str]
-        The user's phone number if the user exists, otherwise None.
-    """
-
-    query = "SELECT user_number FROM USERS WHERE user_id = :user_id"
-    with sqlite_conn.connect() as conn:
-        try:
-            cursor = conn.execute(text(query), {"user_id": user_id})
-            result = cursor.fetchone()[0]
-            print(result)
-            if result:
-                return result
+        The user's phone number.
 
-            return None
-        except Exception as e:
-            print(f"An error occurred in find_number_by_userid: {e}")
-            raise e
+    Raises
+    ------
+    ValueError
+        If the user does not exist.
+    """
+    try:
+        user_number = identity_cache.get_user_number(int(user_id))
+        if user_number is None:
+            raise ValueError(f"No user found with the user_id {user_id}")
+        return user_number
+    except Exception as e:
+        print(f"An error occurred in find_number_by_userid: {e}")
+        raise e
 
 
 def insert_user(
@@ -269,6 +250,8 @@ def insert_user(
 
             if result.rowcount > 0:
                 print(f"Insert successful, {result.rowcount} row(s) affected.")
+                # A cached session still holds the unregistered status
+                session_cache.invalidate(from_number=user_number)
             else:
                 print("Insert failed.")
 
@@ -330,13 +313,13 @@ def insert_wallet(user_id: str, user_wallet: str, user_balance: float) -> None:
             raise e
 
 
-def find_wallet_by_userid(user_id: str) -> Optional[str]:
+def find_wallet_by_userid(user_id: int) -> Optional[str]:
     """
     Find the ILP wallet of a user by their user_id.
 
     Parameters
     ----------
-    user_id : str
+    user_id : int
         The user_id to search for.
 
     Returns
@@ -358,119 +341,6 @@ def find_wallet_by_userid(user_id: str) -> Optional[str]:
             raise e
 
 
-def get_user_interest(user_id: Optional[str], stokvel_id: Optional[str]) -> float:
-    """
-    Get the accumulated interest for a user in the current savings period.
-
-    :param user_id: the ID of the user to check interest for.
-    :param stokvel_id: The ID of the stokvel to check interest for.
-    :return: Total user interest for the savings period.
-    """
-
-    stokvel_interest = get_stokvel_monthly_interest(stokvel_id)
-
-    if not stokvel_interest:
-        return 0
-
-    start_date = next(iter(stokvel_interest))
-
-    start_date = start_date[:7]
-
-    # Convert start_date to a datetime object and calculate the date one month before
-    start_date_dt = datetime.strptime(start_date, "%Y-%m")
-    previous_month_date = (
-        (start_date_dt - timedelta(days=1)).replace(day=1).strftime("%Y-%m")
-    )
-
-    engine = sqlite_conn.get_engine()
-    with engine.connect() as conn:
-        transaction = conn.begin()
-        try:
-            # SQL query to get monthly sums of users deposits after the start_date
-            user_deposit_query = text(
-                """
-                SELECT
-                    strftime('%Y-%m', tx_date) AS month,  -- Get the year-month part of the date
-                    SUM(amount) AS total_deposit
-                FROM TRANSACTIONS
-                WHERE user_id = :user_id
-                AND stokvel_id = :stokvel_id
-                AND tx_type = 'DEPOSIT'
-                AND tx_date > :previous_month_date  -- Start from the month before the interest period
-                GROUP BY strftime('%Y-%m', tx_date)  -- Group by year-month
-            """
-            )
-
-            user_deposit_result = conn.execute(
-                user_deposit_query,
-                {
-                    "user_id": user_id,
-                    "stokvel_id": stokvel_id,
-                    "previous_month_date": previous_month_date,
-                },
-            )
-
-            # Store the deposit sums in a dictionary (keyed by year-month)
-            user_monthly_deposits = {row[0]: row[1] for row in user_deposit_result}
-
-            # SQL query to get monthly total deposits into stokvel after the start_date
-            stokvel_deposits_query = text(
-                """
-                SELECT strftime('%Y-%m', tx_date) AS month,  -- Get the year-month part of the date
-                    SUM(amount) AS total_deposit_stokvel
-                FROM TRANSACTIONS
-                WHERE stokvel_id = :stokvel_id
-                AND tx_type = 'DEPOSIT'
-                AND tx_date > :previous_month_date  -- Start from the month before the interest period
-                GROUP BY strftime('%Y-%m', tx_date)  -- Group by year-month
-            """
-            )
-
-            stokvel_deposits_result = conn.execute(
-                stokvel_deposits_query,
-                {"stokvel_id": stokvel_id, "previous_month_date": previous_month_date},
-            )
-
-            # Store stokvel contributions in a dictionary keyed by year-month
-            stokvel_monthly_deposits = {
-                row[0]: row[1] for row in stokvel_deposits_result
-            }
-
-            # Calculate the user's total interest for the savings period
-            user_total_interest = 0.00
-            user_deposit = 0
-            stokvel_deposit = 0
-            for month, interest_value in stokvel_interest.items():
-                # Calculate the previous month (shift the deposits back by one month)
-                previous_month = (
-                    (datetime.strptime(month[:7], "%Y-%m") - timedelta(days=1))
-                    .replace(day=1)
-                    .strftime("%Y-%m")
-                )
-
-                # If the previous month's deposits are available
-                if (
-                    previous_month in user_monthly_deposits
-                    and previous_month in stokvel_monthly_deposits
-                ):
-                    user_deposit += user_monthly_deposits[previous_month]
-                    stokvel_deposit += stokvel_monthly_deposits[previous_month]
-
-                    # Calculate the user's share of the interest for the current month
-                    user_interest = (user_deposit / stokvel_deposit) * interest_value
-                    user_total_interest += user_interest
-
-            user_total_interest = round(user_total_interest, 2)
-
-            transaction.commit()
-
-            return user_total_interest
-
-        except Exception as e:
-            print(f"There was an error retrieving the SQL data: {e}")
-            return 0.00
-
-
 def get_account_details(phone_number: str):
     """
     Retrieve account details for a user based on their phone number.
@@ -485,7 +355,7 @@ def get_account_details(phone_number: str):
     dict
         A dictionary containing the user's account details including user ID, number, name, surname, wallet details, balance, and creation date.
     """
-    from_number = extract_whatsapp_number(from_number=phone_number)
+    user_id = identity_cache.get_user_id(phone_number)
 
     query = """
     SELECT
@@ -501,12 +371,12 @@ def get_account_details(phone_number: str):
     JOIN
         USER_WALLET uw ON u.user_id = uw.user_id
     WHERE
-        u.user_number = :user_number;
+        u.user_id = :user_id;
     """
 
     with sqlite_conn.connect() as conn:
         try:
-            cursor = conn.execute(text(query), {"user_number": from_number})
+            cursor = conn.execute(text(query), {"user_id": user_id})
             result = cursor.fetchone()
 
             if result is None:
@@ -542,20 +412,20 @@ def update_user_name(phone_number: str, new_name: str):
     Returns:
         str: Success or failure message.
     """
-    formatted_number = extract_whatsapp_number(from_number=phone_number)
+    user_id = identity_cache.get_user_id(phone_number)
 
     # SQL query to update user name
     update_query = """
     UPDATE USERS
     SET user_name = :new_name
-    WHERE user_number = :user_number;
+    WHERE user_id = :user_id;
     """
 
     with sqlite_conn.connect() as conn:
         try:
             conn.execute(
                 text(update_query),
-                {"new_name": new_name, "user_number": formatted_number},
+                {"new_name": new_name, "user_id": user_id},
             )
             conn.commit()
         except Exception as e:
@@ -578,18 +448,18 @@ def update_user_surname(phone_number: str, new_surname: str):
     -------
     None
     """
-    formatted_number = extract_whatsapp_number(from_number=phone_number)
+    user_id = identity_cache.get_user_id(phone_number)
 
     update_query = """
     UPDATE USERS
     SET user_surname = :new_surname
-    WHERE user_number = :user_number;
+    WHERE user_id = :user_id;
     """
     with sqlite_conn.connect() as conn:
         try:
             conn.execute(
                 text(update_query),
-                {"new_surname": new_surname, "user_number": formatted_number},
+                {"new_surname": new_surname, "user_id": user_id},
             )
             conn.commit()
 
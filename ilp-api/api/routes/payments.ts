@@ -21,6 +21,7 @@ import {
   executeRecurringPaymentsWithInterest,
 } from "../../utils/ilp-utils/payments";
 import { Limits } from "../../utils/types/accounting";
+import { idempotent } from "../../utils/idempotency";
 
 const router = express.Router();
 
@@ -355,6 +356,13 @@ router.post("/stokvel_payment_setup", async (req: Request, res: Response) => {
  *     description: Processes recurring payments by using the provided sender and receiver wallet addresses, contribution value, and other parameters.
  *     tags:
  *       - Payments
+ *     parameters:
+ *       - in: header
+ *         name: Idempotency-Key
+ *         required: false
+ *         schema:
+ *           type: string
+ *         description: Unique key of the payment. A repeated key returns the first successful response without paying again.
  *     requestBody:
  *       required: true
  *       content:
@@ -391,6 +399,16 @@ router.post("/stokvel_payment_setup", async (req: Request, res: Response) => {
  *                 message:
  *                   type: string
  *                   description: Result of the payment process.
+ *       409:
+ *         description: A request with the same Idempotency-Key is still being processed.
+ *         content:
+ *           application/json:
+ *             schema:
+ *               type: object
+ *               properties:
+ *                 error:
+ *                   type: string
+ *                   example: "A request with this Idempotency-Key is already in progress."
  *       500:
  *         description: Internal server error occurred during payment processing.
  *         content:
@@ -404,6 +422,7 @@ router.post("/stokvel_payment_setup", async (req: Request, res: Response) => {
  */
 router.post(
   "/process_recurring_payments",
+  idempotent,
   async (req: Request, res: Response) => {
     try {
       const {
@@ -443,6 +462,13 @@ router.post(
  *     description: Processes recurring payments that include interest calculations, using sender and receiver wallet addresses.
  *     tags:
  *       - Payments
+ *     parameters:
+ *       - in: header
+ *         name: Idempotency-Key
+ *         required: false
+ *         schema:
+ *           type: string
+ *         description: Unique key of the payment. A repeated key returns the first successful response without paying again.
  *     requestBody:
  *       required: true
  *       content:
@@ -479,6 +505,16 @@ router.post(
  *                 message:
  *                   type: string
  *                   description: Result of the payment process.
+ *       409:
+ *         description: A request with the same Idempotency-Key is still being processed.
+ *         content:
+ *           application/json:
+ *             schema:
+ *               type: object
+ *               properties:
+ *                 error:
+ *                   type: string
+ *                   example: "A request with this Idempotency-Key is already in progress."
  *       500:
  *         description: Internal server error occurred during payment processing.
  *         content:
@@ -492,6 +528,7 @@ router.post(
  */
 router.post(
   "/process_recurring_winterest_payment",
+  idempotent,
   async (req: Request, res: Response) => {
     try {
       const {
@@ -530,6 +567,13 @@ router.post(
  *     description: Sets up an initial outgoing payment, generating a quote and authorization for the sender's wallet.
  *     tags:
  *       - Payments
+ *     parameters:
+ *       - in: header
+ *         name: Idempotency-Key
+ *         required: false
+ *         schema:
+ *           type: string
+ *         description: Unique key of the payment. A repeated key returns the first successful response without paying again.
  *     requestBody:
  *       required: true
  *       content:
@@ -569,6 +613,16 @@ router.post(
  *                 manageurl:
  *                   type: string
  *                   description: URL to manage the payment.
+ *       409:
+ *         description: A request with the same Idempotency-Key is still being processed.
+ *         content:
+ *           application/json:
+ *             schema:
+ *               type: object
+ *               properties:
+ *                 error:
+ *                   type: string
+ *                   example: "A request with this Idempotency-Key is already in progress."
  *       500:
  *         description: Internal server error occurred during payment processing.
  *         content:
@@ -582,6 +636,7 @@ router.post(
  */
 router.post(
   "/initial_outgoing_payment",
+  idempotent,
   async (req: Request, res: Response) => {
     try {
       const {
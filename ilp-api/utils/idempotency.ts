@@ -0,0 +1,78 @@
+import { NextFunction, Request, Response } from "express";
+
+// How long a successful response is replayed for a repeated Idempotency-Key
+const IDEMPOTENCY_TTL_MS =
+  Number(process.env.IDEMPOTENCY_TTL_SECONDS || 7 * 24 * 60 * 60) * 1000;
+
+type IdempotencyEntry =
+  | { state: "in_flight" }
+  | { state: "completed"; status: number; body: unknown; expiresAt: number };
+
+const entries = new Map<string, IdempotencyEntry>();
+
+const forgetExpired = (now: number) => {
+  for (const [key, entry] of entries) {
+    if (entry.state === "completed" && entry.expiresAt <= now) {
+      entries.delete(key);
+    }
+  }
+};
+
+/**
+ * Makes a payment route safe to retry. Requests carrying an `Idempotency-Key`
+ * header are executed once per route and key: a repeated key replays the first
+ * successful response instead of paying again, and a key still being processed
+ * is rejected with a 409. Failed responses are not kept, so the caller can retry
+ * them with the same key. Requests without the header are processed as before.
+ */
+export const idempotent = (
+  req: Request,
+  res: Response,
+  next: NextFunction
+) => {
+  const idempotencyKey = req.header("Idempotency-Key");
+  if (!idempotencyKey) {
+    return next();
+  }
+
+  const now = Date.now();
+  forgetExpired(now);
+
+  const key = `${req.baseUrl}${req.path}:${idempotencyKey}`;
+  const entry = entries.get(key);
+  if (entry?.state === "completed") {
+    res.setHeader("Idempotent-Replayed", "true");
+    return res.status(entry.status).json(entry.body);
+  }
+  if (entry?.state === "in_flight") {
+    return res.status(409).json({
+      error: "A request with this Idempotency-Key is already in progress.",
+    });
+  }
+
+  entries.set(key, { state: "in_flight" });
+
+  const json = res.json.bind(res);
+  res.json = (body: unknown) => {
+    if (res.statusCode < 400) {
+      entries.set(key, {
+        state: "completed",
+        status: res.statusCode,
+        body: body,
+        expiresAt: Date.now() + IDEMPOTENCY_TTL_MS,
+      });
+    } else {
+      entries.delete(key);
+    }
+    return json(body);
+  };
+
+  // A request dropped before it responded can be retried with the same key
+  res.on("close", () => {
+    if (entries.get(key)?.state === "in_flight") {
+      entries.delete(key);
+    }
+  });
+
+  return next();
+};
@@ -0,0 +1,388 @@
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Union
+
+import requests
+from dateutil.relativedelta import relativedelta
+
+from .message_broker import ConsumerPool, create_broker
+
+# The contribution and payout engines split into a planner, which publishes one job per
+# due member, and executors, which consume the jobs, call ILP and record the result.
+# Run them from the messageBroker directory:
+#   python -m src.engine_jobs plan contribution
+#   python -m src.engine_jobs work contribution --workers 8
+
+DATABASE_API_URL = os.getenv("DATABASE_API_URL", "http://127.0.0.1:5000/database")
+ILP_PAYMENTS_URL = os.getenv("ILP_PAYMENTS_URL", "http://localhost:3001/payments")
+ENGINE_JOB_WORKERS = int(os.getenv("ENGINE_JOB_WORKERS", "4"))
+ENGINE_HTTP_TIMEOUT_SECONDS = float(os.getenv("ENGINE_HTTP_TIMEOUT_SECONDS", "10"))
+
+CONTRIBUTION_JOBS_QUEUE = os.getenv("CONTRIBUTION_JOBS_QUEUE", "contribution_jobs")
+PAYOUT_JOBS_QUEUE = os.getenv("PAYOUT_JOBS_QUEUE", "payout_jobs")
+
+CONTRIBUTION_WALLET = "$ilp.rafiki.money/masterstokveladdress"
+PAYOUT_WALLET = "https://ilp.rafiki.money/masterstokveladdress"
+
+# One keep-alive session for every database API and ILP call of the process
+http_session = requests.Session()
+
+
+def post_json(
+    url: str, payload: Dict, headers: Optional[Dict[str, str]] = None
+) -> Union[Dict, List]:
+    """
+    Posts a JSON payload, with optional extra headers, and returns the JSON response.
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails or returns an error status.
+    """
+    response = http_session.post(
+        url, json=payload, headers=headers, timeout=ENGINE_HTTP_TIMEOUT_SECONDS
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def read_named_query(name: str, parameters: Dict) -> List[Dict]:
+    """
+    Runs a query registered with the database API by name and returns the rows.
+    """
+    return post_json(
+        f"{DATABASE_API_URL}/named_query", {"name": name, "parameters": parameters}
+    )
+
+
+def write_db_batch(statements: List[Dict]) -> List[int]:
+    """
+    Runs `{"name", "parameters"}` write statements through the database API in a single
+    transaction and returns the rows affected by each statement.
+    """
+    return post_json(f"{DATABASE_API_URL}/write_batch", {"statements": statements})[
+        "rowcounts"
+    ]
+
+
+def get_period_delta(period: str) -> Union[timedelta, relativedelta]:
+    """
+    Maps a stokvel contribution or payout period onto the delta between two dates.
+    """
+    if period == "Days":
+        return timedelta(days=1)
+    if period == "Week":
+        return timedelta(weeks=1)
+    if period == "Months":
+        return relativedelta(months=1)
+    if period == "Years":
+        return relativedelta(years=1)
+    raise ValueError("Invalid period specified.")
+
+
+def next_date_updates(
+    members: List[Dict], run_date: str, period_field: str
+) -> List[Dict]:
+    """
+    Builds the PreviousDate/NextDate advance of every stokvel the members belong to.
+    """
+    updates: Dict[int, Dict] = {}
+    for member in members:
+        stokvel_id = member["stokvel_id"]
+        if stokvel_id not in updates:
+            next_date = datetime.strptime(run_date, "%Y-%m-%d") + get_period_delta(
+                member[period_field]
+            )
+            updates[stokvel_id] = {
+                "PreviousDate": run_date,
+                "NextDate": next_date.strftime("%Y-%m-%d"),
+                "stokvel_id": stokvel_id,
+            }
+    return list(updates.values())
+
+
+def build_job(engine: str, run_date: str, tx_date: str, member: Dict) -> str:
+    """
+    Serializes the job of one member.
+    """
+    return json.dumps(
+        {"engine": engine, "run_date": run_date, "tx_date": tx_date, "member": member}
+    )
+
+
+def plan_contributions(broker, run_date: str, tx_date: str) -> int:
+    """
+    Publishes a contribution job for every member due on the run date, then advances
+    the NextDate of their stokvels. A planner that fails before the advance can simply
+    run again, executors skip the members whose deposit is already recorded.
+
+    Returns:
+        int: The number of jobs published.
+    """
+    members = read_named_query("due_contributions", {"input_date": run_date})
+    jobs = [build_job("contribution", run_date, tx_date, member) for member in members]
+    broker.publish_batch(CONTRIBUTION_JOBS_QUEUE, jobs)
+    write_db_batch(
+        [
+            {
+                "name": "update_next_contribution_date",
+                "parameters": next_date_updates(
+                    members, run_date, "contribution_period"
+                ),
+            }
+        ]
+    )
+    return len(jobs)
+
+
+def plan_payouts(broker, run_date: str, tx_date: str) -> int:
+    """
+    Publishes a payout job, with its planned amount, for every member due on the run
+    date, then advances the NextDate of their stokvels.
+
+    Returns:
+        int: The number of jobs published.
+    """
+    members = post_json(f"{DATABASE_API_URL}/payout_plan", {"input_date": run_date})
+    jobs = [build_job("payout", run_date, tx_date, member) for member in members]
+    broker.publish_batch(PAYOUT_JOBS_QUEUE, jobs)
+    write_db_batch(
+        [
+            {
+                "name": "update_next_payout_date",
+                "parameters": next_date_updates(
+                    members, run_date, "payout_frequency_duration"
+                ),
+            }
+        ]
+    )
+    return len(jobs)
+
+
+def is_recorded(job: Dict, tx_type: str) -> bool:
+    """
+    Whether the member of a job already has its transaction for the run date.
+    """
+    member = job["member"]
+    return bool(
+        read_named_query(
+            "member_transactions_on_date",
+            {
+                "stokvel_id": member["stokvel_id"],
+                "user_id": member["user_id"],
+                "tx_type": tx_type,
+                "run_date": job["run_date"],
+            },
+        )
+    )
+
+
+def idempotency_headers(job: Dict) -> Dict[str, str]:
+    """
+    The Idempotency-Key header of the ILP call of a job. It matches the engine run
+    ledger key of the member, so a redelivered job replays the ILP server's response
+    instead of paying again.
+    """
+    member = job["member"]
+    return {
+        "Idempotency-Key": f"{job['engine']}:{job['run_date']}:{member['stokvel_id']}:{member['user_id']}"
+    }
+
+
+def transaction_parameters(job: Dict, amount: float, tx_type: str) -> Dict:
+    """
+    The parameters of `insert_transaction_once` for the member of a job.
+    """
+    member = job["member"]
+    return {
+        "user_id": member["user_id"],
+        "stokvel_id": member["stokvel_id"],
+        "amount": amount,
+        "tx_type": tx_type,
+        "tx_date": job["tx_date"],
+        "created_at": job["tx_date"],
+        "updated_at": job["tx_date"],
+        "run_date": job["run_date"],
+    }
+
+
+def execute_contribution_job(job: Dict) -> None:
+    """
+    Collects one member's contribution: an initial outgoing payment while the member
+    still holds a quote, a recurring payment otherwise. The deposit, new grant token
+    and cleared quote are recorded in one transaction, and a member whose deposit is
+    already recorded for the run date is skipped, so redelivered jobs are harmless.
+    """
+    member = job["member"]
+    if is_recorded(job, "DEPOSIT"):
+        logging.info(
+            f"Contribution of user_id {member['user_id']} in stokvel_id {member['stokvel_id']} already recorded."
+        )
+        return
+
+    if member["user_quote_id"] is not None:
+        payment = post_json(
+            f"{ILP_PAYMENTS_URL}/initial_outgoing_payment",
+            {
+                "quote_id": member["user_quote_id"],
+                "continueUri": member["user_payment_URI"],
+                "continueAccessToken": member["user_payment_token"],
+                "walletAddressURL": member["ILP_wallet"],
+                "interact_ref": str(member["user_interaction_ref"]),
+            },
+            idempotency_headers(job),
+        )
+    else:
+        payment = post_json(
+            f"{ILP_PAYMENTS_URL}/process_recurring_payments",
+            {
+                "sender_wallet_address": member["ILP_wallet"],
+                "receiving_wallet_address": CONTRIBUTION_WALLET,
+                "manageUrl": member["user_payment_URI"],
+                "previousToken": member["user_payment_token"],
+            },
+            idempotency_headers(job),
+        )
+
+    key = {"stokvel_id": member["stokvel_id"], "user_id": member["user_id"]}
+    write_db_batch(
+        [
+            {
+                "name": "insert_transaction_once",
+                "parameters": transaction_parameters(
+                    job, member["contribution_amount"], "DEPOSIT"
+                ),
+            },
+            {
+                "name": "update_member_payment_token",
+                "parameters": {
+                    "new_token": payment["token"],
+                    "new_uri": payment["manageurl"],
+                    **key,
+                },
+            },
+            {
+                "name": "clear_member_quote",
+                "parameters": [key] if member["user_quote_id"] is not None else [],
+            },
+        ]
+    )
+
+
+def execute_payout_job(job: Dict) -> None:
+    """
+    Pays one member's planned payout from the master stokvel wallet and records the
+    payout and new grant token in one transaction. A member whose payout is already
+    recorded for the run date is skipped.
+    """
+    member = job["member"]
+    if is_recorded(job, "PAYOUT"):
+        logging.info(
+            f"Payout of user_id {member['user_id']} in stokvel_id {member['stokvel_id']} already recorded."
+        )
+        return
+
+    payment = post_json(
+        f"{ILP_PAYMENTS_URL}/process_recurring_winterest_payment",
+        {
+            "sender_wallet_address": PAYOUT_WALLET,
+            "receiving_wallet_address": member["ILP_wallet"],
+            "manageUrl": member["stokvel_payment_URI"],
+            "previousToken": member["stokvel_payment_token"],
+            "payout_value": str(int(member["amount"] * 100)),
+        },
+        idempotency_headers(job),
+    )
+
+    write_db_batch(
+        [
+            {
+                "name": "insert_transaction_once",
+                "parameters": transaction_parameters(job, member["amount"], "PAYOUT"),
+            },
+            {
+                "name": "update_member_stokvel_payment_token",
+                "parameters": {
+                    "new_token": payment["token"],
+                    "new_uri": payment["manageurl"],
+                    "stokvel_id": member["stokvel_id"],
+                    "user_id": member["user_id"],
+                },
+            },
+        ]
+    )
+
+
+ENGINES: Dict[str, Dict[str, Union[str, Callable]]] = {
+    "contribution": {
+        "queue": CONTRIBUTION_JOBS_QUEUE,
+        "plan": plan_contributions,
+        "execute": execute_contribution_job,
+    },
+    "payout": {
+        "queue": PAYOUT_JOBS_QUEUE,
+        "plan": plan_payouts,
+        "execute": execute_payout_job,
+    },
+}
+
+
+def handle_job(ch, method, properties, body) -> None:  # pylint: disable=unused-argument
+    """
+    Consumer callback executing one engine job. Errors propagate, so the broker
+    requeues the job once before dropping it, see `manual_ack`.
+    """
+    job = json.loads(body)
+    ENGINES[job["engine"]]["execute"](job)
+
+
+def run_planner(engine: str, run_date: Optional[str] = None) -> int:
+    """
+    Plans one engine run, for today in UTC unless a run date is given.
+
+    Returns:
+        int: The number of jobs published.
+    """
+    now = datetime.now(timezone.utc)
+    run_date = run_date or now.date().strftime("%Y-%m-%d")
+    broker = create_broker()
+    try:
+        published = ENGINES[engine]["plan"](
+            broker, run_date, now.strftime("%Y-%m-%d %H:%M:%S")
+        )
+    finally:
+        broker.close()
+    logging.info(f"Published {published} {engine} jobs for {run_date}.")
+    return published
+
+
+def run_executors(engine: str, workers: int = ENGINE_JOB_WORKERS) -> None:
+    """
+    Consumes an engine's jobs on `workers` threads until interrupted. Start more
+    processes to scale out, RabbitMQ spreads the jobs across all of them.
+    """
+    pool = ConsumerPool(ENGINES[engine]["queue"], handle_job, workers=workers)
+    pool.start()
+    logging.info(f"Executing {engine} jobs on {workers} workers.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Plan or execute engine jobs.")
+    parser.add_argument("command", choices=["plan", "work"])
+    parser.add_argument("engine", choices=sorted(ENGINES))
+    parser.add_argument("--date", help="The run date to plan, YYYY-MM-DD.")
+    parser.add_argument("--workers", type=int, default=ENGINE_JOB_WORKERS)
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        run_planner(args.engine, run_date=args.date)
+    else:
+        run_executors(args.engine, workers=args.workers)
@@ -0,0 +1,196 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+import pika
+
+from .message_broker import MESSAGE_BROKER_PREFETCH, Callback, Message, manual_ack
+
+# A queued message: its body, properties, and whether it was delivered before
+QueuedMessage = Tuple[bytes, pika.BasicProperties, bool]
+
+
+class InMemoryServer:
+    """
+    The queues shared by every InMemoryBroker of a process, standing in for a RabbitMQ
+    server. Every broker is like a separate connection to it.
+    """
+
+    def __init__(self) -> None:
+        self.queues: Dict[str, Deque[QueuedMessage]] = {}
+        self.condition = threading.Condition()
+
+    def reset(self) -> None:
+        """
+        Deletes every queue and its messages.
+        """
+        with self.condition:
+            self.queues.clear()
+
+
+in_memory_server = InMemoryServer()
+
+
+class InMemoryBroker:
+    """
+    An in-process stand-in for MessageBroker with the same methods and delivery
+    semantics, for tests and local runs without RabbitMQ.
+
+    Callbacks get the broker as their channel, and a real `pika.spec.Basic.Deliver`
+    and `pika.BasicProperties`. Unacknowledged messages count against `prefetch_count`,
+    nacked messages can be requeued with their redelivered flag set, and messages left
+    unacknowledged when the broker closes are requeued.
+
+    Args:
+        prefetch_count (int): The most unacknowledged messages delivered to a consumer.
+        server (Optional[InMemoryServer]): The queues to use, defaults to in_memory_server.
+    """
+
+    def __init__(
+        self,
+        prefetch_count: int = MESSAGE_BROKER_PREFETCH,
+        server: Optional[InMemoryServer] = None,
+    ) -> None:
+        self.server = server or in_memory_server
+        self.prefetch_count = prefetch_count
+        self._unacked: Dict[int, Tuple[str, bytes, pika.BasicProperties]] = {}
+        self._next_delivery_tag = 1
+        self._stop_requested = threading.Event()
+
+    def declare_queue(self, queue_name: str) -> None:
+        """
+        Creates the queue if it does not exist.
+        """
+        with self.server.condition:
+            self.server.queues.setdefault(queue_name, deque())
+
+    def publish(self, queue_name: str, message: Message) -> None:
+        """
+        Appends a message to the queue.
+        """
+        self.publish_batch(queue_name, [message])
+
+    def publish_batch(self, queue_name: str, messages: Iterable[Message]) -> int:
+        """
+        Appends messages to the queue at once.
+
+        Returns:
+            int: The number of messages published.
+        """
+        properties = pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent)
+        batch = [
+            (
+                message.encode() if isinstance(message, str) else message,
+                properties,
+                False,
+            )
+            for message in messages
+        ]
+        with self.server.condition:
+            self.server.queues.setdefault(queue_name, deque()).extend(batch)
+            self.server.condition.notify_all()
+        return len(batch)
+
+    def consume(
+        self, queue_name: str, callback: Callback, auto_ack: bool = False
+    ) -> None:
+        """
+        Calls `callback(ch, method, properties, body)` for every message of the queue
+        until `stop_consuming` is called, see MessageBroker.consume.
+        """
+        self._consume(
+            queue_name, callback if auto_ack else manual_ack(callback), auto_ack
+        )
+
+    def consume_one(self, queue, callback, auto_ack: bool = False):
+        """
+        Calls `callback(ch, method, properties, body)` for the next message of the queue
+        and stops consuming.
+        """
+
+        def stop_consuming_callback(ch, method, properties, body):
+            """
+            Handles the message and stops consuming.
+            """
+            try:
+                callback(ch, method, properties, body)
+            finally:
+                self.stop_consuming()
+
+        self._consume(
+            queue,
+            (
+                stop_consuming_callback
+                if auto_ack
+                else manual_ack(stop_consuming_callback)
+            ),
+            auto_ack,
+        )
+
+    def _consume(self, queue_name: str, on_message: Callback, auto_ack: bool) -> None:
+        self.declare_queue(queue_name)
+        try:
+            while True:
+                with self.server.condition:
+                    while not self._stop_requested.is_set() and (
+                        not self.server.queues[queue_name]
+                        or (not auto_ack and len(self._unacked) >= self.prefetch_count)
+                    ):
+                        self.server.condition.wait(timeout=0.1)
+                    if self._stop_requested.is_set():
+                        return
+                    body, properties, redelivered = self.server.queues[
+                        queue_name
+                    ].popleft()
+                    delivery_tag = self._next_delivery_tag
+                    self._next_delivery_tag += 1
+                    if not auto_ack:
+                        self._unacked[delivery_tag] = (queue_name, body, properties)
+
+                method = pika.spec.Basic.Deliver(
+                    consumer_tag="in-memory",
+                    delivery_tag=delivery_tag,
+                    redelivered=redelivered,
+                    exchange="",
+                    routing_key=queue_name,
+                )
+                on_message(self, method, properties, body)
+        finally:
+            self._stop_requested.clear()
+
+    def basic_ack(self, delivery_tag: int) -> None:
+        """
+        Acknowledges a delivered message, removing it for good.
+        """
+        with self.server.condition:
+            self._unacked.pop(delivery_tag, None)
+            self.server.condition.notify_all()
+
+    def basic_nack(self, delivery_tag: int, requeue: bool = True) -> None:
+        """
+        Rejects a delivered message, putting it back at the head of its queue if `requeue` is set.
+        """
+        with self.server.condition:
+            delivered = self._unacked.pop(delivery_tag, None)
+            if delivered is not None and requeue:
+                queue_name, body, properties = delivered
+                self.server.queues[queue_name].appendleft((body, properties, True))
+            self.server.condition.notify_all()
+
+    def stop_consuming(self) -> None:
+        """
+        Stops `consume` from any thread, once the current message is handled.
+        """
+        self._stop_requested.set()
+        with self.server.condition:
+            self.server.condition.notify_all()
+
+    def close(self) -> None:
+        """
+        Requeues every unacknowledged message, as RabbitMQ does when a connection closes.
+        """
+        with self.server.condition:
+            for delivery_tag in sorted(self._unacked, reverse=True):
+                queue_name, body, properties = self._unacked.pop(delivery_tag)
+                self.server.queues[queue_name].appendleft((body, properties, True))
+            self.server.condition.notify_all()
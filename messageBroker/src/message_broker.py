@@ -1,63 +1,276 @@
 import os
+import threading
+from typing import Callable, Iterable, List, Optional, Set, Union
 
 import pika
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# "rabbitmq" connects to RABBITMQ_URL, "memory" uses the in-process InMemoryBroker
+MESSAGE_BROKER_BACKEND = os.getenv("MESSAGE_BROKER_BACKEND", "rabbitmq")
+# Unacknowledged messages a consumer may hold at once
+MESSAGE_BROKER_PREFETCH = int(os.getenv("MESSAGE_BROKER_PREFETCH", "50"))
+
+Message = Union[str, bytes]
+Callback = Callable[..., None]
+
+
+def manual_ack(callback: Callback) -> Callback:
+    """
+    Wraps a consumer callback so its message is acknowledged once the callback returns.
+    A message whose callback raises is requeued once, and dropped if it fails again
+    on redelivery, so a poison message cannot block the queue.
+    """
+
+    def on_message(ch, method, properties, body) -> None:
+        try:
+            callback(ch, method, properties, body)
+        except Exception as e:
+            print(
+                f"Error handling message {method.delivery_tag} from {method.routing_key}: {e}"
+            )
+            ch.basic_nack(
+                delivery_tag=method.delivery_tag, requeue=not method.redelivered
+            )
+            return
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    return on_message
+
 
 class MessageBroker:
     """
-    docstring
+    A RabbitMQ client for publishing to and consuming from durable queues.
+
+    Queues are declared durable once per broker, and messages are published persistent
+    with publisher confirms, so `publish` only returns once RabbitMQ has taken
+    responsibility for the message. `publish_batch` sends many messages in one
+    transaction with a single round trip. Consumers acknowledge each message after
+    their callback returns and hold at most `prefetch_count` unacknowledged messages.
+
+    A connection and its channels belong to one thread. Use a ConsumerPool to consume
+    a queue on several threads.
+
+    Args:
+        url (Optional[str]): The AMQP URL of the broker, defaults to RABBITMQ_URL.
+        prefetch_count (int): The most unacknowledged messages delivered to a consumer.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self, url: Optional[str] = None, prefetch_count: int = MESSAGE_BROKER_PREFETCH
+    ) -> None:
         self.connection = pika.BlockingConnection(
-            pika.URLParameters(os.getenv("RABBITMQ_URL"))
+            pika.URLParameters(url or os.getenv("RABBITMQ_URL"))
         )
         self.channel = self.connection.channel()
+        self.channel.confirm_delivery()
+        self.channel.basic_qos(prefetch_count=prefetch_count)
+        self._batch_channel = None
+        self._declared: Set[str] = set()
+
+    def declare_queue(self, queue_name: str) -> None:
+        """
+        Declares a durable queue, once per broker.
+        """
+        if queue_name in self._declared:
+            return
+        self.channel.queue_declare(queue=queue_name, durable=True)
+        self._declared.add(queue_name)
 
-    def publish(self, queue_name: str, message: str) -> None:
+    def publish(self, queue_name: str, message: Message) -> None:
         """
-        docstring
+        Publishes a persistent message and waits for the broker to confirm it.
+
+        Raises:
+            pika.exceptions.UnroutableError: If the message could not be routed to the queue.
+            pika.exceptions.NackError: If the broker refused the message.
         """
-        self.channel.queue_declare(queue=queue_name, durable=False)
-        self.channel.basic_publish(exchange="", routing_key=queue_name, body=message)
-        print(f"Sent: {message}")
+        self.declare_queue(queue_name)
+        self.channel.basic_publish(
+            exchange="",
+            routing_key=queue_name,
+            body=message,
+            properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent),
+            mandatory=True,
+        )
+
+    def publish_batch(self, queue_name: str, messages: Iterable[Message]) -> int:
+        """
+        Publishes persistent messages in one transaction, so either all of them are
+        queued or none are, at the cost of a single round trip.
+
+        Returns:
+            int: The number of messages published.
+        """
+        self.declare_queue(queue_name)
+        if self._batch_channel is None:
+            self._batch_channel = self.connection.channel()
+            self._batch_channel.tx_select()
+
+        properties = pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent)
+        count = 0
+        try:
+            for message in messages:
+                self._batch_channel.basic_publish(
+                    exchange="",
+                    routing_key=queue_name,
+                    body=message,
+                    properties=properties,
+                )
+                count += 1
+            self._batch_channel.tx_commit()
+        except Exception as e:
+            print(f"Error publishing a batch to {queue_name}: {e}")
+            if self._batch_channel.is_open:
+                self._batch_channel.tx_rollback()
+            raise e
+        return count
 
-    def consume(self, queue_name: str, callback) -> None:
+    def consume(
+        self, queue_name: str, callback: Callback, auto_ack: bool = False
+    ) -> None:
         """
-        docstring
+        Calls `callback(ch, method, properties, body)` for every message of the queue
+        until `stop_consuming` is called. Messages are acknowledged after the callback
+        returns, see `manual_ack`, unless `auto_ack` is set.
         """
-        self.channel.queue_declare(queue=queue_name, durable=False)
+        self.declare_queue(queue_name)
         self.channel.basic_consume(
-            queue=queue_name, on_message_callback=callback, auto_ack=True
+            queue=queue_name,
+            on_message_callback=callback if auto_ack else manual_ack(callback),
+            auto_ack=auto_ack,
         )
         print(f"Waiting for messages in {queue_name}. To exit press CTRL+C")
         self.channel.start_consuming()
 
-    def consume_one(self, queue, callback):
+    def consume_one(self, queue, callback, auto_ack: bool = False):
         """
-        docstring
+        Calls `callback(ch, method, properties, body)` for the next message of the queue
+        and stops consuming.
         """
-        self.channel.queue_declare(queue=queue, durable=False)
+        self.declare_queue(queue)
 
         def stop_consuming_callback(ch, method, properties, body):
             """
-            docstring
+            Handles the message and stops consuming.
             """
-            callback(ch, method, properties, body)
-            self.channel.stop_consuming()
+            try:
+                callback(ch, method, properties, body)
+            finally:
+                self.channel.stop_consuming()
 
         self.channel.basic_consume(
-            queue=queue, on_message_callback=stop_consuming_callback, auto_ack=True
+            queue=queue,
+            on_message_callback=(
+                stop_consuming_callback
+                if auto_ack
+                else manual_ack(stop_consuming_callback)
+            ),
+            auto_ack=auto_ack,
         )
         print(f"Waiting for a single message in {queue}.")
         self.channel.start_consuming()
 
+    def stop_consuming(self) -> None:
+        """
+        Stops `consume` from any thread, once the current message is handled.
+        """
+        self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+
     def close(self) -> None:
         """
-        docstring
+        Closes the channels and the connection. Unacknowledged messages are requeued.
+        """
+        if self._batch_channel is not None and self._batch_channel.is_open:
+            self._batch_channel.close()
+        if self.channel.is_open:
+            self.channel.close()
+        if self.connection.is_open:
+            self.connection.close()
+
+
+def create_broker(prefetch_count: int = MESSAGE_BROKER_PREFETCH):
+    """
+    Creates the broker selected by MESSAGE_BROKER_BACKEND, a MessageBroker connected to
+    RABBITMQ_URL or an InMemoryBroker.
+    """
+    if MESSAGE_BROKER_BACKEND == "memory":
+        from .in_memory_broker import InMemoryBroker
+
+        return InMemoryBroker(prefetch_count=prefetch_count)
+    return MessageBroker(prefetch_count=prefetch_count)
+
+
+class ConsumerPool:
+    """
+    Consumes one queue on several threads. Every worker opens its own broker connection,
+    so a slow message only holds up its own worker, and RabbitMQ spreads the queue
+    across the workers `prefetch_count` messages at a time.
+
+    Args:
+        queue_name (str): The queue to consume.
+        callback (Callback): Called as `callback(ch, method, properties, body)` per message.
+        workers (int): The number of worker threads.
+        broker_factory (Callable): Creates the broker of a worker, defaults to create_broker.
+    """
+
+    def __init__(
+        self,
+        queue_name: str,
+        callback: Callback,
+        workers: int,
+        broker_factory: Callable = create_broker,
+    ) -> None:
+        self.queue_name = queue_name
+        self.callback = callback
+        self.workers = max(workers, 1)
+        self.broker_factory = broker_factory
+        self._brokers: List = []
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Starts the worker threads.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(
+                    target=self._run,
+                    name=f"{self.queue_name}-consumer-{index}",
+                    daemon=True,
+                )
+                for index in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
         """
-        self.channel.close()
-        self.connection.close()
+        Stops every worker once its current message is handled and waits for them.
+        """
+        with self._lock:
+            self._stopping = True
+            brokers = list(self._brokers)
+        for broker in brokers:
+            broker.stop_consuming()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        broker = self.broker_factory()
+        with self._lock:
+            if self._stopping:
+                broker.close()
+                return
+            self._brokers.append(broker)
+        try:
+            broker.consume(self.queue_name, self.callback)
+        except Exception as e:
+            print(f"Consumer of {self.queue_name} stopped: {e}")
+        finally:
+            broker.close()
@@ -1,20 +1,35 @@
+import threading
+import time
+import uuid
+
 import pytest
-from src.message_broker import MessageBroker
+from src.message_broker import ConsumerPool, create_broker
+
+# The tests use the broker selected by MESSAGE_BROKER_BACKEND, run them without
+# RabbitMQ with: MESSAGE_BROKER_BACKEND=memory pytest tests
 
 
 @pytest.fixture
 def broker():
     """
-    docstring
+    A broker that is closed after the test.
     """
-    broker = MessageBroker()
+    broker = create_broker()
     yield broker
     broker.close()
 
 
+@pytest.fixture
+def queue_name():
+    """
+    A queue name no other test uses.
+    """
+    return f"test_queue_{uuid.uuid4().hex}"
+
+
 def test_publish_and_consume(broker):
     """
-    docstring
+    A published message is delivered to the consumer.
     """
     test_queue = "test_queue"
     test_message = "Hello, RabbitMQ!"
@@ -25,3 +40,65 @@ def test_publish_and_consume(broker):
 
     broker.publish(test_queue, test_message)
     broker.consume_one(test_queue, callback)
+
+
+def test_publish_batch_keeps_order(broker, queue_name):
+    """
+    A batch is delivered in the order it was published.
+    """
+    received = []
+
+    def callback(ch, method, properties, body):  # pylint: disable=unused-argument
+        received.append(body.decode())
+
+    assert broker.publish_batch(queue_name, [f"message {i}" for i in range(5)]) == 5
+    for _ in range(5):
+        broker.consume_one(queue_name, callback)
+
+    assert received == [f"message {i}" for i in range(5)]
+
+
+def test_failed_message_is_redelivered_once(broker, queue_name):
+    """
+    A message whose callback raises is requeued, and dropped if it fails again.
+    """
+    deliveries = []
+
+    def failing(ch, method, properties, body):  # pylint: disable=unused-argument
+        deliveries.append(method.redelivered)
+        raise ValueError("Cannot handle the message")
+
+    def callback(ch, method, properties, body):  # pylint: disable=unused-argument
+        deliveries.append(body.decode())
+
+    broker.publish(queue_name, "poison")
+    broker.publish(queue_name, "next")
+    broker.consume_one(queue_name, failing)
+    broker.consume_one(queue_name, failing)
+    broker.consume_one(queue_name, callback)
+
+    assert deliveries == [False, True, "next"]
+
+
+def test_consumer_pool_handles_every_message(broker, queue_name):
+    """
+    The workers of a pool share the queue and handle every message once.
+    """
+    received = []
+    lock = threading.Lock()
+
+    def callback(ch, method, properties, body):  # pylint: disable=unused-argument
+        with lock:
+            received.append(body.decode())
+
+    messages = [f"message {i}" for i in range(20)]
+    broker.publish_batch(queue_name, messages)
+
+    pool = ConsumerPool(queue_name, callback, workers=3)
+    pool.start()
+    deadline = time.monotonic() + 10
+    while len(received) < len(messages) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    pool.stop(timeout=5)
+
+    assert sorted(received) == sorted(messages)
@@ -1,12 +1,19 @@
 import logging
+import os
 from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 import requests
 from azure.functions import TimerRequest
 from dateutil.relativedelta import relativedelta
 
+from .http_client import http_client
+
 BASE_READ_ROUTE = "http://127.0.0.1:5000/database/query_db"
 BASE_WRITE_ROUTE = "http://127.0.0.1:5000/database/write_db"
+BASE_WRITE_BATCH_ROUTE = "http://127.0.0.1:5000/database/write_batch"
+BASE_PAYOUT_PLAN_ROUTE = "http://127.0.0.1:5000/database/payout_plan"
+BASE_NAMED_QUERY_ROUTE = "http://127.0.0.1:5000/database/named_query"
 
 node_server_create_initial_payment = (
     "http://localhost:3001/payments/initial_outgoing_payment"
@@ -19,6 +26,362 @@ node_server_recurring_payment_with_interest = (
     "http://localhost:3001/payments/process_recurring_winterest_payment"
 )
 
+# "batch" plans the whole run with two set-based queries and persists it with a
+# single request, "per_member" keeps the original request-per-member loop. The
+# per_member loop sends raw SQL, so the database API must run with
+# DATABASE_API_SQL_MODE=raw.
+PAYOUT_ENGINE_MODE = os.getenv("PAYOUT_ENGINE_MODE", "batch")
+
+MASTER_STOKVEL_WALLET = "https://ilp.rafiki.money/masterstokveladdress"
+
+# Members paid and recorded per write of a batch run. A run that stops part way
+# resumes after the last recorded chunk.
+ENGINE_RUN_CHUNK_SIZE = int(os.getenv("ENGINE_RUN_CHUNK_SIZE", "50"))
+# Payment attempts a member gets across the resumes of a run. A member still failing
+# after the last one is marked failed for good, so the rest of its stokvel moves on.
+ENGINE_MAX_MEMBER_ATTEMPTS = int(os.getenv("ENGINE_MAX_MEMBER_ATTEMPTS", "3"))
+
+
+def read_named_query(name: str, parameters: Optional[Dict] = None) -> List[Dict]:
+    """
+    Runs a query registered with the database API by name and returns the rows.
+    """
+    response = http_client.post(
+        BASE_NAMED_QUERY_ROUTE,
+        json={"name": name, "parameters": parameters or {}},
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def write_db_batch(statements: List[Dict]) -> List[int]:
+    """
+    Runs a list of `{"name", "parameters"}` write statements through the database
+    API in a single transaction and returns the rows affected by each statement.
+    """
+    response = http_client.post(
+        BASE_WRITE_BATCH_ROUTE,
+        json={"statements": statements},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()["rowcounts"]
+
+
+def load_engine_run(
+    run_id: str,
+) -> Tuple[Optional[str], Set[Tuple[int, int]], Dict[Tuple[int, int], int]]:
+    """
+    Reads a run from the engine run ledger.
+
+    Returns:
+        Tuple[Optional[str], Set[Tuple[int, int]], Dict[Tuple[int, int], int]]: The
+        status of the run, None if it never started, the (stokvel_id, user_id) of every
+        member it settled, that is completed or failed for good, and the payment
+        attempts made for every member it recorded.
+    """
+    rows = read_named_query("engine_run_status", {"run_id": run_id})
+    if not rows:
+        return None, set(), {}
+    members = [row for row in rows if row["stokvel_id"] is not None]
+    settled = {
+        (row["stokvel_id"], row["user_id"])
+        for row in members
+        if row["member_status"] in ("completed", "failed")
+    }
+    attempts = {(row["stokvel_id"], row["user_id"]): row["attempts"] for row in members}
+    return rows[0]["status"], settled, attempts
+
+
+def load_open_engine_run_dates(engine: str) -> List[str]:
+    """
+    Reads the run dates of every run of the engine the ledger has not completed,
+    oldest first.
+    """
+    rows = read_named_query("open_engine_runs", {"engine": engine})
+    return [row["run_date"] for row in rows]
+
+
+def get_period_delta(payout_period: str) -> Union[timedelta, relativedelta]:
+    """
+    Maps a stokvel payout period onto the delta between two payout dates.
+    """
+    if payout_period == "Days":
+        return timedelta(days=1)
+    if payout_period == "Week":
+        return timedelta(weeks=1)
+    if payout_period == "Months":
+        return relativedelta(months=1)
+    if payout_period == "Years":
+        return relativedelta(years=1)
+    raise ValueError("Invalid payout period specified.")
+
+
+def plan_payouts(input_date: str) -> List[Dict]:
+    """
+    Fetches the payout of every member of every stokvel due on the input date.
+    The database API computes deposits since each member's last payout and their
+    interest share in one request.
+
+    Returns:
+        List[Dict]: One entry per member with the `amount` to pay out, the deposits
+        and interest it is made up of, and the details needed to make the payment.
+    """
+    response = http_client.post(
+        BASE_PAYOUT_PLAN_ROUTE,
+        json={"input_date": input_date},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def execute_member_payout(member_payout: Dict, idempotency_key: str) -> Dict:
+    """
+    Pays a planned payout from the master stokvel wallet to the member's wallet.
+    The ILP server executes a payment once per `idempotency_key`, and replays its
+    response when the same key is sent again.
+
+    Returns:
+        Dict: The new `token` and `manageurl` returned by the ILP server.
+    """
+    payload = {
+        "sender_wallet_address": MASTER_STOKVEL_WALLET,
+        "receiving_wallet_address": member_payout["ILP_wallet"],
+        "manageUrl": member_payout["stokvel_payment_URI"],
+        "previousToken": member_payout["stokvel_payment_token"],
+        "payout_value": str(int(member_payout["amount"] * 100)),
+    }
+    response = http_client.post(
+        node_server_recurring_payment_with_interest,
+        json=payload,
+        headers={"Idempotency-Key": idempotency_key},
+        timeout=10,
+    )
+    response.raise_for_status()
+    body = response.json()
+    return {"token": body["token"], "manageurl": body["manageurl"]}
+
+
+def get_member_status(paid: bool, attempt: int) -> str:
+    """
+    The ledger status of a member after a payment attempt: 'completed' if it was paid,
+    'retry' if it failed with attempts left, and 'failed' for good after the last one.
+    """
+    if paid:
+        return "completed"
+    return "retry" if attempt < ENGINE_MAX_MEMBER_ATTEMPTS else "failed"
+
+
+def run_batch_payouts(input_date: str, tx_date: datetime) -> None:
+    """
+    Resumes every payout run the ledger still holds open, oldest first, then
+    processes the payouts due on the input date.
+
+    Raises:
+        RuntimeError: If any run is left open because some of its members failed and
+            have attempts left.
+    """
+    run_dates = load_open_engine_run_dates("payout")
+    if input_date not in run_dates:
+        run_dates.append(input_date)
+
+    open_runs = [
+        f"payout:{run_date}"
+        for run_date in run_dates
+        if not process_payout_run(run_date, tx_date)
+    ]
+    if open_runs:
+        raise RuntimeError(
+            f"Payout runs left open with failed members: {', '.join(open_runs)}"
+        )
+
+
+def process_payout_run(input_date: str, tx_date: datetime) -> bool:
+    """
+    Plans, pays and persists every payout due on the input date, one chunk of members
+    at a time. Members whose payment fails are logged and left out of the transactions
+    written for the run. The PAYOUTS.NextDate advances are written last, only for the
+    stokvels whose members all completed.
+
+    The run is recorded in the engine run ledger under 'payout:<input_date>'. A
+    chunk's members are recorded as pending, with the idempotency key their ILP call
+    is sent with, before any call is made. Every member is then recorded as completed
+    or failed in the same transaction as their payout, so a run that stops part way
+    resumes with the members it has not completed, repeating their ILP calls under
+    the same keys, and running a completed day again only reads the ledger.
+
+    A run with failed members stays open and their stokvels keep their NextDate, so
+    they are still due for the run date when the next run resumes it. A member that
+    has failed ENGINE_MAX_MEMBER_ATTEMPTS times is recorded as failed for good and
+    quarantined: it is not retried, and its stokvel moves on without it.
+
+    Returns:
+        bool: Whether the run is completed.
+    """
+    run_id = f"payout:{input_date}"
+    status, settled, attempts = load_engine_run(run_id)
+    if status == "completed":
+        logging.info(f"Payout run {run_id} already completed.")
+        return True
+
+    plan = plan_payouts(input_date)
+    logging.info(f"Due payouts for {input_date}: {len(plan)} members")
+
+    if not plan:
+        # An open run whose stokvels have all moved on has nothing left to retry
+        if status is not None:
+            write_db_batch(
+                [{"name": "complete_engine_run", "parameters": {"run_id": run_id}}]
+            )
+        logging.info(f"No payouts due for {input_date}.")
+        return True
+
+    write_db_batch(
+        [
+            {
+                "name": "start_engine_run",
+                "parameters": {
+                    "run_id": run_id,
+                    "engine": "payout",
+                    "run_date": input_date,
+                },
+            }
+        ]
+    )
+
+    pending_payouts = [
+        member_payout
+        for member_payout in plan
+        if (member_payout["stokvel_id"], member_payout["user_id"]) not in settled
+    ]
+    if settled:
+        logging.info(
+            f"Resuming payout run {run_id}: {len(settled)} members already settled."
+        )
+
+    tx_timestamp = tx_date.strftime("%Y-%m-%d %H:%M:%S")
+    date_updates: Dict[int, Dict] = {}
+    for member_payout in plan:
+        stokvel_id = member_payout["stokvel_id"]
+        if stokvel_id not in date_updates:
+            next_date = datetime.strptime(input_date, "%Y-%m-%d") + get_period_delta(
+                member_payout["payout_frequency_duration"]
+            )
+            date_updates[stokvel_id] = {
+                "PreviousDate": input_date,
+                "NextDate": next_date.strftime("%Y-%m-%d"),
+                "stokvel_id": stokvel_id,
+            }
+
+    paid = 0
+    failed_stokvels: Set[int] = set()
+    for start in range(0, len(pending_payouts), ENGINE_RUN_CHUNK_SIZE):
+        end = start + ENGINE_RUN_CHUNK_SIZE
+        chunk = pending_payouts[start:end]
+        pending_ledger_members = [
+            {
+                "run_id": run_id,
+                "stokvel_id": member_payout["stokvel_id"],
+                "user_id": member_payout["user_id"],
+                "status": "pending",
+                "tx_type": "PAYOUT",
+                "amount": member_payout["amount"],
+                "idempotency_key": f"{run_id}:{member_payout['stokvel_id']}:{member_payout['user_id']}",
+            }
+            for member_payout in chunk
+        ]
+        write_db_batch(
+            [{"name": "record_engine_run_member", "parameters": pending_ledger_members}]
+        )
+
+        transactions = []
+        token_updates = []
+        ledger_members = []
+
+        for member_payout, pending_ledger_member in zip(chunk, pending_ledger_members):
+            stokvel_id = member_payout["stokvel_id"]
+            user_id = member_payout["user_id"]
+            ledger_member = {**pending_ledger_member, "status": "completed"}
+            ledger_members.append(ledger_member)
+
+            try:
+                payment = execute_member_payout(
+                    member_payout, ledger_member["idempotency_key"]
+                )
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                logging.error(
+                    f"Payout failed for user_id {user_id} in stokvel_id {stokvel_id}: {e}"
+                )
+                ledger_member["status"] = get_member_status(
+                    False, attempts.get((stokvel_id, user_id), 0) + 1
+                )
+                if ledger_member["status"] == "retry":
+                    failed_stokvels.add(stokvel_id)
+                else:
+                    logging.error(
+                        f"Payout of user_id {user_id} in stokvel_id {stokvel_id} "
+                        f"failed {ENGINE_MAX_MEMBER_ATTEMPTS} times, quarantined in {run_id}."
+                    )
+                continue
+
+            transactions.append(
+                {
+                    "user_id": user_id,
+                    "stokvel_id": stokvel_id,
+                    "amount": member_payout["amount"],
+                    "tx_type": "PAYOUT",
+                    "tx_date": tx_timestamp,
+                    "created_at": tx_timestamp,
+                    "updated_at": tx_timestamp,
+                }
+            )
+            token_updates.append(
+                {
+                    "new_token": payment["token"],
+                    "new_uri": payment["manageurl"],
+                    "stokvel_id": stokvel_id,
+                    "user_id": user_id,
+                }
+            )
+
+        # Persist the chunk and its ledger entries in one request and one commit
+        write_db_batch(
+            [
+                {"name": "insert_transaction", "parameters": transactions},
+                {
+                    "name": "update_member_stokvel_payment_token",
+                    "parameters": token_updates,
+                },
+                {"name": "record_engine_run_member", "parameters": ledger_members},
+            ]
+        )
+        paid += len(transactions)
+
+    statements = [
+        {
+            "name": "update_next_payout_date",
+            "parameters": [
+                date_update
+                for stokvel_id, date_update in date_updates.items()
+                if stokvel_id not in failed_stokvels
+            ],
+        }
+    ]
+    if not failed_stokvels:
+        statements.append(
+            {"name": "complete_engine_run", "parameters": {"run_id": run_id}}
+        )
+    write_db_batch(statements)
+
+    logging.info(
+        f"Batch payout run {run_id}: {paid} of {len(pending_payouts)} pending "
+        f"members paid across {len(date_updates)} stokvels, "
+        f"{len(failed_stokvels)} stokvels left open."
+    )
+    return not failed_stokvels
+
 
 def main(DailyPayoutOperation: TimerRequest) -> None:
     """
@@ -29,8 +392,12 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
     tx_date = datetime.now(timezone.utc)  # Use UTC
 
     try:
+        if PAYOUT_ENGINE_MODE == "batch":
+            run_batch_payouts(input_date=input_date, tx_date=tx_date)
+            return
+
         # Step 1: Check if the payout process should be kicked off
-        payout_trigger_date_response = requests.post(
+        payout_trigger_date_response = http_client.post(
             BASE_READ_ROUTE,
             json={
                 "query": (
@@ -67,7 +434,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
             logging.info(f"Processing stokvel_id: {stokvel_id}")
 
             # Fetch all members of the stokvel
-            stokvel_members_response = requests.post(
+            stokvel_members_response = http_client.post(
                 BASE_READ_ROUTE,
                 json={
                     "query": (
@@ -75,6 +442,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                         SELECT *
                         FROM STOKVEL_MEMBERS
                         WHERE stokvel_id = :stokvel_id
+                        AND active_status IS NOT 'pending_grant'
                         """
                     ),
                     "parameters": {"stokvel_id": stokvel_id},
@@ -103,7 +471,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
 
                 # SQL query to sum deposits after the most recent payout
 
-                deposits_response = requests.post(
+                deposits_response = http_client.post(
                     BASE_READ_ROUTE,
                     json={
                         "query": (
@@ -147,7 +515,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                     print("No deposits found or error in the query response.")
 
                 # Step 3: Calculate accumulated interest for the stokvel after the most recent payout
-                interest_response = requests.post(
+                interest_response = http_client.post(
                     BASE_READ_ROUTE,
                     json={
                         "query": (
@@ -189,7 +557,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                 )
 
                 # Step 4: Calculate the user's share of the interest
-                user_interest_response = requests.post(
+                user_interest_response = http_client.post(
                     BASE_READ_ROUTE,
                     json={
                         "query": (
@@ -222,7 +590,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                 print(user_interest_response_data)
                 print(user_monthly_deposits)
 
-                stokvel_deposit_response = requests.post(
+                stokvel_deposit_response = http_client.post(
                     BASE_READ_ROUTE,
                     json={
                         "query": (
@@ -285,48 +653,19 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                 print(
                     f"Processing member: user_id={user_id}, amount={amount}, tx_type={tx_type}"
                 )
-                # Step 3: Get the next unique transaction ID
-                table_name = "TRANSACTIONS"
-                id_column = "id"
-
-                max_id_response = requests.post(
-                    BASE_READ_ROUTE,
-                    json={
-                        "query": f"SELECT MAX({id_column}) AS max_id FROM {table_name}"
-                    },
-                    timeout=10,
-                )
-
-                # Raise an exception for HTTP error responses
-                max_id_response.raise_for_status()
-
-                # Parse the JSON response
-                max_id_result = max_id_response.json()
-
-                logging.info(f"Max ID result: {max_id_result}")
-                print(f"Max ID result: {max_id_result}")
-
-                if max_id_result and isinstance(max_id_result, list):
-                    max_id = max_id_result[0].get("max_id", 0)
-                    id = (max_id or 0) + 1
-                else:
-                    id = 1
-
-                logging.info(f"Calculated transaction ID: {id}")
 
                 # Step 4: Insert the transaction
 
                 # Inser
 
-                insert_response = requests.post(
+                insert_response = http_client.post(
                     BASE_WRITE_ROUTE,
                     json={
                         "query": """
-                        INSERT INTO TRANSACTIONS (id, user_id, stokvel_id, amount, tx_type, tx_date, created_at, updated_at)
-                        VALUES (:id, :user_id, :stokvel_id, :amount, :tx_type, :tx_date, :created_at, :updated_at)
+                        INSERT INTO TRANSACTIONS (user_id, stokvel_id, amount, tx_type, tx_date, created_at, updated_at)
+                        VALUES (:user_id, :stokvel_id, :amount, :tx_type, :tx_date, :created_at, :updated_at)
                         """,
                         "parameters": {
-                            "id": id,
                             "user_id": user_id,
                             "stokvel_id": stokvel_id,
                             "amount": amount,
@@ -345,7 +684,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                 insert_response.raise_for_status()
 
                 logging.info(
-                    f"Inserted transaction ID {id} for user_id {user_id} and stokvel_id {stokvel_id}."
+                    f"Inserted transaction for user_id {user_id} and stokvel_id {stokvel_id}."
                 )
                 logging.info(
                     f"Insert response status: {insert_response.status_code}, response text: {insert_response.text}"
@@ -355,7 +694,6 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                 )
 
                 parameters = {
-                    "id": id,
                     "user_id": user_id,
                     "stokvel_id": stokvel_id,
                     "amount": amount,
@@ -383,7 +721,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                 parameters = {"stokvel_id": stokvel_id, "user_id": user_id}
 
                 # Send the POST request to the API
-                stokvel_members_details_response = requests.post(
+                stokvel_members_details_response = http_client.post(
                     BASE_READ_ROUTE,  # Assuming you're using a different route for reads
                     json={
                         "query": query,
@@ -414,7 +752,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                 print(f"Payload: {payload}")
                 print(f"Previous Token: {payload['previousToken']}")
 
-                recurring_payment_response = requests.post(
+                recurring_payment_response = http_client.post(
                     node_server_recurring_payment_with_interest,
                     json=payload,
                     timeout=10,
@@ -444,7 +782,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                 }
 
                 # Send the POST request to the API
-                stokvel_members_token_url_update_response = requests.post(
+                stokvel_members_token_url_update_response = http_client.post(
                     BASE_WRITE_ROUTE,  # Assuming you're using a different route for reads
                     json={
                         "query": update_token_url_query,
@@ -484,7 +822,7 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
                 }
 
                 # Send the POST request to the API
-                stokvel_payouts_update_response = requests.post(
+                stokvel_payouts_update_response = http_client.post(
                     BASE_WRITE_ROUTE,  # Assuming you're using a different route for reads
                     json={
                         "query": update_next_payout_query,
@@ -514,6 +852,9 @@ def main(DailyPayoutOperation: TimerRequest) -> None:
         logging.error(f"Error in {main.__name__}: {e}")
         raise
 
+    finally:
+        logging.info(f"HTTP latency by host: {http_client.latency_stats()}")
+
 
 if __name__ == "__main__":
     main(None)
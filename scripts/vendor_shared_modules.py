@@ -0,0 +1,78 @@
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Shared modules and the Azure function packages they are copied into. The functions
+# deploy standalone, so they cannot import from the rest of the repository.
+VENDORED_MODULES: Dict[str, List[str]] = {
+    "whatsapp_utils/_utils/http_client.py": [
+        "contribution_engine/DailyContributionOperation/http_client.py",
+        "payout_engine/DailyPayoutOperation/http_client.py",
+    ],
+}
+
+VENDORED_HEADER = (
+    "# Vendored from {source} by scripts/vendor_shared_modules.py.\n"
+    "# Do not edit this copy, change the shared module instead.\n\n"
+)
+
+
+def vendored_contents(root: Path = REPO_ROOT) -> Dict[Path, str]:
+    """
+    Returns the expected content of every vendored copy, keyed by its path.
+
+    Args:
+        root (Path): The repository root.
+    """
+    contents = {}
+    for source, destinations in VENDORED_MODULES.items():
+        content = VENDORED_HEADER.format(source=source) + (root / source).read_text()
+        for destination in destinations:
+            contents[root / destination] = content
+    return contents
+
+
+def vendor_shared_modules(root: Path = REPO_ROOT) -> List[Path]:
+    """
+    Copies every shared module into the function packages that use it.
+
+    Args:
+        root (Path): The repository root.
+
+    Returns:
+        List[Path]: The vendored copies written.
+    """
+    written = []
+    for path, content in vendored_contents(root).items():
+        path.write_text(content)
+        written.append(path)
+    return written
+
+
+def stale_vendored_modules(root: Path = REPO_ROOT) -> List[Path]:
+    """
+    Returns the vendored copies that are missing or differ from their shared module.
+
+    Args:
+        root (Path): The repository root.
+    """
+    return [
+        path
+        for path, content in vendored_contents(root).items()
+        if not path.exists() or path.read_text() != content
+    ]
+
+
+# The vendored copies are committed. Run from the repository root after changing a
+# shared module: python scripts/vendor_shared_modules.py
+# CI fails if a copy is out of date: python scripts/vendor_shared_modules.py --check
+if __name__ == "__main__":
+    if "--check" in sys.argv[1:]:
+        stale = stale_vendored_modules()
+        for stale_path in stale:
+            print(f"{stale_path.relative_to(REPO_ROOT)} is out of date")
+        sys.exit(1 if stale else 0)
+    for vendored_path in vendor_shared_modules():
+        print(f"Vendored {vendored_path.relative_to(REPO_ROOT)}")
@@ -1,16 +1,125 @@
-from typing import Dict, Optional
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
 
 import requests
+from flask import Flask
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+
+from whatsapp_utils._utils.http_client import http_client
 
 # LOCAT TESTING
 # BASE_URL = "http://127.0.0.1:5000"
 # Production URL
 BASE_URL = "https://digistokvel-api.onrender.com"
+# "local" calls the API's route handlers in-process when the WhatsApp bot runs inside the API,
+# "http" always goes through BASE_URL, for deployments where the bot and the API are split
+ACTION_DISPATCH_MODE = os.getenv("ACTION_DISPATCH_MODE", "local")
+
+FAILURE_MESSAGE = "Something went wrong, please try sending the action again."
+
+_local_app: Optional[Flask] = None
+_resolved_handlers: Dict[Tuple[str, str], Optional[Tuple[Callable, Dict]]] = {}
+_resolved_handlers_lock = threading.Lock()
+
+
+def register_local_app(app: Flask) -> None:
+    """
+    Registers the Flask app whose routes action requests are dispatched to in-process.
+
+    Args:
+        app (Flask): The API app serving the endpoints in action_requests.
+    """
+    global _local_app
+    _local_app = app
+    with _resolved_handlers_lock:
+        _resolved_handlers.clear()
+
+
+def resolve_local_handler(
+    endpoint_suffix: str, method: str
+) -> Optional[Tuple[Callable, Dict]]:
+    """
+    Resolves an endpoint suffix to the registered app's view function, once per suffix.
+
+    Args:
+        endpoint_suffix (str): The path of the endpoint, e.g. '/stokvel/stokvel_summary'.
+        method (str): The HTTP method of the request.
+
+    Returns:
+        Optional[Tuple[Callable, Dict]]: The view function and its URL arguments, or None
+        if no app is registered or it has no route for the endpoint.
+    """
+    if _local_app is None:
+        return None
+
+    key = (endpoint_suffix, method)
+    with _resolved_handlers_lock:
+        if key in _resolved_handlers:
+            return _resolved_handlers[key]
+
+    try:
+        endpoint, view_args = _local_app.url_map.bind("localhost").match(
+            endpoint_suffix, method=method
+        )
+        handler: Optional[Tuple[Callable, Dict]] = (
+            _local_app.view_functions[endpoint],
+            dict(view_args),
+        )
+    except (NotFound, MethodNotAllowed):
+        handler = None
+
+    with _resolved_handlers_lock:
+        _resolved_handlers[key] = handler
+    return handler
+
+
+def dispatch_local(
+    endpoint_suffix: str, payload: Optional[Dict] = None
+) -> Optional[str]:
+    """
+    Calls an endpoint's route handler directly, in a request context built from the payload.
+
+    Args:
+        endpoint_suffix (str): The path of the endpoint.
+        payload (Optional[Dict], optional): The JSON body of a POST request. A GET request
+                                            is made if not provided.
+
+    Returns:
+        Optional[str]: The text of the response, or None if the endpoint cannot be handled
+        in-process and has to be requested over HTTP.
+    """
+    app = _local_app
+    method = "POST" if payload is not None else "GET"
+    handler = resolve_local_handler(endpoint_suffix, method)
+    if app is None or handler is None:
+        return None
+
+    view, view_args = handler
+    try:
+        with app.test_request_context(endpoint_suffix, method=method, json=payload):
+            response = app.make_response(view(**view_args))
+    except Exception as err:
+        print(
+            f"Local dispatch error: {err} - Endpoint: {endpoint_suffix} - Payload: {payload}"
+        )
+        return FAILURE_MESSAGE
+
+    if response.status_code >= 400:
+        print(
+            f"Local dispatch returned {response.status_code} - Endpoint: {endpoint_suffix} - Payload: {payload}"
+        )
+        return FAILURE_MESSAGE
+    return response.get_data(as_text=True)
 
 
 def query_endpoint(endpoint_suffix: str, payload: Optional[Dict] = None) -> str:
     """
-    Sends an HTTP request to a specified API endpoint and returns the response as a string.
+    Sends a request to a specified API endpoint and returns the response as a string.
+
+    The endpoint's route handler is called in-process when the API app is registered and
+    ACTION_DISPATCH_MODE is "local", otherwise, and for endpoints the app does not serve,
+    an HTTP request is sent.
 
     This method constructs a full URL by appending the `endpoint_suffix` to the base URL,
     then sends either a GET or POST request based on whether a payload is provided.
@@ -30,22 +139,27 @@ def query_endpoint(endpoint_suffix: str, payload: Optional[Dict] = None) -> str:
         Exception: For any other exceptions during the request.
     """
 
+    if ACTION_DISPATCH_MODE == "local":
+        msg = dispatch_local(endpoint_suffix=endpoint_suffix, payload=payload)
+        if msg is not None:
+            return msg
+
     full_url = f"{BASE_URL}{endpoint_suffix}"
 
     try:
         if payload is not None:  # POST request
-            response = requests.post(full_url, json=payload, timeout=5)
+            response = http_client.post(full_url, json=payload, timeout=5)
         else:  # GET request
-            response = requests.get(full_url, timeout=5)
+            response = http_client.get(full_url, timeout=5)
 
         response.raise_for_status()
         return response.text
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred: {http_err} - URL: {full_url} - Payload: {payload}")
-        return "Something went wrong, please try sending the action again."
+        return FAILURE_MESSAGE
     except requests.exceptions.RequestException as req_err:
         print(f"Request error: {req_err} - URL: {full_url} - Payload: {payload}")
-        return "Something went wrong, please try sending the action again."
+        return FAILURE_MESSAGE
     except Exception as err:
         print(f"Other error occurred: {err} - URL: {full_url} - Payload: {payload}")
-        return "Something went wrong, please try sending the action again."
+        return FAILURE_MESSAGE
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# The Azure engines deploy standalone, so scripts/vendor_shared_modules.py copies this
+# module next to each engine function at build time.
+
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+# Distinct hosts kept in the pool, and open connections kept per host. Requests to a
+# host wait for a free connection once HTTP_POOL_MAXSIZE are in flight.
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+# Retries wait backoff_factor * 2 ** (retry - 1) seconds
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.3"))
+
+
+class HttpClient:
+    """
+    A pooled, keep-alive HTTP client shared by every outbound call of a process.
+
+    Connections are reused per host, and at most `pool_maxsize` requests run against
+    one host at a time. Failed connections are retried with exponential backoff for
+    every method. Read errors and 429/502/503/504 responses are only retried for
+    idempotent methods, so a payment POST is never sent twice. The latency of every
+    call is recorded per method and host.
+
+    Args:
+        timeout (float): The default timeout of a request, in seconds.
+        pool_connections (int): The number of hosts to keep connection pools for.
+        pool_maxsize (int): The number of connections kept, and requests allowed, per host.
+        retries (int): The number of retries of a failed request.
+        backoff_factor (float): The backoff factor between retries.
+    """
+
+    def __init__(
+        self,
+        timeout: float,
+        pool_connections: int,
+        pool_maxsize: int,
+        retries: int,
+        backoff_factor: float,
+    ) -> None:
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry,
+            pool_block=True,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._latencies: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request through the shared session, with the default timeout unless one is given.
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails after its retries.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self._record_latency(
+                f"{method.upper()} {urlparse(url).netloc}",
+                time.perf_counter() - start,
+                failed,
+            )
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a GET request, see `request`.
+        """
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a POST request, see `request`.
+        """
+        return self.request("POST", url, **kwargs)
+
+    def _record_latency(self, key: str, elapsed_seconds: float, failed: bool) -> None:
+        elapsed_ms = elapsed_seconds * 1000
+        with self._lock:
+            stats = self._latencies.setdefault(
+                key, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            stats["calls"] += 1
+            stats["errors"] += int(failed)
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the call and error count and the average and maximum latency per method and host.
+        """
+        with self._lock:
+            return {
+                key: {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "avg_ms": round(stats["total_ms"] / stats["calls"], 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                }
+                for key, stats in self._latencies.items()
+            }
+
+
+http_client = HttpClient(
+    timeout=HTTP_TIMEOUT_SECONDS,
+    pool_connections=HTTP_POOL_CONNECTIONS,
+    pool_maxsize=HTTP_POOL_MAXSIZE,
+    retries=HTTP_RETRIES,
+    backoff_factor=HTTP_BACKOFF_FACTOR,
+)
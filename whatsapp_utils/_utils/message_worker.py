@@ -0,0 +1,88 @@
+import os
+import queue
+import threading
+import zlib
+from typing import List, Optional, Tuple
+
+from whatsapp_utils._utils.api_requests import FAILURE_MESSAGE
+from whatsapp_utils._utils.state_manager import MessageStateManager
+from whatsapp_utils._utils.twilio_messenger import send_notification_message
+
+# Number of threads processing WhatsApp messages in the background
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", "4"))
+
+
+def process_message(from_number: str, incoming_msg: str) -> None:
+    """
+    Runs a WhatsApp message through the state manager and sends the reply to the user
+    as a notification.
+
+    Parameters:
+    from_number (str): The sender's number, e.g. 'whatsapp:+27821234567'.
+    incoming_msg (str): The content of the message.
+    """
+    try:
+        state_manager = MessageStateManager(user_number=from_number, twiml=False)
+        msg = state_manager.processes_user_request(user_action=incoming_msg)
+    except Exception as e:
+        print(f"Error processing WhatsApp message from {from_number}: {e}")
+        msg = FAILURE_MESSAGE
+
+    if msg:
+        send_notification_message(to=from_number, body=str(msg))
+
+
+class MessageWorkerPool:
+    """
+    Processes WhatsApp messages on background threads, so the webhook can acknowledge
+    a message straight away. Every sender is pinned to one worker, so the messages of a
+    user that reach this API process are processed in the order they arrived.
+
+    Args:
+        workers (int): The number of worker threads.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = max(workers, 1)
+        self._queues: List["queue.Queue[Tuple[str, str]]"] = [
+            queue.Queue() for _ in range(self.workers)
+        ]
+        self._threads: Optional[List[threading.Thread]] = None
+        self._lock = threading.Lock()
+
+    def submit(self, from_number: str, incoming_msg: str) -> None:
+        """
+        Queues a message for processing on the sender's worker.
+        """
+        self._start()
+        index = zlib.crc32(from_number.encode()) % self.workers
+        self._queues[index].put((from_number, incoming_msg))
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._threads is not None:
+                return
+            self._threads = [
+                threading.Thread(
+                    target=self._run,
+                    args=(message_queue,),
+                    name=f"whatsapp-worker-{index}",
+                    daemon=True,
+                )
+                for index, message_queue in enumerate(self._queues)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _run(self, message_queue: "queue.Queue[Tuple[str, str]]") -> None:
+        while True:
+            from_number, incoming_msg = message_queue.get()
+            try:
+                process_message(from_number=from_number, incoming_msg=incoming_msg)
+            except Exception as e:
+                print(f"Error sending the WhatsApp reply to {from_number}: {e}")
+            finally:
+                message_queue.task_done()
+
+
+message_workers = MessageWorkerPool(workers=WHATSAPP_WORKERS)
@@ -0,0 +1,283 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from twilio.base.exceptions import TwilioRestException
+
+from database.notification_outbox import (
+    claim_notifications,
+    count_notifications_by_status,
+    enqueue_notifications,
+    settle_notifications,
+)
+from whatsapp_utils._utils.twilio_client import TwilioClient
+
+# Most notifications claimed from NOTIFICATION_OUTBOX per batch
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "50"))
+# Threads sending a batch, each one working through the messages of one number at a time
+NOTIFICATION_SEND_WORKERS = int(os.getenv("NOTIFICATION_SEND_WORKERS", "4"))
+# Messages per second allowed across the Twilio account
+NOTIFICATION_ACCOUNT_RATE = float(os.getenv("NOTIFICATION_ACCOUNT_RATE", "10"))
+# API worker processes, each running a sender with an equal share of the account rate
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Least time between two messages to the same number
+NOTIFICATION_NUMBER_INTERVAL_SECONDS = float(
+    os.getenv("NOTIFICATION_NUMBER_INTERVAL_SECONDS", "1")
+)
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+# Retries wait retry_delay * 2 ** (attempt - 1) seconds
+NOTIFICATION_RETRY_SECONDS = float(os.getenv("NOTIFICATION_RETRY_SECONDS", "2"))
+# How often the sender looks for due retries when no new notification woke it
+NOTIFICATION_POLL_SECONDS = float(os.getenv("NOTIFICATION_POLL_SECONDS", "5"))
+# Claimed notifications still unsettled after this long are claimed again
+NOTIFICATION_CLAIM_TIMEOUT_SECONDS = float(
+    os.getenv("NOTIFICATION_CLAIM_TIMEOUT_SECONDS", "300")
+)
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket allowing `rate` acquisitions per second, with bursts of
+    up to `rate` acquisitions.
+
+    Args:
+        rate (float): The acquisitions allowed per second.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Blocks until a token is available and takes it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """
+    Whether a send failed in a way retrying cannot fix, such as an invalid number.
+    """
+    return (
+        isinstance(error, TwilioRestException)
+        and 400 <= error.status < 500
+        and error.status != 429
+    )
+
+
+class NotificationOutbox:
+    """
+    Sends WhatsApp notifications in the background from the durable NOTIFICATION_OUTBOX
+    table, so a request only pays for an INSERT. A sender thread claims due notifications
+    in batches and sends them on a small thread pool, within its share of the account
+    rate and the per-number interval. The messages of one number are sent in the order they were
+    queued. Failed sends are retried with exponential backoff until `max_attempts`,
+    and a number's later messages wait behind its failed one.
+
+    Notifications survive restarts, and ones claimed by a process that stopped part
+    way are sent again after `claim_timeout` seconds, so delivery is at least once.
+
+    Args:
+        client (TwilioClient): The client notifications are sent with.
+        batch_size (int): The most notifications claimed at once.
+        send_workers (int): The threads sending a batch.
+        account_rate (float): The messages per second this sender may send.
+        number_interval (float): The least seconds between two messages to one number.
+        max_attempts (int): The sends attempted before a notification is marked failed.
+        retry_delay (float): The backoff of the first retry, in seconds.
+        poll_interval (float): Seconds between looks for due retries.
+        claim_timeout (float): Seconds after which an unsettled claim is abandoned.
+    """
+
+    def __init__(
+        self,
+        client: TwilioClient,
+        batch_size: int,
+        send_workers: int,
+        account_rate: float,
+        number_interval: float,
+        max_attempts: int,
+        retry_delay: float,
+        poll_interval: float,
+        claim_timeout: float,
+    ) -> None:
+        self.client = client
+        self.batch_size = batch_size
+        self.number_interval = number_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self._account_limiter = RateLimiter(rate=account_rate)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(send_workers, 1), thread_name_prefix="notification-sender"
+        )
+        self._last_sent: Dict[str, float] = {}
+        self._last_sent_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, to: str, body: str) -> None:
+        """
+        Queues a notification to be sent in the background.
+        """
+        self.enqueue_many([(to, body)])
+
+    def enqueue_many(self, messages: List[Tuple[str, str]]) -> None:
+        """
+        Queues several (to, body) notifications with a single INSERT.
+        """
+        enqueue_notifications(messages)
+        self.start()
+        self._wake.set()
+
+    def start(self) -> None:
+        """
+        Starts the sender thread, if it is not running yet.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="notification-outbox", daemon=True
+            )
+            self._thread.start()
+
+    def drain_once(self) -> int:
+        """
+        Claims one batch of due notifications, sends it and records the outcome.
+
+        Returns:
+            int: The number of notifications claimed.
+        """
+        notifications = claim_notifications(
+            limit=self.batch_size,
+            stale_before=datetime.now() - timedelta(seconds=self.claim_timeout),
+        )
+        if not notifications:
+            return 0
+
+        by_number: Dict[str, List[Dict[str, Any]]] = {}
+        for notification in notifications:
+            by_number.setdefault(notification["to_number"], []).append(notification)
+
+        sent_ids: List[int] = []
+        retries: List[Dict[str, Any]] = []
+        failures: List[Dict[str, Any]] = []
+        for number_sent, number_retries, number_failures in self._executor.map(
+            self._send_number, by_number.items()
+        ):
+            sent_ids.extend(number_sent)
+            retries.extend(number_retries)
+            failures.extend(number_failures)
+
+        settle_notifications(sent_ids=sent_ids, retries=retries, failures=failures)
+        return len(notifications)
+
+    def status_counts(self) -> Dict[str, int]:
+        """
+        Returns the number of notifications per status.
+        """
+        return count_notifications_by_status()
+
+    def _send_number(
+        self, item: Tuple[str, List[Dict[str, Any]]]
+    ) -> Tuple[List[int], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        to_number, notifications = item
+        sent_ids: List[int] = []
+        retries: List[Dict[str, Any]] = []
+        failures: List[Dict[str, Any]] = []
+
+        for index, notification in enumerate(notifications):
+            self._wait_for_number(to_number)
+            self._account_limiter.acquire()
+            try:
+                self.client.send_mesage_notification(to_number, notification["body"])
+            except Exception as e:
+                print(f"Error sending notification {notification['id']}: {e}")
+                attempts = notification["attempts"] + 1
+                if is_permanent_failure(e) or attempts >= self.max_attempts:
+                    failures.append({"id": notification["id"], "last_error": str(e)})
+                    continue
+
+                next_attempt_at = datetime.now() + timedelta(
+                    seconds=self.retry_delay * 2 ** (attempts - 1)
+                )
+                # The number's later messages wait, so they are not delivered out of order
+                retries.extend(
+                    {
+                        "id": waiting["id"],
+                        "next_attempt_at": next_attempt_at,
+                        "last_error": str(e),
+                        "attempted": int(waiting is notification),
+                    }
+                    for waiting in notifications[index:]
+                )
+                break
+            else:
+                sent_ids.append(notification["id"])
+
+        return sent_ids, retries, failures
+
+    def _wait_for_number(self, to_number: str) -> None:
+        with self._last_sent_lock:
+            last_sent = self._last_sent.get(to_number)
+        if last_sent is not None:
+            wait = last_sent + self.number_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        with self._last_sent_lock:
+            self._last_sent[to_number] = time.monotonic()
+
+    def _forget_idle_numbers(self) -> None:
+        cutoff = time.monotonic() - self.number_interval
+        with self._last_sent_lock:
+            self._last_sent = {
+                number: last_sent
+                for number, last_sent in self._last_sent.items()
+                if last_sent > cutoff
+            }
+
+    def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                claimed = self.drain_once()
+            except Exception as e:
+                print(f"Error draining the notification outbox: {e}")
+                claimed = 0
+            self._forget_idle_numbers()
+            if claimed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+
+
+notification_outbox = NotificationOutbox(
+    client=TwilioClient(),
+    batch_size=NOTIFICATION_BATCH_SIZE,
+    send_workers=NOTIFICATION_SEND_WORKERS,
+    account_rate=NOTIFICATION_ACCOUNT_RATE / max(WEB_CONCURRENCY, 1),
+    number_interval=NOTIFICATION_NUMBER_INTERVAL_SECONDS,
+    max_attempts=NOTIFICATION_MAX_ATTEMPTS,
+    retry_delay=NOTIFICATION_RETRY_SECONDS,
+    poll_interval=NOTIFICATION_POLL_SECONDS,
+    claim_timeout=NOTIFICATION_CLAIM_TIMEOUT_SECONDS,
+)
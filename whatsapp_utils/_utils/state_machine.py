@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping, Optional, Tuple
+
+from whatsapp_utils._utils.state_config import MESSAGE_STATES
+
+BACK_STATE_TAG = "back_state"
+# States built at request time by an API route rather than defined in message_config
+DYNAMIC_STATE_TAGS = frozenset({"my_stokvels"})
+
+EMPTY_MAPPING: Mapping = MappingProxyType({})
+
+
+@dataclass(frozen=True)
+class CompiledState:
+    """
+    An immutable, precomputed state of the WhatsApp conversation.
+
+    Attributes:
+        tag (str): The full tag the state is stored under in the user's state stack.
+        message (str): The message shown when the user enters the state.
+        valid_actions (FrozenSet[str]): The actions the user can take in the state.
+        state_selection (Mapping[str, str]): Actions that move to another state, by target tag.
+        action_responses (Mapping[str, str]): Actions answered with a fixed message.
+        action_requests (Mapping[str, str]): Actions answered by an API endpoint.
+        input_request_states (Mapping[str, CompiledState]): Actions that ask the user for input first.
+        current_stokvels (Tuple[str, ...]): The stokvels listed by a dynamic stokvel selection state.
+        unrecognized_message (str): The message shown when the user sends an action the state does not allow.
+        valid_type (Optional[type]): The type user input must convert to in an input request state.
+        invalid_message (Optional[str]): The message shown when user input is invalid.
+        action (Optional[str]): The action an input request state collects input for.
+    """
+
+    tag: str
+    message: str
+    valid_actions: FrozenSet[str]
+    state_selection: Mapping[str, str]
+    action_responses: Mapping[str, str]
+    action_requests: Mapping[str, str]
+    input_request_states: Mapping[str, "CompiledState"]
+    current_stokvels: Tuple[str, ...]
+    unrecognized_message: str
+    valid_type: Optional[type] = None
+    invalid_message: Optional[str] = None
+    action: Optional[str] = None
+
+    @property
+    def is_input_request(self) -> bool:
+        """
+        Whether the state collects free-form input instead of a menu selection.
+        """
+        return "input_request" in self.tag
+
+
+def compile_state(
+    definition: Dict[str, Any], unrecognized_state: str, tag: Optional[str] = None
+) -> CompiledState:
+    """
+    Compiles a state definition from message_config, or one returned by a dynamic state
+    endpoint, into a CompiledState.
+
+    Args:
+        definition (Dict[str, Any]): The state definition.
+        unrecognized_state (str): The prefix of the unrecognized action message.
+        tag (Optional[str]): The tag to compile the state under, defaults to the definition's tag.
+
+    Returns:
+        CompiledState: The compiled state.
+    """
+    tag = tag if tag is not None else definition["tag"]
+    message = definition.get("message", "")
+    # The options of a menu follow the first colon of its message
+    options = message.split(":")[1] if ":" in message else message
+
+    input_request_states = {
+        action: compile_state(
+            input_state,
+            unrecognized_state=unrecognized_state,
+            tag=f"{tag}:input_request_states:{action}",
+        )
+        for action, input_state in definition.get("input_request_states", {}).items()
+    }
+
+    return CompiledState(
+        tag=tag,
+        message=message,
+        valid_actions=frozenset(definition.get("valid_actions", [])),
+        state_selection=MappingProxyType(dict(definition.get("state_selection", {}))),
+        action_responses=MappingProxyType(dict(definition.get("action_responses", {}))),
+        action_requests=MappingProxyType(dict(definition.get("action_requests", {}))),
+        input_request_states=MappingProxyType(input_request_states),
+        current_stokvels=tuple(definition.get("current_stokvels", [])),
+        valid_type=definition.get("valid_type"),
+        invalid_message=definition.get("invalid_message"),
+        action=definition.get("action"),
+        unrecognized_message=unrecognized_state + options,
+    )
+
+
+class StateMachine:
+    """
+    The conversation states of the WhatsApp bot, compiled once from MESSAGE_STATES so
+    every state, transition and response is a dictionary lookup. Input request states
+    are reachable under their full tag, e.g. 'admin_services:input_request_states:1'.
+
+    Args:
+        message_states (Mapping[Any, Any]): The state configuration, see state_config.MESSAGE_STATES.
+            Its state tags are built from message_config, so they are not typed as str.
+
+    Raises:
+        ValueError: If a state selection leads to a state that does not exist.
+    """
+
+    def __init__(self, message_states: Mapping[Any, Any]) -> None:
+        self.base_greetings: FrozenSet[str] = frozenset(message_states["base_state"])
+        self.unrecognized_state: str = message_states["unrecognized_state"]
+
+        states: Dict[str, CompiledState] = {}
+        for tag, definition in message_states.items():
+            if not isinstance(definition, dict):
+                continue
+            state = compile_state(
+                definition, unrecognized_state=self.unrecognized_state, tag=tag
+            )
+            states[state.tag] = state
+            for input_state in state.input_request_states.values():
+                states[input_state.tag] = input_state
+        self._states: Mapping[str, CompiledState] = MappingProxyType(states)
+
+        known_targets = states.keys() | DYNAMIC_STATE_TAGS | {BACK_STATE_TAG}
+        for state in states.values():
+            for target in state.state_selection.values():
+                if target not in known_targets:
+                    raise ValueError(
+                        f"State '{state.tag}' selects unknown state '{target}'."
+                    )
+
+    def get(self, tag: Optional[str]) -> Optional[CompiledState]:
+        """
+        Returns the compiled state stored under a tag, or None if there is none.
+        """
+        if tag is None:
+            return None
+        return self._states.get(tag)
+
+    def compile_dynamic(self, definition: Dict[str, Any]) -> CompiledState:
+        """
+        Compiles a state built at request time, such as the user's stokvel selection.
+        """
+        return compile_state(definition, unrecognized_state=self.unrecognized_state)
+
+
+state_machine = StateMachine(MESSAGE_STATES)
@@ -1,22 +1,15 @@
 import json
-from typing import Dict, List, Optional, Tuple, Union, cast
-
-from database.state_manager.queries import (
-    check_if_unregistered_state_exists,
-    get_current_stokvel_selection,
-    get_state_responses,
-    pop_previous_state,
-    set_current_stokvel_selection,
-    update_current_state,
-)
-from database.user_queries.queries import (
-    check_if_number_exists_sqlite,
-    check_if_number_is_admin,
-)
+from typing import Dict, FrozenSet, Mapping, Optional, Tuple, Union
+
+from database.state_manager.session import UserSession, session_cache
 from whatsapp_utils._utils.api_requests import query_endpoint
-from whatsapp_utils._utils.state_config import MESSAGE_STATES
+from whatsapp_utils._utils.state_machine import (
+    BACK_STATE_TAG,
+    EMPTY_MAPPING,
+    CompiledState,
+    state_machine,
+)
 from whatsapp_utils._utils.twilio_messenger import send_conversational_message
-from whatsapp_utils.schemas.state_schema import StateSchema
 
 
 class MessageStateManager:
@@ -31,51 +24,56 @@ class MessageStateManager:
     is_admin (bool): Indicates if the user has admin privileges.
     current_state_tag (str): The current state of the user interaction.
     previous_state_tag (str): The previous state of the user interaction.
-    current_state (StateSchema): The schema defining the current state's behavior.
-    previous_state (StateSchema): The schema defining the previous state's behavior.
+    current_state (CompiledState): The compiled definition of the current state's behavior.
     state_index (int): Index for managing state transitions.
+    session (UserSession): The user's cached conversation state.
+    twiml (bool): Whether replies are formatted as TwiML or returned as plain text.
     """
 
     # We handle registration outside, this is purely for state management
-    def __init__(self, user_number: str) -> None:
+    def __init__(self, user_number: str, twiml: bool = True) -> None:
         """
         Initializes the state manager with the user's phone number and retrieves
         the user's registration status, admin status, and current and previous
-        states from the database.
+        states from the session cache.
 
         Parameters:
         user_number (str): The phone number of the user interacting with the system.
+        twiml (bool): Format replies as TwiML for a webhook response, or as plain text
+        to send later as a notification.
         """
-        self.base_greetings = MESSAGE_STATES["base_state"]
-        self.unrecognized_state = MESSAGE_STATES["unrecognized_state"]
+        self.base_greetings = state_machine.base_greetings
         self.user_number = user_number
+        self.twiml = twiml
+        self.session: UserSession = session_cache.get(from_number=user_number)
         self.registration_status = self.check_registration_status()
         self.is_admin = self.check_admin_status()
         self.current_state_tag: Optional[str] = None
-        self.current_state: Union[Dict, StateSchema] = {}
+        self.current_state: Optional[CompiledState] = None
         self.update_local_states()
 
     def check_registration_status(self) -> bool:
         """
-        Checks if the user's phone number is registered in the database.
+        Checks if the user's phone number is registered, as cached with the session.
 
         Returns:
         bool: True if the user is registered, False otherwise.
         """
-        return check_if_number_exists_sqlite(from_number=self.user_number)
+        return self.session.registration_status
 
     def check_admin_status(self) -> bool:
         """
-        Checks if the user's phone number belongs to an admin.
+        Checks if the user's phone number belongs to an admin, as cached with the session.
 
         Returns:
         bool: True if the user is an admin, False otherwise.
         """
-        return check_if_number_is_admin(from_number=self.user_number)
+        return self.session.is_admin
 
     def update_registration_status(self):
         """
-        Updates the user's registration status by checking the database again.
+        Updates the user's registration status from the session, which is read
+        again from the database once registration invalidates it.
         If the status has changed, the internal registration_status attribute
         is updated.
         """
@@ -86,7 +84,24 @@ class MessageStateManager:
         """
         Processes the user's action based on their current state and registration status.
         Handles transitions between states, returns appropriate responses, and
-        triggers any associated actions.
+        triggers any associated actions. The session is saved once the response is
+        ready, so the user's next message sees it in any API worker process.
+
+        Parameters:
+        user_action (str): The action or message sent by the user.
+
+        Returns:
+        str: The response message based on the user's current state and action.
+        """
+        try:
+            return self.handle_user_action(user_action=user_action)
+        finally:
+            self.session.flush()
+
+    def handle_user_action(self, user_action: str) -> str:
+        """
+        Works out the response to the user's action and applies its state transitions
+        to the session, without saving it.
 
         Parameters:
         user_action (str): The action or message sent by the user.
@@ -107,7 +122,7 @@ class MessageStateManager:
 
             # Do action response method
             return self.return_twilio_formatted_message(
-                msg=MESSAGE_STATES["unregistered_number"]["action_responses"][
+                msg=state_machine.get("unregistered_number").action_responses[
                     user_action
                 ]
             )
@@ -116,7 +131,11 @@ class MessageStateManager:
 
         # Unrecognized state will remain in the state manager when a user registers for the first time
         # But will not be part of the state when the user interacts after some time
-        check_if_unregistered_state_exists(from_number=self.user_number)
+        if (
+            self.session.stack_state
+            and self.session.stack_state[0] == "unregistered_number"
+        ):
+            self.session.pop_state()
         self.update_local_states()
         if user_action in self.base_greetings:
             self.set_current_state(tag="registered_number")
@@ -130,32 +149,33 @@ class MessageStateManager:
         # Check if action is valid for the current state
         if (
             self.current_state_tag is not None
-            and "input_request" not in self.current_state_tag
+            and not self.is_input_request_state()
             and user_action not in self.get_current_state_valid_actions()
         ):
             return self.get_unrecognized_state_response()
 
         # Validation for input state
-        if (
-            isinstance(self.current_state_tag, str)
-            and "input_request" in self.current_state_tag
-        ):
+        if self.is_input_request_state():
             flag, user_input = self.handle_input_state_validation(
                 user_input=user_action
             )
             if not flag:
                 # If false we want execution to stop, if true we want execution to carry on
-                msg = self.current_state["invalid_message"]
+                msg = (
+                    self.current_state.invalid_message
+                    or self.current_state.unrecognized_message
+                )
                 self.set_previous_state()  # Need to move back to state before
                 return self.return_twilio_formatted_message(msg=msg)
 
         # Check if we need to transfer state
         # Back is also a transerable state
-        if self.get_current_state_state_selections():  # We have to transfer state
+        state_selections = self.get_current_state_state_selections()
+        if state_selections:  # We have to transfer state
 
             # Check if selection is a back state selection
-            if user_action in self.current_state["state_selection"].keys():
-                if self.current_state["state_selection"][user_action] == "back_state":
+            if user_action in state_selections:
+                if state_selections[user_action] == BACK_STATE_TAG:
                     self.set_previous_state()
                     return self.get_current_state_message()
 
@@ -166,29 +186,27 @@ class MessageStateManager:
                         stokvel_selection=stokvel_selection
                     )
 
-                self.set_current_state(
-                    tag=self.current_state["state_selection"][user_action]
-                )
+                self.set_current_state(tag=state_selections[user_action])
                 return self.get_current_state_message()
 
         # If not transferable state check if it is an action response
 
-        if self.get_current_state_action_responses():
-            action_responses = self.get_current_state_action_responses()
-            if user_action in list(action_responses.keys()):
+        action_responses = self.get_current_state_action_responses()
+        if action_responses:
+            if user_action in action_responses:
                 msg = action_responses[user_action]
                 return self.return_twilio_formatted_message(msg=msg)
 
         # If not action reponse, check if action request
-        if self.get_current_state_action_requests():
-            action_requests = self.get_current_state_action_requests()
-            if user_action in list(action_requests.keys()):
+        action_requests = self.get_current_state_action_requests()
+        if action_requests:
+            if user_action in action_requests:
                 # Need to check if the action request has an input_state
                 input_action_states = self.get_current_state_input_action_states()
-                if user_action in list(input_action_states.keys()):
-                    input_action_states = input_action_states[user_action]
-                    self.set_current_state(tag=input_action_states["tag"])
-                    msg = input_action_states["message"]
+                if user_action in input_action_states:
+                    input_action_state = input_action_states[user_action]
+                    self.set_current_state(tag=input_action_state.tag)
+                    msg = input_action_state.message
                     return self.return_twilio_formatted_message(msg=msg)
 
                 # Need to check for dynamic state
@@ -207,11 +225,8 @@ class MessageStateManager:
                 )
                 return self.return_twilio_formatted_message(msg=msg)
 
-        if (
-            isinstance(self.current_state_tag, str)
-            and "input_request" in self.current_state_tag
-        ):
-            endpoint_action = self.current_state["action"]
+        if self.is_input_request_state():
+            endpoint_action = self.current_state.action
             self.set_previous_state()
             action_requests = self.get_current_state_action_requests()
             endpoint = action_requests[endpoint_action]
@@ -249,17 +264,17 @@ class MessageStateManager:
         list: The list of current stokvels.
         """
 
-        return self.current_state.get("current_stokvels", [])
+        return list(self.current_state.current_stokvels) if self.current_state else []
 
     def get_current_stokvel_selection(self):
         """
-        Retrieves the current stokvel selection from the DB.
+        Retrieves the current stokvel selection from the session.
 
         Returns:
         str: The current stokvel selection.
         """
 
-        return get_current_stokvel_selection(from_number=self.user_number)
+        return self.session.get_stokvel_selection()
 
     def set_current_stokvels_in_state(self, stokvel_selection: str):
         """
@@ -268,9 +283,7 @@ class MessageStateManager:
         Parameters:
         stokvel_selection (str): The list of current stokvels.
         """
-        set_current_stokvel_selection(
-            from_number=self.user_number, stokvel_selection=stokvel_selection
-        )
+        self.session.set_stokvel_selection(stokvel_selection=stokvel_selection)
 
     def get_current_state_message(self):
         """
@@ -280,36 +293,25 @@ class MessageStateManager:
         Returns:
         str: The formatted message for the current state.
         """
-        msg = self.current_state["message"]
-        return send_conversational_message(msg)
-
-    def _get_current_state_message_formatted(self):
-        """
-        Extracts and formats the message from the current state's schema.
-
-        Returns:
-        str: The formatted message for display.
-        """
-        message = self.current_state["message"].split(":")[1]
-        return message
+        msg = self.current_state.message
+        return self.return_twilio_formatted_message(msg=msg)
 
     def set_current_state(self, tag: str) -> None:
         """
-        Sets the current state of the user interaction in the database and
-        updates the local state attributes.
+        Pushes the current state of the user interaction onto the session's stack
+        and updates the local state attributes.
 
         Parameters:
         tag (str): The tag representing the new current state.
         """
-        # Need to set current state in the db
-        update_current_state(from_number=self.user_number, current_state_tag=tag)
+        self.session.push_state(tag=tag)
         self.update_local_states()
 
     def set_previous_state(self):
         """
         Pops the previous state from the stack and sets it as the current state.
         """
-        pop_previous_state(from_number=self.user_number)
+        self.session.pop_state()
         self.update_local_states()
 
     def get_unrecognized_state_response(self):
@@ -321,71 +323,91 @@ class MessageStateManager:
         str: The formatted unrecognized state message.
         """
         if self.current_state:
-            msg = self.unrecognized_state + self._get_current_state_message_formatted()
-            return send_conversational_message(msg)
+            msg = self.current_state.unrecognized_message
+            return self.return_twilio_formatted_message(msg=msg)
 
         msg = "Sorry, I don't understand. Please activate the service by sending 'Hi' or 'Hello'"
-        return send_conversational_message(msg)
+        return self.return_twilio_formatted_message(msg=msg)
+
+    def is_input_request_state(self) -> bool:
+        """
+        Checks if the current state collects free-form input from the user.
 
-    def get_current_state_valid_actions(self) -> List[str]:
+        Returns:
+        bool: True if the current state is an input request state, False otherwise.
+        """
+        return self.current_state is not None and self.current_state.is_input_request
+
+    def get_current_state_valid_actions(self) -> FrozenSet[str]:
         """
         Retrieves the valid actions for the current state.
 
         Returns:
-        List[str]: A list of valid actions for the current state.
+        FrozenSet[str]: The valid actions for the current state.
         """
-        return self.current_state.get("valid_actions", [])
+        return self.current_state.valid_actions if self.current_state else frozenset()
 
-    def get_current_state_action_responses(self) -> Optional[Dict]:
+    def get_current_state_action_responses(self) -> Mapping[str, str]:
         """
         Retrieves the action responses for the current state.
 
         Returns:
-        Optional[Dict]: A dictionary mapping actions to responses for the current state.
+        Mapping[str, str]: A mapping of actions to responses for the current state.
         """
-        return self.current_state.get("action_responses", {})
+        return (
+            self.current_state.action_responses if self.current_state else EMPTY_MAPPING
+        )
 
-    def get_current_state_action_requests(self) -> Optional[Dict]:
+    def get_current_state_action_requests(self) -> Mapping[str, str]:
         """
         Retrieves the action requests for the current state, which may trigger
         external API calls.
 
         Returns:
-        Optional[Dict]: A dictionary mapping actions to API endpoints for the current state.
+        Mapping[str, str]: A mapping of actions to API endpoints for the current state.
         """
-        return self.current_state.get("action_requests", {})
+        return (
+            self.current_state.action_requests if self.current_state else EMPTY_MAPPING
+        )
 
-    def get_current_state_input_action_states(self) -> Optional[Dict]:
+    def get_current_state_input_action_states(self) -> Mapping[str, CompiledState]:
         """
         Retrieves the input action states for the current state.
 
         Returns:
-        Optional[Dict]: A dictionary mapping actions to input states for the current state.
+        Mapping[str, CompiledState]: A mapping of actions to input states for the current state.
         """
-        return self.current_state.get("input_request_states", {})
+        return (
+            self.current_state.input_request_states
+            if self.current_state
+            else EMPTY_MAPPING
+        )
 
-    def get_current_state_state_selections(self) -> Optional[Dict]:
+    def get_current_state_state_selections(self) -> Mapping[str, str]:
         """
         Retrieves the state selections for the current state, allowing the user
         to transition between different states.
 
         Returns:
-        Optional[Dict]: A dictionary mapping user actions to new state tags.
+        Mapping[str, str]: A mapping of user actions to new state tags.
         """
-        return self.current_state.get("state_selection", {})
+        return (
+            self.current_state.state_selection if self.current_state else EMPTY_MAPPING
+        )
 
     def get_state_tags(self) -> Optional[str]:
         """
-        Retrieves the current and previous state tags from the database.
+        Retrieves the current state tag from the session.
 
         Returns:
-        Tuple: A tuple containing the current state tag and the previous state tag.
+        Optional[str]: The tag on top of the state stack, or None if it is empty.
         """
-        return get_state_responses(from_number=self.user_number)
+        return self.session.current_state_tag
 
     def return_twilio_formatted_message(self, msg: str) -> str:
         """
-        Formats a given message using Twilio's conversational messaging format.
+        Formats a given message using Twilio's conversational messaging format,
+        or leaves it as plain text if the manager does not reply with TwiML.
 
         Parameters:
         msg (str): The message to format.
@@ -393,44 +415,30 @@ class MessageStateManager:
         Returns:
         str: The formatted message for Twilio.
         """
+        if not self.twiml:
+            return msg
         return send_conversational_message(msg)
 
     def update_local_states(self) -> None:
         """
-        Updates the local current and previous state attributes by retrieving
-        the state tags from the database and navigating to the most nested sub-state.
+        Updates the local current state attributes by retrieving the current state tag
+        from the session and looking up its compiled state.
         """
         self.current_state_tag = self.get_state_tags()
 
         # Need to account for dynamic state - Dynamic state will be set within the state manager
         if self.current_state_tag != "my_stokvels":
-            # Initialize to an empty dictionary in case no state is found
-            retrieved_state = {}  # type: ignore
-
-            if self.current_state_tag is not None and ":" in self.current_state_tag:
-                sub_state_split = self.current_state_tag.split(":")
-                inital_state = MESSAGE_STATES  # Start with the base state dictionary
-
-                # Traverse through each sub-state to reach the most nested one
-                for state_tag in sub_state_split:
-                    retrieved_state = inital_state.get(state_tag, {})  # type: ignore
-                    if not retrieved_state:
-                        break  # Exit if a sub-state doesn't exist
-                    inital_state = retrieved_state  # Move deeper into the state
-            else:
-                # Handle the case where there are no sub-states
-                retrieved_state = MESSAGE_STATES.get(self.current_state_tag, {})  # type: ignore
-
-            # Set the current state based on whether the retrieval was successful
-            self.current_state = (
-                cast(StateSchema, retrieved_state) if retrieved_state else {}
-            )
+            self.current_state = state_machine.get(self.current_state_tag)
         else:
-            retrieved_state = self.execute_action_request(  # type: ignore
+            retrieved_state = self.execute_action_request(
                 endpoint="/stokvel/my_stokvels",
                 payload={"user_number": self.user_number},
             )
-            self.current_state = json.loads(retrieved_state) if retrieved_state else {}  # type: ignore
+            self.current_state = (
+                state_machine.compile_dynamic(json.loads(retrieved_state))  # type: ignore
+                if retrieved_state
+                else None
+            )
 
     def handle_input_state_validation(
         self, user_input: str
@@ -447,7 +455,7 @@ class MessageStateManager:
             and the second element is the validated input converted to the appropriate type,
             or None if the validation fails.
         """
-        valid_type = self.current_state.get("valid_type")
+        valid_type = self.current_state.valid_type if self.current_state else None
         try:
             if valid_type == float:
                 converted_input = float(user_input)
@@ -1,11 +1,69 @@
 import os
+import threading
+from typing import Dict, List
 
 from dotenv import load_dotenv
+from twilio.base.exceptions import TwilioRestException
 from twilio.rest import Client
 from twilio.twiml.messaging_response import MessagingResponse
 
 load_dotenv()
 
+# "twilio" sends through the Twilio API, "fake" records messages in a FakeTwilioSink
+TWILIO_SINK = os.getenv("TWILIO_SINK", "twilio")
+
+
+class FakeTwilioSink:
+    """
+    A stand-in for the Twilio REST client that records messages in memory instead of
+    sending them, for tests and local runs. It is used by every TwilioClient when
+    TWILIO_SINK is "fake", and `fail_next` makes sends fail to exercise retries.
+    """
+
+    def __init__(self) -> None:
+        self.sent: List[Dict[str, str]] = []
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def messages(self) -> "FakeTwilioSink":
+        """
+        Mirrors `Client.messages`, so `sink.messages.create(...)` records a message.
+        """
+        return self
+
+    def create(self, to: str, from_: str, body: str) -> None:
+        """
+        Records a message, or raises the TwilioRestException of an unavailable service
+        if a failure was requested with `fail_next`.
+        """
+        with self._lock:
+            if self._failures > 0:
+                self._failures -= 1
+                raise TwilioRestException(
+                    status=503, uri="/Messages", msg="Fake Twilio sink failure"
+                )
+            self.sent.append({"to": to, "from": from_, "body": body})
+        print(f"Fake Twilio message to {to}: {body}")
+
+    def fail_next(self, count: int = 1) -> None:
+        """
+        Makes the next `count` sends fail.
+        """
+        with self._lock:
+            self._failures = count
+
+    def clear(self) -> None:
+        """
+        Forgets the recorded messages and pending failures.
+        """
+        with self._lock:
+            self.sent = []
+            self._failures = 0
+
+
+fake_twilio_sink = FakeTwilioSink()
+
 
 class TwilioClient:
     """
@@ -17,10 +75,13 @@ class TwilioClient:
         """
         Initializes the Twilio client using credentials from environment variables.
         The credentials include the account SID, authentication token, and the
-        Twilio phone number from which messages will be sent.
+        Twilio phone number from which messages will be sent. With TWILIO_SINK set to
+        "fake", messages are recorded by `fake_twilio_sink` instead.
         """
-        self.client = Client(
-            os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN")
+        self.client = (
+            fake_twilio_sink
+            if TWILIO_SINK == "fake"
+            else Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
         )
         self.from_number = os.getenv("TWILIO_PHONE_NUMBER")
 
@@ -51,3 +112,12 @@ class TwilioClient:
         twiml = MessagingResponse()
         twiml.message(message)  # Create the TwiML message.
         return str(twiml)  # Return the entire TwiML response as a string.
+
+    def acknowledge_message(self) -> str:
+        """
+        Creates an empty TwiML response, which acknowledges a webhook without replying.
+
+        Returns:
+        str: The empty TwiML response as a string.
+        """
+        return str(MessagingResponse())
@@ -1,11 +1,19 @@
+import os
+from typing import List, Tuple
+
+from whatsapp_utils._utils.notification_outbox import notification_outbox
 from whatsapp_utils._utils.twilio_client import TwilioClient
 
+# "outbox" queues notifications for the background sender, "direct" sends them in the request
+NOTIFICATION_DELIVERY_MODE = os.getenv("NOTIFICATION_DELIVERY_MODE", "outbox")
+
 twilio_client = TwilioClient()
 
 
 def send_notification_message(to: str, body: str):
     """
-    Sends an SMS notification to the specified phone number.
+    Sends an SMS notification to the specified phone number. In outbox mode the message
+    is queued in NOTIFICATION_OUTBOX and sent in the background.
 
     Parameters:
     to (str): The recipient's phone number in E.164 format.
@@ -14,7 +22,27 @@ def send_notification_message(to: str, body: str):
     Returns:
     None
     """
-    twilio_client.send_mesage_notification(to, body)
+    if NOTIFICATION_DELIVERY_MODE == "outbox":
+        notification_outbox.enqueue(to, body)
+    else:
+        twilio_client.send_mesage_notification(to, body)
+
+
+def send_notification_messages(messages: List[Tuple[str, str]]):
+    """
+    Sends several SMS notifications. In outbox mode they are queued with a single INSERT.
+
+    Parameters:
+    messages (List[Tuple[str, str]]): The (to, body) of every notification.
+
+    Returns:
+    None
+    """
+    if NOTIFICATION_DELIVERY_MODE == "outbox":
+        notification_outbox.enqueue_many(messages)
+    else:
+        for to, body in messages:
+            twilio_client.send_mesage_notification(to, body)
 
 
 def send_conversational_message(message: str):
@@ -29,3 +57,14 @@ def send_conversational_message(message: str):
     response to Twilio's webhook for handling conversational interactions.
     """
     return twilio_client.send_conversational_message(message)
+
+
+def send_acknowledgement():
+    """
+    Acknowledges a WhatsApp message without replying, for messages whose reply is sent
+    later as a notification.
+
+    Returns:
+    str: An empty TwiML response.
+    """
+    return twilio_client.acknowledge_message()